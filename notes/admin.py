@@ -1,7 +1,7 @@
 # notes/admin.py
 from django.contrib import admin
 
-from .models import Note, StarRating, Comment, Department, Course, NoteCategory,NoteRequest, Faculty, Contributor
+from .models import Note, StarRating, Comment, Department, Course, NoteCategory,NoteRequest, Faculty, Contributor, NoteContent, NotificationOutbox, NoteBlob, UploadSession
 
 @admin.register(Faculty)
 class FacultyAdmin(admin.ModelAdmin):
@@ -44,17 +44,17 @@ class NoteAdmin(admin.ModelAdmin):
     )
     list_filter = ('category', 'department', 'faculty','course', 'semester', 'uploader', 'is_approved', 'created_at')
     search_fields = ('title', 'description', 'tags__name', 'uploader__username', 'category__name', 'course__name', 'department__name', 'faculty__name', 'semester' )
-    readonly_fields = ('average_rating', 'download_count', 'created_at', 'updated_at')
+    readonly_fields = ('average_rating', 'download_count', 'likes_count', 'bookmarks_count', 'comments_count', 'rating_count', 'file_hash', 'blob', 'original_filename', 'created_at', 'updated_at')
 
     fieldsets = (
         (None, {
-            'fields': ('title', 'uploader', 'description', 'file', 'is_approved')
+            'fields': ('title', 'uploader', 'description', 'file', 'original_filename', 'blob', 'file_hash', 'is_approved')
         }),
         ('Categorization', {
             'fields': ('category', 'faculty', 'course', 'department', 'semester', 'tags') 
         }),
         ('Analytics (Read-Only)', {
-            'fields': ('download_count', 'average_rating'),
+            'fields': ('download_count', 'average_rating', 'rating_count', 'likes_count', 'bookmarks_count', 'comments_count'),
             'classes': ('collapse',)
         }),
         ('Timestamps (Read-Only)', {
@@ -125,7 +125,7 @@ class NoteRequestAdmin(admin.ModelAdmin):
 class ContributorAdmin(admin.ModelAdmin):
     list_display = ('user', 'batch_with_section', 'note_contribution_count', 'average_star_rating', 'updated_at')
     search_fields = ('user__username', 'user__email', 'user__batch', 'user__section')
-    readonly_fields = ('user', 'note_contribution_count', 'average_star_rating', 'updated_at')
+    readonly_fields = ('user', 'note_contribution_count', 'average_star_rating', 'rating_sum', 'rating_count', 'updated_at')
 
     @admin.display(description='Batch & Section')
     def batch_with_section(self, obj):
@@ -136,4 +136,44 @@ class ContributorAdmin(admin.ModelAdmin):
             return user.batch
         return "N/A"
     def has_add_permission(self, request):
-        return False
\ No newline at end of file
+        return False
+
+@admin.register(NoteContent)
+class NoteContentAdmin(admin.ModelAdmin):
+    list_display = ('file_hash', 'status', 'extractor', 'page_count', 'updated_at')
+    list_filter = ('status', 'extractor')
+    search_fields = ('file_hash',)
+    readonly_fields = ('file_hash', 'text', 'page_offsets', 'page_count', 'extractor', 'status', 'error', 'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(NoteBlob)
+class NoteBlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'size', 'ref_count', 'created_at')
+    search_fields = ('sha256',)
+    readonly_fields = ('sha256', 'file', 'size', 'ref_count', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'notification', 'group', 'attempts', 'next_attempt_at', 'claimed_until', 'failed_at', 'created_at')
+    search_fields = ('group',)
+    readonly_fields = ('notification', 'group', 'payload', 'attempts', 'next_attempt_at', 'last_error', 'claimed_by', 'claimed_until', 'failed_at', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'user', 'received', 'size', 'updated_at', 'expires_at')
+    search_fields = ('filename', 'user__username')
+    readonly_fields = ('id', 'user', 'filename', 'size', 'chunk_size', 'sha256', 'received', 'created_at', 'updated_at', 'expires_at')
+
+    def has_add_permission(self, request):
+        return False
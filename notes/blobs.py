@@ -0,0 +1,161 @@
+# notes/blobs.py
+"""
+Content-addressed storage for note files.
+
+Every upload is stored once per SHA-256 as a NoteBlob; notes with the same
+content point at the same blob and Note.file names the blob's file. The hash
+is computed while the upload streams to disk (notes.uploads), so storing a
+duplicate costs no extra read, and a client that already knows the hash can
+skip the transfer entirely (NoteViewSet.check_upload + `file_sha256`).
+
+Reference counts are kept by the Note save/delete signals: a blob whose count
+drops to zero is deleted together with its file once the transaction commits.
+
+A blob file is written before its row, so a transaction that rolls back
+leaves the file behind. The next upload of that content reuses it once its
+hash checks out, and gc_upload_sessions deletes files no blob names.
+"""
+
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, ProtectedError, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Note, NoteBlob
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+BLOB_DIR = 'notes/blobs'
+# Younger files may belong to an upload whose transaction hasn't committed yet.
+ORPHAN_GRACE_PERIOD = timedelta(hours=1)
+
+
+def blob_name(sha256, filename):
+    extension = os.path.splitext(filename)[1].lower()[:16]
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256}{extension}'
+
+
+def blob_storage():
+    return NoteBlob._meta.get_field('file').storage
+
+
+def upload_sha256(upload):
+    """The hash computed by the upload handler, or one computed now for files from elsewhere."""
+    sha256 = getattr(upload, 'sha256', None)
+    if sha256:
+        return sha256
+    digest = hashlib.sha256()
+    for chunk in upload.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def stored_sha256(storage, name):
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as f:
+        for chunk in f.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_or_store_blob(upload, sha256=None):
+    """Returns (blob, created) for an uploaded file, writing it to storage only if its content is new."""
+    sha256 = sha256 or upload_sha256(upload)
+    blob = NoteBlob.objects.filter(sha256=sha256).first()
+    if blob is not None:
+        return blob, False
+
+    storage = blob_storage()
+    name = blob_name(sha256, upload.name)
+    stored = not (storage.exists(name) and stored_sha256(storage, name) == sha256)
+    if stored:
+        # Temporary uploads are moved into place rather than copied.
+        name = storage.save(name, upload)
+    else:
+        logger.info(f"Reusing blob file {name} left without a row.")
+    try:
+        with transaction.atomic():
+            blob = NoteBlob.objects.create(sha256=sha256, file=name, size=upload.size)
+    except IntegrityError:
+        # A concurrent upload of the same content got there first.
+        if stored:
+            storage.delete(name)
+        return NoteBlob.objects.get(sha256=sha256), False
+    return blob, True
+
+
+def attach_blob(note, blob, filename=None):
+    note.blob = blob
+    note.file = blob.file.name
+    note.file_hash = blob.sha256
+    note.original_filename = os.path.basename(filename or note.original_filename or blob.file.name)[:255]
+
+
+def attach_upload(note, upload):
+    """Points `note` at the blob for `upload`, storing the upload if its content is new."""
+    blob, created = get_or_store_blob(upload)
+    if not created:
+        logger.info(f"Upload {upload.name!r} matches stored blob {blob.sha256[:12]}; not stored again.")
+    attach_blob(note, blob, upload.name)
+
+
+def acquire_blob(blob_id):
+    NoteBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') + 1)
+
+
+def release_blob(blob_id):
+    NoteBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    delete_unreferenced_blobs([blob_id])
+
+
+def delete_unreferenced_blobs(blob_ids=None):
+    """Deletes blobs with no references (all of them when `blob_ids` is None); their files go after commit."""
+    blobs = NoteBlob.objects.filter(ref_count=0)
+    if blob_ids is not None:
+        blobs = blobs.filter(pk__in=blob_ids)
+    deleted = 0
+    for blob in blobs:
+        try:
+            with transaction.atomic():
+                blob.delete()
+        except ProtectedError:
+            # A note still points at it; the count was off, not the blob.
+            continue
+        transaction.on_commit(partial(blob_storage().delete, blob.file.name))
+        deleted += 1
+    return deleted
+
+
+def recount_blob_references():
+    """Recomputes every ref_count from the notes table in one UPDATE; returns the number of rows updated."""
+    counts = Note.objects.filter(blob=OuterRef('pk')).order_by().values('blob').annotate(n=Count('pk')).values('n')
+    return NoteBlob.objects.update(ref_count=Coalesce(Subquery(counts), 0))
+
+
+def delete_orphaned_blob_files(now=None, dry_run=False):
+    """
+    Deletes files under the blob directory that no NoteBlob names (left by
+    uploads whose transaction rolled back). Returns the number of files.
+    """
+    storage = blob_storage()
+    if not storage.exists(BLOB_DIR):
+        return 0
+    cutoff = (now or timezone.now()) - ORPHAN_GRACE_PERIOD
+    referenced = set(NoteBlob.objects.values_list('file', flat=True))
+    orphans = 0
+    for directory in storage.listdir(BLOB_DIR)[0]:
+        for file_name in storage.listdir(f'{BLOB_DIR}/{directory}')[1]:
+            name = f'{BLOB_DIR}/{directory}/{file_name}'
+            if name in referenced or storage.get_modified_time(name) >= cutoff:
+                continue
+            orphans += 1
+            if not dry_run:
+                storage.delete(name)
+    return orphans
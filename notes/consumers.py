@@ -1,14 +1,18 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
+from .outbox import ensure_asgi_dispatcher
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.group_name = 'notifications_group'
-        # Accept regardless to avoid crashing when no layer
-        await self.accept()
+        # Accept regardless to avoid crashing when no layer. Clients that sent
+        # their JWT as a subprotocol expect it echoed back (notes.ws_auth).
+        await self.accept(subprotocol=self.scope.get('jwt_subprotocol'))
 
         if not self.channel_layer:
             return
+        # Notifications reach the channel layer through the outbox (notes.outbox).
+        ensure_asgi_dispatcher()
 
         # Join global notifications group
         await self.channel_layer.group_add(
@@ -0,0 +1,117 @@
+# notes/content_reader.py
+"""
+Bounded reads for the note content endpoint.
+
+Text and code files are read through mmap. A sparse line index (the byte
+offset of every INDEX_STRIDE-th line) is built once per file version and kept
+in a small LRU, so any slice of lines costs at most INDEX_STRIDE newline scans
+plus the slice itself, no matter how large the file is. Extracted documents
+are paged out of NoteContent with a database-side substring.
+"""
+
+import mmap
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.db.models.functions import Substr
+
+from .extraction import decode_text
+
+INDEX_STRIDE = 256
+INDEX_CACHE_SIZE = 64
+
+LineIndex = namedtuple('LineIndex', ['offsets', 'total_lines'])
+LineSlice = namedtuple('LineSlice', ['text', 'offset', 'line_count', 'total_lines', 'truncated'])
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def build_line_index(buffer, size, stride=INDEX_STRIDE):
+    offsets = [0]
+    lines = 0
+    position = 0
+    while True:
+        newline = buffer.find(b'\n', position)
+        if newline == -1:
+            break
+        lines += 1
+        position = newline + 1
+        if lines % stride == 0:
+            offsets.append(position)
+    if position < size:
+        lines += 1  # last line without a trailing newline
+    return LineIndex(offsets, lines)
+
+
+def get_line_index(path, buffer, stat):
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    index = build_line_index(buffer, stat.st_size)
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def _skip_lines(buffer, position, count, size):
+    for _ in range(count):
+        newline = buffer.find(b'\n', position)
+        if newline == -1:
+            return size
+        position = newline + 1
+    return position
+
+
+def read_lines(path, offset, limit, max_bytes):
+    """
+    Returns `limit` lines starting at 0-based line `offset`, never more than
+    `max_bytes` bytes (a longer slice is cut and flagged `truncated`).
+    """
+    stat = os.stat(path)
+    if stat.st_size == 0:
+        return LineSlice('', offset, 0, 0, False)
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        size = stat.st_size
+        index = get_line_index(path, buffer, stat)
+        if offset >= index.total_lines:
+            return LineSlice('', offset, 0, index.total_lines, False)
+
+        start = _skip_lines(buffer, index.offsets[offset // INDEX_STRIDE], offset % INDEX_STRIDE, size)
+        end = _skip_lines(buffer, start, limit, size)
+        line_count = min(limit, index.total_lines - offset)
+
+        truncated = end - start > max_bytes
+        if truncated:
+            # Cut at the last whole line that fits; a single line longer than
+            # max_bytes is cut mid-line and counted as returned.
+            cut = buffer.rfind(b'\n', start, start + max_bytes)
+            if cut == -1:
+                text = buffer[start:start + max_bytes].decode('utf-8', errors='ignore')
+                return LineSlice(text, offset, 1, index.total_lines, True)
+            end = cut + 1
+            line_count = buffer[start:end].count(b'\n')
+        text = decode_text(buffer[start:end])
+        return LineSlice(text, offset, line_count, index.total_lines, truncated)
+
+
+def read_document_page(content, number, max_chars):
+    """
+    Returns (text, truncated) for 1-based page `number` of a NoteContent row,
+    fetching only that page's characters from the database.
+    """
+    start, end = content.page_bounds(number)
+    length = max_chars + 1 if end is None else min(end - start, max_chars + 1)
+    if length <= 0:
+        return '', False
+    text = type(content).objects.filter(pk=content.pk).annotate(
+        page_text=Substr('text', start + 1, length)
+    ).values_list('page_text', flat=True).get() or ''
+    return text[:max_chars], len(text) > max_chars
@@ -0,0 +1,105 @@
+# notes/content_store.py
+"""
+Background extraction of note text into NoteContent.
+
+Uploads (and replaced files) are queued once the saving transaction commits.
+Extraction runs in a process pool so large PDFs never block a request or the
+GIL; the result is stored from the pool's callback thread. Set
+NOTE_EXTRACTION_EAGER to extract inline instead (handy for tests and scripts).
+"""
+
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .extraction import process_file
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.NOTE_EXTRACTION_WORKERS)
+        return _executor
+
+
+def schedule_extraction(note_id):
+    """Extracts the note's file after the current transaction commits."""
+    transaction.on_commit(partial(_submit, note_id))
+
+
+def _submit(note_id):
+    from .models import Note, NoteContent
+
+    note = Note.objects.filter(pk=note_id).only('id', 'file', 'file_hash').first()
+    if note is None or not note.file:
+        return
+    if note.file_hash and NoteContent.objects.filter(file_hash=note.file_hash).exists():
+        # A deduplicated upload (notes.blobs): its text was extracted already.
+        return
+    path = note.file.path
+
+    if settings.NOTE_EXTRACTION_EAGER:
+        store_extraction_result(note_id, process_file(path))
+        return
+
+    with _executor_lock:
+        if (note_id, path) in _in_flight:
+            return
+        _in_flight.add((note_id, path))
+    try:
+        future = get_executor().submit(process_file, path)
+    except Exception as e:
+        _in_flight.discard((note_id, path))
+        logger.error(f"Could not queue text extraction for note {note_id}: {e}")
+        return
+    future.add_done_callback(partial(_extraction_done, note_id, path))
+
+
+def _extraction_done(note_id, path, future):
+    _in_flight.discard((note_id, path))
+    try:
+        store_extraction_result(note_id, future.result())
+    except Exception as e:
+        logger.error(f"Text extraction failed for note {note_id}: {e}", exc_info=True)
+    finally:
+        # The callback runs on the pool's management thread, which owns its
+        # own database connection.
+        connection.close()
+
+
+def store_extraction_result(note_id, result):
+    """Saves a process_file() result and links the note to it by hash."""
+    from .models import Note, NoteContent
+
+    file_hash = result['file_hash']
+    if result['status'] != 'known':
+        text = result.get('text', '')
+        page_offsets = result.get('page_offsets', [])
+        NoteContent.objects.update_or_create(
+            file_hash=file_hash,
+            defaults={
+                'text': text,
+                'page_offsets': page_offsets,
+                'page_count': len(page_offsets),
+                'extractor': result.get('extractor', ''),
+                'status': result['status'].upper(),
+                'error': result['error'],
+            },
+        )
+    # update() keeps this out of the Note post_save handlers.
+    Note.objects.filter(pk=note_id).update(file_hash=file_hash)
+    if result['status'] in ('ready', 'known'):
+        logger.info(f"Stored extracted content for note {note_id} ({file_hash[:12]}).")
+    else:
+        logger.warning(f"No text extracted for note {note_id}: {result['error']}")
@@ -0,0 +1,176 @@
+# notes/contributors.py
+"""
+Incremental Contributor profiles.
+
+Signal handlers describe each change as deltas to a user's approved note
+count and rating totals via queue_contributor_update(). Inside a transaction
+each delta set is registered with on_commit, so a rolled-back savepoint
+drops exactly the deltas queued inside it; after commit the surviving sets
+are merged per user and written with one UPDATE per user, so deleting a note
+together with all of its ratings touches the uploader's profile once.
+Outside a transaction they are written immediately.
+A user without a profile row gets one rebuilt from the note counters.
+
+rebuild_all_contributors() recomputes every profile from the ratings table in
+one set-based pass (update_contributors --rebuild).
+"""
+
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf, Round
+from django.utils import timezone
+from .models import Contributor, Note
+from .utils import commit_batch, move_batch_last
+
+DELTA_FIELDS = ('note_contribution_count', 'rating_sum', 'rating_count')
+
+
+class _PendingUpdates:
+    """
+    Deltas of one transaction. Each delta set reaches it through its own
+    on_commit callback (add); the batch itself runs after them to write.
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: dict.fromkeys(DELTA_FIELDS, 0))
+
+    def add(self, user_id, deltas):
+        for field, delta in deltas.items():
+            self.deltas[user_id][field] += delta
+
+    def __call__(self):
+        for user_id, deltas in self.deltas.items():
+            apply_contributor_deltas(user_id, deltas)
+
+
+def queue_contributor_update(user_id, **deltas):
+    """
+    Queues deltas for a user's profile, e.g. note_contribution_count=1 when a
+    note is approved. Written once the surrounding transaction commits.
+    """
+    for field in deltas:
+        if field not in DELTA_FIELDS:
+            raise ValueError(f"Unknown contributor field: {field}")
+    if not user_id or not any(deltas.values()):
+        return
+    pending = commit_batch(_PendingUpdates)
+    if pending is None:
+        apply_contributor_deltas(user_id, deltas)
+        return
+    transaction.on_commit(partial(pending.add, user_id, deltas))
+    move_batch_last(_PendingUpdates)
+
+
+def _shifted(field, delta):
+    if not delta:
+        return F(field)
+    if delta < 0:
+        return Greatest(F(field) + delta, Value(0))
+    return F(field) + delta
+
+
+def apply_contributor_deltas(user_id, deltas):
+    """Applies deltas and the derived average in a single UPDATE."""
+    updates = {field: _shifted(field, delta) for field, delta in deltas.items() if delta}
+    if not updates:
+        return
+    new_sum = _shifted('rating_sum', deltas.get('rating_sum', 0))
+    new_count = _shifted('rating_count', deltas.get('rating_count', 0))
+    updates['average_star_rating'] = Coalesce(
+        Round(Cast(new_sum, FloatField()) / NullIf(new_count, 0), 2),
+        Value(0.0),
+        output_field=FloatField(),
+    )
+
+    if not Contributor.objects.filter(user_id=user_id).update(**updates):
+        rebuild_contributor(user_id)
+    elif deltas.get('note_contribution_count', 0) < 0:
+        Contributor.objects.filter(user_id=user_id, note_contribution_count=0).delete()
+
+
+def rebuild_contributor(user_id):
+    """Recomputes one profile from the user's approved notes; deletes it if there are none."""
+    totals = Note.objects.filter(uploader_id=user_id, is_approved=True).aggregate(
+        notes=Count('pk'), stars=Sum('rating_sum'), ratings=Sum('rating_count'),
+    )
+    if not totals['notes']:
+        Contributor.objects.filter(user_id=user_id).delete()
+        return None
+
+    rating_sum = totals['stars'] or 0
+    rating_count = totals['ratings'] or 0
+    contributor, _created = Contributor.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'note_contribution_count': totals['notes'],
+            'rating_sum': rating_sum,
+            'rating_count': rating_count,
+            'average_star_rating': round(rating_sum / rating_count, 2) if rating_count else 0.0,
+        },
+    )
+    return contributor
+
+
+def contributor_totals():
+    """One GROUP BY over approved notes and their ratings, per uploader."""
+    return Note.objects.filter(is_approved=True, uploader__isnull=False).order_by().values('uploader').annotate(
+        notes=Count('pk', distinct=True),
+        stars=Coalesce(Sum('star_ratings__stars'), 0),
+        ratings=Count('star_ratings'),
+    )
+
+
+def rebuild_all_contributors(batch_size=500, dry_run=False):
+    """
+    Recomputes every profile from contributor_totals(), writing only rows that
+    changed with chunked bulk_update/bulk_create, and deletes profiles of
+    users with no approved notes in one statement. Returns a summary of
+    created/updated/unchanged/deleted counts.
+    """
+    fields = ('note_contribution_count', 'rating_sum', 'rating_count', 'average_star_rating')
+    existing = {
+        row[0]: row[1:]
+        for row in Contributor.objects.values_list('user_id', 'pk', *fields).iterator(chunk_size=batch_size)
+    }
+    summary = {'created': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+    now = timezone.now()
+    to_create, to_update = [], []
+
+    with transaction.atomic():
+        for row in contributor_totals().iterator(chunk_size=batch_size):
+            values = (
+                row['notes'], row['stars'], row['ratings'],
+                round(row['stars'] / row['ratings'], 2) if row['ratings'] else 0.0,
+            )
+            current = existing.get(row['uploader'])
+            if current is None:
+                summary['created'] += 1
+                if not dry_run:
+                    to_create.append(Contributor(user_id=row['uploader'], **dict(zip(fields, values))))
+            elif tuple(current[1:]) != values:
+                summary['updated'] += 1
+                if not dry_run:
+                    to_update.append(Contributor(pk=current[0], updated_at=now, **dict(zip(fields, values))))
+            else:
+                summary['unchanged'] += 1
+
+            if len(to_create) >= batch_size:
+                Contributor.objects.bulk_create(to_create, batch_size=batch_size)
+                to_create = []
+            if len(to_update) >= batch_size:
+                Contributor.objects.bulk_update(to_update, fields + ('updated_at',), batch_size=batch_size)
+                to_update = []
+
+        stale = Contributor.objects.exclude(
+            user_id__in=Note.objects.filter(is_approved=True, uploader__isnull=False).values('uploader')
+        )
+        if dry_run:
+            summary['deleted'] = stale.count()
+        else:
+            Contributor.objects.bulk_create(to_create, batch_size=batch_size)
+            Contributor.objects.bulk_update(to_update, fields + ('updated_at',), batch_size=batch_size)
+            summary['deleted'], _per_model = stale.delete()
+    return summary
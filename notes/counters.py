@@ -0,0 +1,71 @@
+# notes/counters.py
+
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf, Round
+from .models import Note, Like, Bookmark, Comment, StarRating
+
+COUNTER_FIELDS = ('likes_count', 'bookmarks_count', 'comments_count', 'rating_sum', 'rating_count')
+# Columns only ever written with F() updates (here and in notes.download_counter).
+# Full Note saves leave them out, so values loaded before a concurrent like,
+# rating or download are never written back.
+IN_PLACE_FIELDS = frozenset({*COUNTER_FIELDS, 'average_rating', 'download_count'})
+
+
+def adjust_note_counters(note_id, **deltas):
+    """
+    Applies counter deltas to a note in a single UPDATE using F() expressions,
+    e.g. adjust_note_counters(note.pk, likes_count=1). Decrements are clamped
+    at zero. average_rating is recomputed (to 2 decimals) in the same statement
+    whenever the rating totals change.
+    """
+    updates = {}
+    for field, delta in deltas.items():
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f"Unknown note counter: {field}")
+        if delta:
+            updates[field] = _shifted(field, delta)
+
+    if 'rating_sum' in updates or 'rating_count' in updates:
+        new_sum = _shifted('rating_sum', deltas.get('rating_sum', 0))
+        new_count = _shifted('rating_count', deltas.get('rating_count', 0))
+        updates['average_rating'] = Coalesce(
+            Round(Cast(new_sum, FloatField()) / NullIf(new_count, 0), 2),
+            Value(0.0),
+            output_field=FloatField(),
+        )
+
+    if updates:
+        Note.objects.filter(pk=note_id).update(**updates)
+
+
+def _shifted(field, delta):
+    if not delta:
+        return F(field)
+    if delta < 0:
+        return Greatest(F(field) + delta, Value(0))
+    return F(field) + delta
+
+
+def _per_note(model, aggregate):
+    subquery = model.objects.filter(note=OuterRef('pk')).order_by().values('note').annotate(value=aggregate).values('value')
+    return Coalesce(Subquery(subquery), Value(0), output_field=IntegerField())
+
+
+def notes_with_counter_drift(queryset=None):
+    """
+    Annotates each note with the counter values recomputed from the child
+    tables (actual_<field>) and returns only the notes whose stored counters
+    disagree.
+    """
+    queryset = Note.objects.all() if queryset is None else queryset
+    queryset = queryset.annotate(
+        actual_likes_count=_per_note(Like, Count('pk')),
+        actual_bookmarks_count=_per_note(Bookmark, Count('pk')),
+        actual_comments_count=_per_note(Comment, Count('pk')),
+        actual_rating_sum=_per_note(StarRating, Sum('stars')),
+        actual_rating_count=_per_note(StarRating, Count('pk')),
+    )
+    drift = Q()
+    for field in COUNTER_FIELDS:
+        drift |= ~Q(**{field: F(f'actual_{field}')})
+    return queryset.filter(drift).only('pk', *COUNTER_FIELDS, 'average_rating')
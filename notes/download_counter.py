@@ -0,0 +1,131 @@
+# notes/download_counter.py
+"""
+Buffered download counting.
+
+Downloads only bump an in-process counter; the buffer is written to
+notes_note in one `UPDATE ... SET download_count = download_count + CASE id
+... END` per batch when NOTE_DOWNLOAD_FLUSH_THRESHOLD downloads have piled up
+or NOTE_DOWNLOAD_FLUSH_INTERVAL seconds after the first unflushed download,
+whichever comes first. Pending counts are flushed again at interpreter exit,
+and a failed flush puts them back and retries after another interval.
+
+The buffer lives in process memory only: a worker that is killed without a
+clean exit (SIGKILL, OOM) loses the downloads counted since its last flush,
+at most NOTE_DOWNLOAD_FLUSH_THRESHOLD downloads or NOTE_DOWNLOAD_FLUSH_INTERVAL
+seconds' worth. It is also not shared between workers: the live count
+record_download() returns includes only the calling process's unflushed
+downloads, so two workers can report different counts until both have
+flushed. With NOTE_DOWNLOAD_BUFFERING disabled every download is written
+immediately.
+"""
+
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from users.stats import add_downloads_received
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+
+
+class DownloadCounterBuffer:
+    def __init__(self):
+        self._pending = defaultdict(int)
+        self._total = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def increment(self, note_id):
+        """Records one download and returns the number still pending for the note."""
+        with self._lock:
+            self._pending[note_id] += 1
+            self._total += 1
+            pending = self._pending[note_id]
+            flush_now = self._total >= settings.NOTE_DOWNLOAD_FLUSH_THRESHOLD
+            if not flush_now:
+                self._schedule()
+        if flush_now:
+            self.flush()
+        return pending
+
+    def pending_for(self, note_id):
+        with self._lock:
+            return self._pending.get(note_id, 0)
+
+    def flush(self):
+        """Writes all pending increments; returns the number of notes updated."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._total = 0
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+        try:
+            write_download_counts(pending)
+        except Exception as e:
+            logger.error(f"Failed to flush {sum(pending.values())} buffered downloads: {e}", exc_info=True)
+            with self._lock:
+                for note_id, count in pending.items():
+                    self._pending[note_id] += count
+                    self._total += count
+                # Nothing else may arrive to trigger the next attempt.
+                self._schedule()
+            return 0
+        return len(pending)
+
+    def _schedule(self):
+        # Called with the lock held.
+        if self._timer is None:
+            self._timer = threading.Timer(settings.NOTE_DOWNLOAD_FLUSH_INTERVAL, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own connection.
+            connection.close()
+
+
+def write_download_counts(counts):
+    """Adds `counts` ({note_id: n}) to download_count in CASE batches."""
+    from .models import Note
+
+    items = sorted(counts.items())
+    for start in range(0, len(items), FLUSH_BATCH_SIZE):
+        batch = items[start:start + FLUSH_BATCH_SIZE]
+        increment = Case(
+            *[When(pk=note_id, then=Value(count)) for note_id, count in batch],
+            default=Value(0),
+            output_field=PositiveIntegerField(),
+        )
+        Note.objects.filter(pk__in=[note_id for note_id, _ in batch]).update(
+            download_count=F('download_count') + increment
+        )
+    add_downloads_received(counts)
+
+
+download_buffer = DownloadCounterBuffer()
+atexit.register(download_buffer.flush)
+
+
+def record_download(note):
+    """
+    Counts one download of `note` and returns the approximate live count: the
+    value loaded with the note plus this process's unflushed downloads.
+    """
+    if not settings.NOTE_DOWNLOAD_BUFFERING:
+        write_download_counts({note.pk: 1})
+        return note.download_count + 1
+    return note.download_count + download_buffer.increment(note.pk)
@@ -0,0 +1,154 @@
+# notes/extraction.py
+"""
+Text extraction for uploaded note files.
+
+Everything here is plain Python with no Django imports so it can run inside
+worker processes; notes.content_store takes care of scheduling and of storing
+the results.
+"""
+
+import hashlib
+import os
+import zipfile
+from xml.etree import ElementTree
+
+TEXT_EXTENSIONS = ['.txt', '.md', '.json', '.xml', '.csv', '.log', '.ini', '.conf', '.cfg']
+CODE_EXTENSIONS = ['.js', '.jsx', '.ts', '.tsx', '.html', '.css', '.scss', '.sass', '.less', '.php', '.py', '.java', '.cpp', '.c', '.cs', '.rb', '.go', '.rs', '.swift', '.kt', '.dart', '.r', '.sql', '.sh', '.bat', '.ps1', '.yaml', '.yml', '.toml', '.env']
+DOCUMENT_EXTENSIONS = ['.docx']
+PDF_EXTENSIONS = ['.pdf']
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+class UnsupportedFileType(Exception):
+    pass
+
+
+def file_type_for(file_name):
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in TEXT_EXTENSIONS:
+        return 'text'
+    if extension in CODE_EXTENSIONS:
+        return 'code'
+    if extension in ('.doc', '.docx'):
+        return 'document'
+    if extension in PDF_EXTENSIONS:
+        return 'pdf'
+    return 'other'
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def decode_text(data):
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def extract_plain_text(path):
+    """
+    Text and code files are paged straight from disk by notes.content_reader,
+    so nothing is copied into the content store; only their hash is recorded.
+    """
+    return '', []
+
+
+def extract_docx(path):
+    """
+    Reads word/document.xml directly. Explicit page breaks and Word's
+    lastRenderedPageBreak markers are used as page boundaries.
+    """
+    pages = [[]]
+    paragraph = []
+    with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as document:
+        for event, element in ElementTree.iterparse(document, events=('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == f'{WORD_NAMESPACE}lastRenderedPageBreak' or (
+                    tag == f'{WORD_NAMESPACE}br' and element.get(f'{WORD_NAMESPACE}type') == 'page'
+                ):
+                    pages[-1].append(''.join(paragraph))
+                    paragraph = []
+                    pages.append([])
+                continue
+            if tag == f'{WORD_NAMESPACE}t':
+                paragraph.append(element.text or '')
+            elif tag == f'{WORD_NAMESPACE}tab':
+                paragraph.append('\t')
+            elif tag == f'{WORD_NAMESPACE}p':
+                pages[-1].append(''.join(paragraph))
+                paragraph = []
+                element.clear()
+    if paragraph:
+        pages[-1].append(''.join(paragraph))
+    return _join_pages(['\n'.join(lines).strip('\n') for lines in pages])
+
+
+def extract_pdf(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise UnsupportedFileType("PDF extraction requires the 'pypdf' package.")
+    reader = PdfReader(path)
+    return _join_pages([page.extract_text() or '' for page in reader.pages])
+
+
+def _join_pages(pages):
+    """Returns (text, page_offsets) where page_offsets[i] is the start of page i."""
+    offsets = []
+    parts = []
+    position = 0
+    for index, page in enumerate(pages):
+        if index:
+            parts.append('\n')
+            position += 1
+        offsets.append(position)
+        parts.append(page)
+        position += len(page)
+    return ''.join(parts), offsets
+
+
+EXTRACTORS = [
+    (TEXT_EXTENSIONS + CODE_EXTENSIONS, 'plain', extract_plain_text),
+    (DOCUMENT_EXTENSIONS, 'docx', extract_docx),
+    (PDF_EXTENSIONS, 'pypdf', extract_pdf),
+]
+
+
+def extract_text(path):
+    extension = os.path.splitext(path)[1].lower()
+    for extensions, name, extractor in EXTRACTORS:
+        if extension in extensions:
+            text, page_offsets = extractor(path)
+            return text, page_offsets, name
+    raise UnsupportedFileType(f"Text extraction is not supported for {extension or 'this'} files.")
+
+
+def process_file(path, known_hashes=()):
+    """
+    Worker entry point: hashes the file and extracts its text. Extraction is
+    skipped when the hash is already in `known_hashes`. Returns a plain dict
+    so it can cross process boundaries.
+    """
+    result = {'path': path, 'file_hash': hash_file(path), 'status': 'ready', 'error': ''}
+    if result['file_hash'] in known_hashes:
+        result['status'] = 'known'
+        return result
+    try:
+        result['text'], result['page_offsets'], result['extractor'] = extract_text(path)
+    except UnsupportedFileType as e:
+        result['status'] = 'unsupported'
+        result['error'] = str(e)
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
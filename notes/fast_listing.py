@@ -0,0 +1,141 @@
+# notes/fast_listing.py
+"""
+Serializer-free read path for note list pages.
+
+NoteSummarySerializer resolves every field through DRF's field machinery and
+the select_related model instances, and reverse()s the download URL for each
+row. For list pages without ?expand= NoteViewSet reads the same columns with
+one .values_list() query instead and builds the dicts from the precompiled
+LIST_FIELDS plan below: one tuple index per field, a per-request URL template
+and one query for the page's tags.
+
+The output must stay byte-for-byte identical to NoteSummarySerializer's
+(NoteFastListingParityTests); a field added to the serializer has to be added
+to LIST_FIELDS in the same position. NOTE_FAST_LISTING=False switches back to
+the serializer. `python manage.py bench_note_listing` compares the two.
+"""
+
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+from .models import Note
+
+# Field kinds
+PLAIN = 'plain'
+OMIT_IF_NULL = 'omit'  # DRF skips a non-nullable field whose related object is missing
+DATETIME = 'datetime'
+FILE_URL = 'file_url'
+FILE_NAME = 'file_name'
+TAGS = 'tags'
+
+# NoteSummarySerializer's readable fields, in its output order: (name, .values() lookup, kind)
+LIST_FIELDS = (
+    ('id', 'id', PLAIN),
+    ('uploader_username', 'uploader__username', PLAIN),
+    ('uploader_first_name', 'uploader__first_name', PLAIN),
+    ('uploader_last_name', 'uploader__last_name', PLAIN),
+    ('uploader_student_id', 'uploader__student_id', PLAIN),
+    ('uploader_department', 'uploader__department__name', PLAIN),
+    ('title', 'title', PLAIN),
+    ('description', 'description', PLAIN),
+    ('file_url', 'file', FILE_URL),
+    ('file_name', 'file', FILE_NAME),
+    ('faculty', 'faculty', PLAIN),
+    ('faculty_name', 'faculty__name', PLAIN),
+    ('course', 'course', PLAIN),
+    ('category', 'category', PLAIN),
+    ('category_name', 'category__name', PLAIN),
+    ('department', 'department', PLAIN),
+    ('course_name', 'course__name', OMIT_IF_NULL),
+    ('department_name', 'department__name', OMIT_IF_NULL),
+    ('semester', 'semester', PLAIN),
+    ('tags', 'id', TAGS),
+    ('is_approved', 'is_approved', PLAIN),
+    ('download_count', 'download_count', PLAIN),
+    ('average_rating', 'average_rating', PLAIN),
+    ('likes_count', 'likes_count', PLAIN),
+    ('is_liked_by_current_user', 'is_liked_by_current_user_annotated', PLAIN),
+    ('bookmarks_count', 'bookmarks_count', PLAIN),
+    ('is_bookmarked_by_current_user', 'is_bookmarked_by_current_user_annotated', PLAIN),
+    ('created_at', 'created_at', DATETIME),
+    ('updated_at', 'updated_at', DATETIME),
+    ('comments_count', 'comments_count', PLAIN),
+    ('ratings_count', 'rating_count', PLAIN),
+)
+
+# Columns read besides the output fields.
+EXTRA_COLUMNS = ('original_filename',)
+
+COLUMNS = tuple(dict.fromkeys([lookup for _name, lookup, _kind in LIST_FIELDS] + list(EXTRA_COLUMNS)))
+_INDEX = {lookup: position for position, lookup in enumerate(COLUMNS)}
+PLAN = tuple((name, _INDEX[lookup], kind) for name, lookup, kind in LIST_FIELDS)
+ID = _INDEX['id']
+ORIGINAL_FILENAME = _INDEX['original_filename']
+
+# Any pk works; it is cut out of the reversed URL to leave the prefix and suffix.
+URL_SENTINEL = 987654321
+
+_datetime_field = serializers.DateTimeField()
+
+
+def use_fast_listing(expand):
+    return settings.NOTE_FAST_LISTING and not expand
+
+
+def note_rows(queryset):
+    """The list queryset as named tuples of COLUMNS; KeysetPagination reads their id/created_at like model attributes."""
+    return queryset.prefetch_related(None).values_list(*COLUMNS, named=True)
+
+
+def download_url_template(request):
+    url = reverse('secure-note-download', kwargs={'pk': URL_SENTINEL}, request=request)
+    prefix, _sentinel, suffix = url.rpartition(str(URL_SENTINEL))
+    return prefix, suffix
+
+
+def tags_by_note(note_ids):
+    """Tag names per note id, in the order the serializer's `tags` prefetch returns them."""
+    if not note_ids:
+        return {}
+    # The query prefetch_related('tags') runs; it only reads the pks of the instances.
+    instances = [Note(pk=pk) for pk in note_ids]
+    queryset, rel_obj_attr = Note.tags.get_prefetch_querysets(instances)[:2]
+    names = defaultdict(list)
+    for tag in queryset:
+        names[rel_obj_attr(tag)].append(tag.name)
+    return names
+
+
+def serialize_note_rows(rows, request):
+    """Builds NoteSummarySerializer-identical dicts from note_rows() tuples."""
+    rows = list(rows)
+    tags = tags_by_note([row[ID] for row in rows])
+    url_prefix, url_suffix = download_url_template(request)
+    to_datetime = _datetime_field.to_representation
+    snippets = getattr(request, 'search_snippets', None)
+
+    results = []
+    for row in rows:
+        data = {}
+        for name, index, kind in PLAN:
+            value = row[index]
+            if kind == PLAIN:
+                data[name] = value
+            elif kind == DATETIME:
+                data[name] = None if value is None else to_datetime(value)
+            elif kind == OMIT_IF_NULL:
+                if value is not None:
+                    data[name] = value
+            elif kind == FILE_URL:
+                data[name] = f'{url_prefix}{row[ID]}{url_suffix}' if value else None
+            elif kind == FILE_NAME:
+                data[name] = (row[ORIGINAL_FILENAME] or os.path.basename(value)) if value else None
+            elif kind == TAGS:
+                data[name] = tags.get(value, [])
+        if snippets is not None:
+            data['search_snippet'] = snippets.get(row[ID])
+        results.append(data)
+    return results
@@ -0,0 +1,154 @@
+# notes/file_delivery.py
+"""
+Serving note files once the view has done its permission checks.
+
+With NOTE_FILE_OFFLOAD_HEADER set (e.g. 'X-Accel-Redirect' for nginx,
+'X-Sendfile' for Apache/lighttpd) the response carries no body and the front
+proxy streams the file, ranges included. Otherwise the file is streamed by
+Django with an ETag (the content hash when known, else size + mtime),
+Last-Modified, conditional GET (304) and single byte-range (206/416) support.
+Storages without local paths (S3 and the like) get the whole file streamed
+through File.open(), with the content hash as ETag and no ranges.
+"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(note, stat):
+    if note.file_hash:
+        return f'"{note.file_hash}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def local_path(note):
+    """The file's filesystem path, or None when the storage has none."""
+    try:
+        return note.file.path
+    except NotImplementedError:
+        return None
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) inclusive for a single `bytes=` range, None when the
+    header should be ignored (missing, malformed or multi-range) and False
+    when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload_response(note, path, file_name, content_type):
+    header = settings.NOTE_FILE_OFFLOAD_HEADER
+    response = HttpResponse(content_type=content_type)
+    if header.lower() == 'x-accel-redirect':
+        # nginx maps this internal location onto MEDIA_ROOT.
+        response[header] = settings.NOTE_FILE_OFFLOAD_PREFIX.rstrip('/') + '/' + quote(note.file.name)
+    else:
+        response[header] = path
+    response['Content-Disposition'] = content_disposition_header(True, file_name)
+    return response
+
+
+def serve_note_file(request, note, record_download):
+    """
+    Returns the download response for `note`. `record_download()` is called
+    only for transfers that start at byte 0 (not for 304s or resumed ranges)
+    and its return value is sent as X-Download-Count.
+    """
+    path = local_path(note)
+    file_name = note.file_display_name
+    content_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+
+    if path is None:
+        return storage_response(request, note, file_name, content_type, record_download)
+
+    if settings.NOTE_FILE_OFFLOAD_HEADER:
+        response = offload_response(note, path, file_name, content_type)
+        response['X-Download-Count'] = record_download()
+        return response
+
+    stat = os.stat(path)
+    etag = file_etag(note, stat)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return not_modified
+
+    size = stat.st_size
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and if_range and etag not in parse_etags(if_range):
+        # The client's partial copy is stale; send the whole file.
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_iter_range(path, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = content_disposition_header(True, file_name)
+        if start == 0:
+            response['X-Download-Count'] = record_download()
+    else:
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=file_name, content_type=content_type)
+        response['X-Download-Count'] = record_download()
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+def storage_response(request, note, file_name, content_type, record_download):
+    """The whole file read through the storage backend, for storages without local paths."""
+    etag = f'"{note.file_hash}"' if note.file_hash else None
+    if etag:
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+    response = FileResponse(note.file.open('rb'), as_attachment=True, filename=file_name, content_type=content_type)
+    response['X-Download-Count'] = record_download()
+    if etag:
+        response['ETag'] = etag
+    return response
@@ -1,7 +1,10 @@
 # notes/filters.py
 
+from django.db.models import Case, IntegerField, Value, When
 from django_filters import rest_framework as filters
+from rest_framework.filters import SearchFilter
 from .models import Contributor
+from .search import search_notes
 
 class ContributorFilter(filters.FilterSet):
     department_name = filters.CharFilter(
@@ -11,4 +14,31 @@ class ContributorFilter(filters.FilterSet):
 
     class Meta:
         model = Contributor
-        fields = ['department_name'] 
\ No newline at end of file
+        fields = ['department_name']
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Ranked full-text search on ?q= backed by notes.search (FTS5 / tsvector).
+    Results are ordered by relevance and matching snippets are exposed to the
+    serializer through `request.search_snippets`. When full-text search is
+    disabled it behaves like the plain SearchFilter over view.search_fields.
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+
+        hits = search_notes(query)
+        if hits is None:
+            return super().filter_queryset(request, queryset, view)
+
+        request.search_snippets = {note_id: snippet for note_id, _rank, snippet in hits}
+        if not hits:
+            return queryset.none()
+        positions = [When(pk=note_id, then=Value(position)) for position, (note_id, _rank, _snippet) in enumerate(hits)]
+        return queryset.filter(pk__in=[note_id for note_id, _rank, _snippet in hits]).annotate(
+            search_position=Case(*positions, output_field=IntegerField())
+        ).order_by('search_position')
@@ -0,0 +1,122 @@
+# notes/inbox.py
+"""
+Per-user notification inbox.
+
+Notifications with a recipient are targeted; the rest are global and visible
+to everyone. Read state is a single high-water mark per user
+(NotificationInboxState.last_read_notification_id): every notification at or
+below it counts as read. Targeted notifications above the mark can also be
+marked read one by one through UserNotificationStatus rows, which are never
+created for global notifications.
+
+Unread counts are cached per user under a key that embeds a global version,
+bumped whenever a global notification is created, and a per-user version,
+bumped by targeted notifications and mark-read, so a cached count is never
+stale.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Exists, Max, OuterRef, Q
+from .models import Notification, NotificationInboxState, UserNotificationStatus
+
+GLOBAL_VERSION_KEY = 'notifications:global-version'
+
+
+def _user_version_key(user_id):
+    return f'notifications:user-version:{user_id}'
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # A missing version restarts from the clock so it can't collide with
+        # keys cached under an evicted value.
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def _bump_versions(keys):
+    for key in keys:
+        _bump(key)
+
+
+def _versions(user_id):
+    keys = [GLOBAL_VERSION_KEY, _user_version_key(user_id)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return versions[keys[0]], versions[keys[1]]
+
+
+def notifications_created(notifications):
+    """Invalidates the unread counts affected by newly created notifications."""
+    keys = set()
+    for notification in notifications:
+        keys.add(GLOBAL_VERSION_KEY if notification.recipient_id is None else _user_version_key(notification.recipient_id))
+    _bump_versions(keys)
+    if keys and connection.in_atomic_block:
+        # Counts computed before the commit don't see the new rows yet.
+        transaction.on_commit(lambda: _bump_versions(keys))
+
+
+def visible_notifications(user):
+    return Notification.objects.filter(Q(recipient__isnull=True) | Q(recipient=user))
+
+
+def get_read_mark(user):
+    mark = NotificationInboxState.objects.filter(user=user).values_list('last_read_notification_id', flat=True).first()
+    return mark or 0
+
+
+def annotate_read_individually(queryset, user):
+    return queryset.annotate(
+        read_individually=Exists(UserNotificationStatus.objects.filter(user=user, notification=OuterRef('pk'), is_read=True))
+    )
+
+
+def unread_notifications(user, read_mark=None):
+    if read_mark is None:
+        read_mark = get_read_mark(user)
+    return annotate_read_individually(visible_notifications(user).filter(pk__gt=read_mark), user).filter(read_individually=False)
+
+
+def get_unread_count(user):
+    global_version, user_version = _versions(user.pk)
+    key = f'notifications:unread:{user.pk}:{global_version}:{user_version}'
+    count = cache.get(key)
+    if count is None:
+        count = unread_notifications(user).count()
+        cache.set(key, count, settings.NOTIFICATION_UNREAD_CACHE_TTL)
+    return count
+
+
+def mark_read(user, up_to=None, ids=None):
+    """
+    Marks notifications read. Without `ids` the user's mark moves up to
+    `up_to` (default: the newest visible notification) in a single write, and
+    per-notification rows below it are dropped. With `ids`, the targeted ones
+    among them are marked read individually. Returns the unread count.
+    """
+    if ids:
+        read_mark = get_read_mark(user)
+        targeted = Notification.objects.filter(pk__in=ids, recipient=user, pk__gt=read_mark).values_list('pk', flat=True)
+        UserNotificationStatus.objects.bulk_create(
+            [UserNotificationStatus(user=user, notification_id=pk, is_read=True) for pk in targeted],
+            update_conflicts=True, unique_fields=['user', 'notification'], update_fields=['is_read'],
+        )
+    else:
+        if up_to is None:
+            up_to = visible_notifications(user).aggregate(latest=Max('pk'))['latest'] or 0
+        with transaction.atomic():
+            state, created = NotificationInboxState.objects.get_or_create(user=user, defaults={'last_read_notification_id': up_to})
+            if not created:
+                NotificationInboxState.objects.filter(user=user, last_read_notification_id__lt=up_to).update(last_read_notification_id=up_to)
+            UserNotificationStatus.objects.filter(user=user, notification_id__lte=up_to).delete()
+    _bump(_user_version_key(user.pk))
+    return get_unread_count(user)
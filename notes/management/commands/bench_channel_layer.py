@@ -0,0 +1,91 @@
+# notes/management/commands/bench_channel_layer.py
+
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+from noteshare_backend.channel_layer import SQLiteChannelLayer
+
+
+def _send_from_other_process(path, channel, messages):
+    layer = SQLiteChannelLayer(path=path, capacity=messages + 1)
+
+    async def send_all():
+        for i in range(messages):
+            await layer.send(channel, {'type': 'bench.message', 'n': i})
+
+    asyncio.run(send_all())
+
+
+class Command(BaseCommand):
+    help = 'Compares send/receive and group fan-out throughput of the SQLite channel layer with the in-memory layer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help='Point-to-point messages per run.')
+        parser.add_argument('--group-size', type=int, default=200, help='Channels in the fan-out group.')
+        parser.add_argument('--group-messages', type=int, default=20, help='group_send calls in the fan-out run.')
+
+    def handle(self, *args, **options):
+        messages = options['messages']
+        group_size = options['group_size']
+        group_messages = options['group_messages']
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'channels.sqlite3')
+            layers = [
+                ('in-memory', lambda: InMemoryChannelLayer(capacity=messages + 1)),
+                ('sqlite', lambda: SQLiteChannelLayer(path=path, capacity=messages + 1)),
+            ]
+            for name, factory in layers:
+                rate = asyncio.run(self.point_to_point(factory(), messages))
+                self.stdout.write(f'{name:>10}  send+receive: {rate:10.0f} msg/s')
+                rate = asyncio.run(self.fan_out(factory(), group_size, group_messages))
+                self.stdout.write(f'{name:>10}  group fan-out: {rate:9.0f} deliveries/s ({group_size} members)')
+
+            rate = asyncio.run(self.cross_process(path, messages))
+            self.stdout.write(f'{"sqlite":>10}  cross-process: {rate:9.0f} msg/s')
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    async def point_to_point(self, layer, messages):
+        channel = await layer.new_channel()
+        started = time.perf_counter()
+        for i in range(messages):
+            await layer.send(channel, {'type': 'bench.message', 'n': i})
+        for _ in range(messages):
+            await layer.receive(channel)
+        elapsed = time.perf_counter() - started
+        await layer.flush()
+        return messages / elapsed
+
+    async def fan_out(self, layer, group_size, group_messages):
+        channels = [await layer.new_channel() for _ in range(group_size)]
+        for channel in channels:
+            await layer.group_add('bench', channel)
+        started = time.perf_counter()
+        for i in range(group_messages):
+            await layer.group_send('bench', {'type': 'bench.message', 'n': i})
+        for channel in channels:
+            for _ in range(group_messages):
+                await layer.receive(channel)
+        elapsed = time.perf_counter() - started
+        await layer.flush()
+        return group_size * group_messages / elapsed
+
+    async def cross_process(self, path, messages):
+        """Receives messages sent by a separate process through the same database file."""
+        layer = SQLiteChannelLayer(path=path, capacity=messages + 1)
+        channel = await layer.new_channel()
+        sender = multiprocessing.get_context('spawn').Process(target=_send_from_other_process, args=(path, channel, messages))
+        started = time.perf_counter()
+        sender.start()
+        for i in range(messages):
+            message = await layer.receive(channel)
+            assert message['n'] == i, 'messages arrived out of order'
+        elapsed = time.perf_counter() - started
+        sender.join()
+        await layer.flush()
+        return messages / elapsed
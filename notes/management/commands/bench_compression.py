@@ -0,0 +1,78 @@
+# notes/management/commands/bench_compression.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from notes.models import Note
+from noteshare_backend import middleware
+from noteshare_backend.middleware import compress
+
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_QUALITIES = (1, 4, 6, 11)
+
+
+class Command(BaseCommand):
+    help = 'Measures response size and compression CPU time of br/gzip levels on note API pages from the current database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Compressions per page and level (the median is reported).')
+        parser.add_argument('--page-size', type=int, default=100, help='page_size for the list pages.')
+
+    def handle(self, *args, **options):
+        first = Note.objects.filter(is_approved=True).order_by('pk').values_list('pk', flat=True).first()
+        if first is None:
+            raise CommandError('There are no approved notes to render; upload some first.')
+        page_size = options['page_size']
+        pages = [
+            ('list', f'/api/notes/?page_size={page_size}'),
+            ('list+expand', f'/api/notes/?page_size={page_size}&expand=comments,star_ratings'),
+            ('detail', f'/api/notes/{first}/'),
+            ('reference', '/api/reference/'),
+        ]
+        codecs = [('gzip', level) for level in GZIP_LEVELS]
+        if middleware.brotli is not None:
+            codecs += [('br', quality) for quality in BROTLI_QUALITIES]
+        else:
+            self.stdout.write(self.style.WARNING('The brotli package is not installed; measuring gzip only.'))
+
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        totals = {codec: [0, 0.0] for codec in codecs}
+        raw_total = 0
+        for name, url in pages:
+            response = client.get(url, HTTP_ACCEPT_ENCODING='identity')
+            if response.status_code != 200:
+                self.stdout.write(self.style.WARNING(f'{name}: {url} returned {response.status_code}, skipped'))
+                continue
+            body = response.content
+            raw_total += len(body)
+            self.stdout.write(f'{name} ({url}): {len(body)} bytes')
+            for encoding, level in codecs:
+                size, seconds = self.measure(body, encoding, level, options['repeat'])
+                totals[(encoding, level)][0] += size
+                totals[(encoding, level)][1] += seconds
+                self.stdout.write(
+                    f'  {encoding:>4} {level:>2}: {size:8d} bytes ({size / len(body):6.1%})  {seconds * 1000:7.3f} ms  '
+                    f'{len(body) / seconds / 1024 / 1024 if seconds else 0:8.1f} MiB/s'
+                )
+
+        if not raw_total:
+            return
+        self.stdout.write(f'All pages: {raw_total} bytes uncompressed')
+        for (encoding, level), (size, seconds) in totals.items():
+            current = level == (settings.RESPONSE_COMPRESSION_BROTLI_QUALITY if encoding == 'br' else settings.RESPONSE_COMPRESSION_GZIP_LEVEL)
+            self.stdout.write(
+                f'  {encoding:>4} {level:>2}: {size:8d} bytes ({size / raw_total:6.1%})  {seconds * 1000:7.3f} ms'
+                + ('  <- configured' if current else '')
+            )
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def measure(self, body, encoding, level, repeat):
+        timings = []
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            compressed = compress(body, encoding, level)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        return len(compressed), timings[len(timings) // 2]
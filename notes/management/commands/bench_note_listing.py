@@ -0,0 +1,96 @@
+# notes/management/commands/bench_note_listing.py
+
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from notes.models import Course, Department, Faculty, Note, NoteCategory
+from notes.views import NoteViewSet
+from taggit.models import Tag, TaggedItem
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares NoteViewSet.list rendered through NoteSummarySerializer with the serializer-free fast path (notes.fast_listing).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=30, help='Requests per page and path (the median is reported).')
+        parser.add_argument('--page-size', type=int, nargs='+', default=[10, 50, 100], help='page_size values to measure.')
+        parser.add_argument('--synthetic', type=int, default=0, help='Create this many temporary notes first (rolled back afterwards).')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['synthetic']:
+                    self.create_notes(options['synthetic'])
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        if not Note.objects.filter(is_approved=True).exists():
+            raise CommandError('There are no approved notes to list; use --synthetic N.')
+        view = NoteViewSet.as_view({'get': 'list'})
+        factory = RequestFactory(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+
+        def render(url):
+            response = view(factory.get(url))
+            response.render()
+            return response.content
+
+        for page_size in options['page_size']:
+            url = f'/api/notes/?page_size={page_size}'
+            timings = {}
+            bodies = {}
+            for name, fast in (('serializer', False), ('fast path', True)):
+                with override_settings(NOTE_RESPONSE_CACHE=False, NOTE_FAST_LISTING=fast):
+                    bodies[name] = render(url)
+                    samples = []
+                    for _ in range(max(options['repeat'], 1)):
+                        started = time.perf_counter()
+                        render(url)
+                        samples.append(time.perf_counter() - started)
+                samples.sort()
+                timings[name] = samples[len(samples) // 2]
+                self.stdout.write(f'page_size={page_size:<4} {name:>10}: {timings[name] * 1000:8.2f} ms  ({len(bodies[name])} bytes)')
+
+            if bodies['serializer'] != bodies['fast path']:
+                self.stdout.write(self.style.ERROR(f'page_size={page_size}: the fast path rendered different JSON.'))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'page_size={page_size:<4} identical output, {timings["serializer"] / timings["fast path"]:.1f}x faster'
+                ))
+
+    def create_notes(self, count):
+        department, _ = Department.objects.get_or_create(name='Bench Department')
+        course, _ = Course.objects.get_or_create(name='Bench Course', department=department)
+        faculty, _ = Faculty.objects.get_or_create(name='Bench Faculty', defaults={'department': department})
+        category, _ = NoteCategory.objects.get_or_create(name='Bench Category')
+        uploader = User.objects.filter(is_active=True).first() or User.objects.create_user(
+            username='bench-uploader', password=None, student_id='000-000-000',
+        )
+        # bulk_create skips the save signals (notifications, counters, indexing).
+        notes = Note.objects.bulk_create([
+            Note(
+                uploader=uploader, title=f'Bench note {i}', description='Lecture notes on sorting, graphs and dynamic programming. ' * 4,
+                file=f'notes/bench/note-{i}.pdf', original_filename=f'Bench note {i}.pdf', is_approved=True,
+                category=category, course=course, department=department, faculty=faculty, semester='Spring 2025',
+                likes_count=i % 7, bookmarks_count=i % 5, comments_count=i % 3, rating_count=i % 4, average_rating=(i % 5) + 0.5,
+            )
+            for i in range(count)
+        ])
+        tags = [Tag.objects.get_or_create(name=name)[0] for name in ('algorithms', 'graphs', 'python', 'exam')]
+        content_type = ContentType.objects.get_for_model(Note)
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag=tag, content_type=content_type, object_id=note.pk)
+            for note in notes for tag in tags[:1 + note.pk % len(tags)]
+        ])
+        self.stdout.write(f'Created {count} temporary notes.')
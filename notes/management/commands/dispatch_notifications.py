@@ -0,0 +1,44 @@
+# notes/management/commands/dispatch_notifications.py
+
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from notes.outbox import dispatch_batch
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued real-time notifications from the outbox to the channel layer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is currently deliverable and exit.')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per batch (default: NOTIFICATION_OUTBOX_BATCH_SIZE).')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds to wait when the outbox is empty (default: NOTIFICATION_OUTBOX_POLL_INTERVAL).')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Attempts before an entry is given up (default: NOTIFICATION_OUTBOX_MAX_ATTEMPTS).')
+
+    def handle(self, *args, **options):
+        if get_channel_layer() is None:
+            raise CommandError('CHANNEL_LAYERS is not configured.')
+        interval = options['interval'] or settings.NOTIFICATION_OUTBOX_POLL_INTERVAL
+        totals = {'sent': 0, 'retrying': 0, 'failed': 0}
+
+        try:
+            while True:
+                close_old_connections()
+                summary = dispatch_batch(options['batch_size'], options['max_attempts'])
+                for key, count in summary.items():
+                    totals[key] += count
+                if summary['failed']:
+                    self.stdout.write(self.style.WARNING(f"Gave up on {summary['failed']} notifications (see NotificationOutbox in the admin)."))
+                if not summary['sent']:
+                    if options['once']:
+                        break
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} notifications ({totals['retrying']} retries scheduled, {totals['failed']} given up)."
+        ))
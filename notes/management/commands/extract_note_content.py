@@ -0,0 +1,58 @@
+# notes/management/commands/extract_note_content.py
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from notes.content_store import store_extraction_result
+from notes.extraction import process_file
+from notes.models import Note, NoteContent
+
+
+class Command(BaseCommand):
+    help = 'Extracts text from existing note files into NoteContent, in parallel worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: NOTE_EXTRACTION_WORKERS).')
+        parser.add_argument('--force', action='store_true', help='Re-extract files whose content is already stored.')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or settings.NOTE_EXTRACTION_WORKERS
+        force = options['force']
+
+        notes = Note.objects.exclude(file='').only('id', 'file', 'file_hash')
+        if not force:
+            notes = notes.exclude(file_hash__in=NoteContent.objects.values('file_hash'))
+
+        jobs = []
+        for note in notes.iterator():
+            path = note.file.path
+            if os.path.exists(path):
+                jobs.append((note.pk, path))
+            else:
+                self.stdout.write(self.style.WARNING(f'Note {note.pk}: file missing at {path}'))
+
+        if not jobs:
+            self.stdout.write(self.style.SUCCESS('All note files are already extracted.'))
+            return
+
+        # Files hashing to stored content are only hashed, never re-extracted.
+        known_hashes = frozenset() if force else frozenset(NoteContent.objects.values_list('file_hash', flat=True))
+
+        started = time.monotonic()
+        counts = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(partial(process_file, known_hashes=known_hashes), [path for _, path in jobs], chunksize=4)
+            for (note_id, path), result in zip(jobs, results):
+                store_extraction_result(note_id, result)
+                counts[result['status']] = counts.get(result['status'], 0) + 1
+                if result['status'] in ('failed', 'unsupported'):
+                    self.stdout.write(self.style.NOTICE(f'Note {note_id}: {result["error"]}'))
+
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(jobs)} files with {workers} workers in {time.monotonic() - started:.1f}s ({summary}).'
+        ))
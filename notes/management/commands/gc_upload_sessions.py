@@ -0,0 +1,25 @@
+# notes/management/commands/gc_upload_sessions.py
+
+from django.core.management.base import BaseCommand
+from notes.blobs import delete_orphaned_blob_files
+from notes.upload_sessions import expire_sessions
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired upload sessions, .part files left without a session and blob files left without a blob.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting it.')
+
+    def handle(self, *args, **options):
+        sessions, stray = expire_sessions(dry_run=options['dry_run'])
+        orphans = delete_orphaned_blob_files(dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'Would delete {sessions} expired upload sessions, {stray} stray files and {orphans} orphaned blob files '
+                f'(dry run, nothing deleted).'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {sessions} expired upload sessions, {stray} stray files and {orphans} orphaned blob files.'
+        ))
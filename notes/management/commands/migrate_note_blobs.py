@@ -0,0 +1,77 @@
+# notes/management/commands/migrate_note_blobs.py
+
+import os
+import time
+from collections import defaultdict
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from notes.blobs import blob_name, blob_storage, delete_unreferenced_blobs, recount_blob_references
+from notes.extraction import hash_file
+from notes.models import Note, NoteBlob
+
+
+class Command(BaseCommand):
+    help = 'Folds note files stored under media/notes/user_<id>/ into content-addressed blobs and recounts blob references.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be folded without touching files or rows.')
+        parser.add_argument('--keep-files', action='store_true', help='Leave the old per-user files in place after folding.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        started = time.monotonic()
+        storage = blob_storage()
+
+        # Several notes may share one legacy file (e.g. copies made in the admin).
+        by_name = defaultdict(list)
+        for pk, name in Note.objects.filter(blob__isnull=True).exclude(file='').values_list('pk', 'file').iterator():
+            by_name[name].append(pk)
+
+        folded = duplicates = missing = 0
+        saved_bytes = 0
+        seen = set()
+        for name, note_ids in by_name.items():
+            if not storage.exists(name):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f'Notes {note_ids}: file missing at {name}'))
+                continue
+            sha256 = hash_file(storage.path(name))
+            blob = NoteBlob.objects.filter(sha256=sha256).first()
+            if dry_run:
+                if blob is not None or sha256 in seen:
+                    duplicates += 1
+                    saved_bytes += storage.size(name)
+                seen.add(sha256)
+                folded += len(note_ids)
+                continue
+
+            if blob is None:
+                with storage.open(name, 'rb') as f:
+                    stored = storage.save(blob_name(sha256, name), File(f, name=name))
+                blob = NoteBlob.objects.create(sha256=sha256, file=stored, size=storage.size(stored))
+            else:
+                duplicates += 1
+                saved_bytes += storage.size(name)
+            with transaction.atomic():
+                # update() keeps the Note save signals (and their reference counting) out of this.
+                Note.objects.filter(pk__in=note_ids, original_filename='').update(original_filename=os.path.basename(name)[:255])
+                Note.objects.filter(pk__in=note_ids).update(blob=blob, file=blob.file.name, file_hash=sha256)
+            if not options['keep_files']:
+                storage.delete(name)
+            folded += len(note_ids)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(
+                f'Would fold {folded} notes from {len(by_name) - missing} files; {duplicates} files duplicate stored content '
+                f'({saved_bytes / 1024 / 1024:.1f} MiB) (dry run, nothing written).'
+            ))
+            return
+
+        recount_blob_references()
+        orphans = delete_unreferenced_blobs()
+        self.stdout.write(self.style.SUCCESS(
+            f'Folded {folded} notes in {time.monotonic() - started:.1f}s: {duplicates} duplicate files removed '
+            f'({saved_bytes / 1024 / 1024:.1f} MiB), {missing} missing, {orphans} unreferenced blobs deleted.'
+        ))
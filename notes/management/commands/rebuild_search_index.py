@@ -0,0 +1,14 @@
+# notes/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+from notes.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index for all notes.'
+
+    def handle(self, *args, **kwargs):
+        if rebuild_search_index():
+            self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
+        else:
+            self.stdout.write(self.style.WARNING('Full-text search is disabled or not supported on this database.'))
@@ -0,0 +1,43 @@
+# notes/management/commands/repair_note_counters.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from notes.counters import COUNTER_FIELDS, notes_with_counter_drift
+from notes.models import Note
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored like/bookmark/comment/rating counters on notes and fixes any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted notes without writing.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        update_fields = list(COUNTER_FIELDS) + ['average_rating']
+
+        repaired = 0
+        batch = []
+        for note in notes_with_counter_drift().iterator(chunk_size=batch_size):
+            for field in COUNTER_FIELDS:
+                setattr(note, field, getattr(note, f'actual_{field}'))
+            note.average_rating = round(note.rating_sum / note.rating_count, 2) if note.rating_count else 0.0
+            batch.append(note)
+            repaired += 1
+            if len(batch) >= batch_size:
+                self._flush(batch, update_fields, dry_run)
+                batch = []
+        self._flush(batch, update_fields, dry_run)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'{repaired} notes have drifted counters (dry run, nothing written).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Repaired counters on {repaired} notes.'))
+
+    def _flush(self, batch, update_fields, dry_run):
+        if not batch or dry_run:
+            return
+        with transaction.atomic():
+            Note.objects.bulk_update(batch, update_fields)
@@ -1,15 +1,26 @@
 # notes/management/commands/update_contributors.py
 
+import time
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from notes.signals import update_contributor_stats  # আমাদের তৈরি করা ফাংশনটি ইমপোর্ট করুন
+from notes.contributors import rebuild_all_contributors, rebuild_contributor  # আমাদের তৈরি করা ফাংশনটি ইমপোর্ট করুন
 
 User = get_user_model()
 
 class Command(BaseCommand):
     help = 'Updates or creates contributor profiles for all users with approved notes.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every profile with one GROUP BY query and bulk writes instead of per user.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk write in --rebuild mode.')
+        parser.add_argument('--dry-run', action='store_true', help='Report what --rebuild would change without writing.')
+
     def handle(self, *args, **kwargs):
+        if kwargs['rebuild'] or kwargs['dry_run']:
+            return self.rebuild(kwargs['batch_size'], kwargs['dry_run'])
+
         self.stdout.write(self.style.NOTICE('Starting contributor profile update...'))
         
         # শুধুমাত্র সেইসব ইউজারদের নিন যাদের অন্তত একটি অ্যাপ্রুভড নোট আছে
@@ -22,7 +33,21 @@ class Command(BaseCommand):
         count = 0
         for user in users_with_notes:
             self.stdout.write(f'Updating stats for user: {user.username}')
-            update_contributor_stats(user)
+            rebuild_contributor(user.pk)
             count += 1
             
-        self.stdout.write(self.style.SUCCESS(f'Successfully updated {count} contributor profiles.'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'Successfully updated {count} contributor profiles.'))
+
+    def rebuild(self, batch_size, dry_run):
+        started = time.monotonic()
+        summary = rebuild_all_contributors(batch_size=batch_size, dry_run=dry_run)
+        elapsed = time.monotonic() - started
+
+        message = (
+            f"{summary['created']} created, {summary['updated']} updated, "
+            f"{summary['unchanged']} unchanged, {summary['deleted']} deleted in {elapsed:.2f}s"
+        )
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Dry run, nothing written: {message}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt contributor profiles: {message}.'))
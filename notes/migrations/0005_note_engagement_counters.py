@@ -0,0 +1,80 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:41
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    Like = apps.get_model('notes', 'Like')
+    Bookmark = apps.get_model('notes', 'Bookmark')
+    Comment = apps.get_model('notes', 'Comment')
+    StarRating = apps.get_model('notes', 'StarRating')
+
+    def per_note(model, aggregate):
+        subquery = model.objects.filter(note=OuterRef('pk')).order_by().values('note').annotate(value=aggregate).values('value')
+        return Coalesce(Subquery(subquery), Value(0), output_field=IntegerField())
+
+    notes = Note.objects.annotate(
+        actual_likes=per_note(Like, Count('pk')),
+        actual_bookmarks=per_note(Bookmark, Count('pk')),
+        actual_comments=per_note(Comment, Count('pk')),
+        actual_rating_sum=per_note(StarRating, Sum('stars')),
+        actual_rating_count=per_note(StarRating, Count('pk')),
+    )
+    batch = []
+    for note in notes.iterator(chunk_size=500):
+        note.likes_count = note.actual_likes
+        note.bookmarks_count = note.actual_bookmarks
+        note.comments_count = note.actual_comments
+        note.rating_sum = note.actual_rating_sum
+        note.rating_count = note.actual_rating_count
+        note.average_rating = note.rating_sum / note.rating_count if note.rating_count else 0.0
+        batch.append(note)
+        if len(batch) >= 500:
+            Note.objects.bulk_update(batch, ['likes_count', 'bookmarks_count', 'comments_count', 'rating_sum', 'rating_count', 'average_rating'])
+            batch = []
+    if batch:
+        Note.objects.bulk_update(batch, ['likes_count', 'bookmarks_count', 'comments_count', 'rating_sum', 'rating_count', 'average_rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_notification_usernotificationstatus'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='average_rating',
+            field=models.FloatField(db_index=True, default=0.0),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='bookmarks_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='likes_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
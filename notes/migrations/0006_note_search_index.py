@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from notes.search import BACKENDS
+
+    backend = BACKENDS.get(schema_editor.connection.vendor)
+    if backend is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        backend.create_schema(cursor)
+        backend.index_notes(cursor)
+
+
+def drop_search_index(apps, schema_editor):
+    from notes.search import BACKENDS
+
+    backend = BACKENDS.get(schema_editor.connection.vendor)
+    if backend is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        backend.drop_schema(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        ('notes', '0005_note_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
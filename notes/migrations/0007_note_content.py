@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0006_note_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64, unique=True)),
+                ('text', models.TextField(blank=True)),
+                ('page_offsets', models.JSONField(blank=True, default=list)),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('extractor', models.CharField(blank=True, max_length=20)),
+                ('status', models.CharField(choices=[('READY', 'Ready'), ('UNSUPPORTED', 'Unsupported'), ('FAILED', 'Failed')], default='READY', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Note Content',
+                'verbose_name_plural': 'Note Contents',
+            },
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:01
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_totals(apps, schema_editor):
+    Contributor = apps.get_model('notes', 'Contributor')
+    Note = apps.get_model('notes', 'Note')
+
+    totals = {
+        row['uploader']: row
+        for row in Note.objects.filter(is_approved=True).order_by().values('uploader').annotate(
+            notes=Count('pk'), stars=Sum('rating_sum'), ratings=Sum('rating_count'),
+        )
+    }
+    batch = []
+    for contributor in Contributor.objects.iterator(chunk_size=500):
+        row = totals.get(contributor.user_id)
+        if row is None:
+            continue
+        contributor.note_contribution_count = row['notes']
+        contributor.rating_sum = row['stars'] or 0
+        contributor.rating_count = row['ratings'] or 0
+        contributor.average_star_rating = round(contributor.rating_sum / contributor.rating_count, 2) if contributor.rating_count else 0.0
+        batch.append(contributor)
+        if len(batch) >= 500:
+            Contributor.objects.bulk_update(batch, ['note_contribution_count', 'rating_sum', 'rating_count', 'average_star_rating'])
+            batch = []
+    if batch:
+        Contributor.objects.bulk_update(batch, ['note_contribution_count', 'rating_sum', 'rating_count', 'average_star_rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0007_note_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contributor',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contributor',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_totals, migrations.RunPython.noop),
+    ]
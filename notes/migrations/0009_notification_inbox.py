@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_recipients(apps, schema_editor):
+    # Approval, rating and comment notifications were always meant for the
+    # note's uploader; everything else stays global.
+    Notification = apps.get_model('notes', 'Notification')
+    Note = apps.get_model('notes', 'Note')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    note_type = ContentType.objects.filter(app_label='notes', model='note').first()
+    if note_type is None:
+        return
+    targeted = Notification.objects.filter(target_content_type=note_type).filter(
+        models.Q(verb='your note was approved') | models.Q(verb__startswith='rated your note') | models.Q(verb='commented on your note')
+    )
+    targeted.update(recipient_id=Subquery(Note.objects.filter(pk=OuterRef('target_object_id')).values('uploader_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_contributor_rating_totals'),
+        ('users', '0002_user_stats'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationInboxState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_inbox', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_read_notification_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='recipient',
+            field=models.ForeignKey(blank=True, help_text='Set for notifications meant for a single user; empty for global ones.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='targeted_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_recipients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0012_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, help_text='While set and in the future, a dispatcher is delivering this row.', null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0013_notification_outbox_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='note',
+            field=models.OneToOneField(blank=True, help_text='The note created by finalizing the session.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_session', to='notes.note'),
+        ),
+    ]
@@ -1,4 +1,8 @@
+import os
+import uuid
+
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from django.conf import settings 
 from django.core.validators import MinValueValidator, MaxValueValidator 
 from taggit.managers import TaggableManager
@@ -24,6 +28,10 @@ class Contributor(models.Model):
         default=0.0,
         help_text="Average rating of all approved notes from the user."
     )
+    # Running totals over the user's approved notes, maintained by
+    # notes.contributors; average_star_rating is derived from them.
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -80,6 +88,27 @@ class Faculty(models.Model):
     def __str__(self):
         return self.name
 
+class NoteBlob(models.Model):
+    """
+    One stored copy of an uploaded file, named by its SHA-256
+    (notes/blobs/<2 hex>/<sha256><ext>). Notes with identical uploads share a
+    blob; `ref_count` is the number of notes pointing at it and the blob and
+    its file are deleted when it drops to zero (see notes.blobs).
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Note Blob"
+        verbose_name_plural = "Note Blobs"
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.size} bytes, {self.ref_count} notes)"
+
+
 class Note(models.Model):
     uploader = models.ForeignKey(
          settings.AUTH_USER_MODEL, 
@@ -93,6 +122,10 @@ class Note(models.Model):
     
 
     file = models.FileField(upload_to=note_file_path) 
+    # Uploads are stored once per content hash; `file` names the blob's file
+    # and `original_filename` is what the uploader called it.
+    blob = models.ForeignKey(NoteBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='notes')
+    original_filename = models.CharField(max_length=255, blank=True)
     
     is_approved = models.BooleanField(default=False)
 
@@ -103,7 +136,19 @@ class Note(models.Model):
     semester = models.CharField(max_length=50, blank=True, null=True)
     tags = TaggableManager(blank=True)
     download_count = models.PositiveIntegerField(default=0)
-    
+
+    # Denormalized engagement counters, maintained by notes.counters from the
+    # like/bookmark/rating/comment signals. `repair_note_counters` fixes drift.
+    likes_count = models.PositiveIntegerField(default=0, db_index=True)
+    bookmarks_count = models.PositiveIntegerField(default=0, db_index=True)
+    comments_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0.0, db_index=True)
+
+    # SHA-256 of the uploaded file, filled in by the extraction pipeline; the
+    # extracted text lives in NoteContent under the same hash.
+    file_hash = models.CharField(max_length=64, blank=True, db_index=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -111,14 +156,145 @@ class Note(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding:
+            # Counters are written with F() updates only (see notes.counters).
+            from .counters import IN_PLACE_FIELDS
+            update_fields = kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in IN_PLACE_FIELDS
+            ]
+        if self.file and not self.file._committed and (update_fields is None or 'file' in update_fields):
+            # New uploads are stored once per content hash (see notes.blobs).
+            from .blobs import attach_upload
+            attach_upload(self, self.file.file)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'blob', 'file_hash', 'original_filename'}
+        super().save(*args, **kwargs)
 
     @property
-    def average_rating(self):
-    
-        all_ratings = self.star_ratings.all() 
-        if all_ratings.exists():
-            return round(sum(r.stars for r in all_ratings) / all_ratings.count(), 2)
-        return 0.0
+    def file_display_name(self):
+        if self.original_filename:
+            return self.original_filename
+        return os.path.basename(self.file.name) if self.file else ''
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Snapshot of the stored values; the post_save dispatcher in
+        # notes.signals diffs against it to react only to real changes.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _tracked_value(self, attname):
+        value = getattr(self, attname)
+        return value.name if isinstance(value, FieldFile) else value
+
+    def changed_fields(self):
+        """
+        Attnames whose values differ from the last load or save, or None for
+        an instance that was never loaded from the database.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        # auto_now timestamps change on every save and say nothing about the note.
+        auto_now = {field.attname for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)}
+        return {name for name, value in loaded.items() if name not in auto_now and self._tracked_value(name) != value}
+
+    def reset_changed_fields(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            field.attname: self._tracked_value(field.attname)
+            for field in self._meta.concrete_fields if field.attname not in deferred
+        }
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress. Chunk n covers bytes
+    [n * chunk_size, (n + 1) * chunk_size) and is appended to `path` in
+    place; finalizing moves the file into blob storage and creates the Note
+    (see notes.upload_sessions). A finalized session keeps the note until it
+    expires, so a repeated finalize returns the same one. Sessions idle past
+    `expires_at` are removed by gc_upload_sessions.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Optional hash of the whole file, checked when finalizing.")
+    received = models.PositiveBigIntegerField(default=0)
+    note = models.OneToOneField(
+        'Note', on_delete=models.CASCADE, null=True, blank=True, related_name='upload_session',
+        help_text="The note created by finalizing the session.",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Upload Session"
+        verbose_name_plural = "Upload Sessions"
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes)"
+
+    @property
+    def path(self):
+        return os.path.join(settings.NOTE_UPLOAD_SESSION_DIR, f'{self.pk}.part')
+
+    @property
+    def chunk_count(self):
+        return -(-self.size // self.chunk_size)
+
+    @property
+    def next_chunk(self):
+        return self.received // self.chunk_size if self.received < self.size else None
+
+
+class NoteContent(models.Model):
+    """
+    Text extracted from a note file, keyed by the file's SHA-256 so identical
+    uploads share one row. `page_offsets[i]` is the character offset at which
+    page i starts in `text`.
+    """
+
+    class Status(models.TextChoices):
+        READY = 'READY', 'Ready'
+        UNSUPPORTED = 'UNSUPPORTED', 'Unsupported'
+        FAILED = 'FAILED', 'Failed'
+
+    file_hash = models.CharField(max_length=64, unique=True)
+    text = models.TextField(blank=True)
+    page_offsets = models.JSONField(default=list, blank=True)
+    page_count = models.PositiveIntegerField(default=0)
+    extractor = models.CharField(max_length=20, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.READY)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Note Content"
+        verbose_name_plural = "Note Contents"
+
+    def __str__(self):
+        return f"{self.file_hash[:12]} ({self.status}, {self.page_count} pages)"
+
+    def page_bounds(self, number):
+        """
+        Returns the (start, end) character offsets of 1-based page `number`;
+        end is None for the last page.
+        """
+        offsets = self.page_offsets or [0]
+        start = offsets[number - 1]
+        # Pages are joined with a single newline, which belongs to neither page.
+        end = offsets[number] - 1 if number < len(offsets) else None
+        return start, end
+
 
 class StarRating(models.Model):
     note = models.ForeignKey(
@@ -144,6 +320,13 @@ class StarRating(models.Model):
     def __str__(self):
         return f"{self.stars} stars for '{self.note.title}' by {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so rating edits can be applied as deltas.
+        instance._loaded_stars = dict(zip(field_names, values)).get('stars')
+        return instance
+
 class Comment(models.Model):
     note = models.ForeignKey(
         Note,
@@ -275,6 +458,14 @@ class Notification(models.Model):
     target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True, related_name='target_notifications')
     target_object_id = models.PositiveIntegerField(null=True, blank=True)
     target = GenericForeignKey('target_content_type', 'target_object_id')
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='targeted_notifications',
+        help_text="Set for notifications meant for a single user; empty for global ones."
+    )
     
     timestamp = models.DateTimeField(auto_now_add=True)
     class Meta:
@@ -285,10 +476,56 @@ class Notification(models.Model):
             return f'{self.actor} {self.verb} {self.target}'
         return f'{self.actor} {self.verb}'
 
+class NotificationInboxState(models.Model):
+    """
+    Read position of a user's inbox: every notification with an id at or
+    below last_read_notification_id counts as read (see notes.inbox).
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_inbox'
+    )
+    last_read_notification_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Inbox of {self.user} (read up to #{self.last_read_notification_id})"
+
 class UserNotificationStatus(models.Model):
+    # Only kept for targeted notifications read individually above the
+    # user's NotificationInboxState mark.
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     notification = models.ForeignKey(Notification, on_delete=models.CASCADE)
     is_read = models.BooleanField(default=False)
     
     class Meta:
-        unique_together = ('user', 'notification')
\ No newline at end of file
+        unique_together = ('user', 'notification')
+
+class NotificationOutbox(models.Model):
+    """
+    A channel-layer message waiting to be delivered. Rows are written in the
+    same transaction as their Notification and drained in id order by the
+    dispatch_notifications command (see notes.outbox), so requests never
+    wait on the channel layer.
+    """
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='outbox_entries')
+    group = models.CharField(max_length=100, help_text="Channel layer group; messages to one group are delivered in order.")
+    payload = models.JSONField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True, help_text="Set once delivery is given up; the row is kept for inspection.")
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True, help_text="While set and in the future, a dispatcher is delivering this row.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['failed_at', 'id'], name='notes_outbox_pending')]
+        verbose_name = "Notification Outbox Entry"
+        verbose_name_plural = "Notification Outbox"
+
+    def __str__(self):
+        return f"#{self.notification_id} -> {self.group} ({self.attempts} attempts)"
@@ -0,0 +1,192 @@
+# notes/outbox.py
+"""
+Transactional outbox for real-time notifications.
+
+Creating a notification also writes one NotificationOutbox row holding the
+exact channel-layer message, in the same transaction, so a request only does
+two INSERTs and never talks to the channel layer. The dispatch_notifications
+command, or the dispatcher task each ASGI process starts on its first WebSocket
+connection (NOTIFICATION_OUTBOX_ASGI_DISPATCHER), drains the outbox:
+
+  - rows are claimed in id order, a batch at a time, with a single
+    conditional UPDATE, so several dispatchers (one per ASGI worker, or
+    dispatch_notifications next to them) never send the same row; a claim
+    lapses after NOTIFICATION_OUTBOX_CLAIM_SECONDS if its dispatcher dies;
+  - messages to one group (a user's `user_<id>` group or the global group)
+    are delivered in order: a group with rows claimed by another dispatcher
+    is left to it, and once a row fails, later rows of that group wait until
+    it has been retried;
+  - failures back off exponentially and are given up after
+    NOTIFICATION_OUTBOX_MAX_ATTEMPTS, keeping the row with its last error.
+
+Delivered rows are deleted.
+"""
+
+import asyncio
+import logging
+import uuid
+import weakref
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Note, Notification, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_GROUP = 'notifications_group'
+MAX_BACKOFF_SECONDS = 300
+
+_asgi_dispatchers = weakref.WeakKeyDictionary()
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def notification_payload(notification, extra: dict | None = None):
+    notification_data = {
+        'id': notification.id,
+        'actor': str(notification.actor),
+        'verb': notification.verb,
+        'target': str(notification.target) if notification.target else None,
+        'timestamp': notification.timestamp.isoformat(),
+        'target_url': f"/notes/{notification.target.id}" if notification.target and isinstance(notification.target, Note) else f"/note-requests",
+        'visibility': 'global',
+    }
+    if extra:
+        notification_data.update(extra)
+    return notification_data
+
+
+def outbox_entry(notification):
+    """The outbox row for a saved notification: its recipient's group, or the global group."""
+    if notification.recipient_id is None:
+        return NotificationOutbox(notification=notification, group=GLOBAL_GROUP, payload=notification_payload(notification))
+    # Only the recipient's own sockets (authenticated via notes.ws_auth) are
+    # in this group; the recipient hint is kept for existing clients.
+    extra = {'recipient_user_id': notification.recipient_id, 'visibility': 'user'}
+    return NotificationOutbox(notification=notification, group=user_group(notification.recipient_id), payload=notification_payload(notification, extra))
+
+
+def enqueue_notifications(notifications):
+    NotificationOutbox.objects.bulk_create([outbox_entry(notification) for notification in notifications])
+
+
+def create_notification(**fields):
+    """Creates a Notification and its outbox row in one transaction."""
+    with transaction.atomic():
+        notification = Notification.objects.create(**fields)
+        enqueue_notifications([notification])
+    return notification
+
+
+def pending_entries(now=None):
+    """
+    Rows that may be delivered now, skipping every group whose oldest failure
+    is still backing off or that another dispatcher is delivering.
+    """
+    now = now or timezone.now()
+    pending = NotificationOutbox.objects.filter(failed_at__isnull=True)
+    waiting_groups = pending.filter(Q(next_attempt_at__gt=now) | Q(claimed_until__gt=now)).values('group')
+    return pending.exclude(group__in=waiting_groups).order_by('id')
+
+
+def claim_entries(batch_size, now=None):
+    """Claims up to `batch_size` deliverable rows for this dispatcher and returns them in id order."""
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    ids = list(pending_entries(now).values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    # pending_entries() is evaluated again inside the UPDATE, so rows and
+    # groups another dispatcher claimed in the meantime are left alone.
+    pending_entries(now).filter(pk__in=ids).update(
+        claimed_by=token,
+        claimed_until=now + timedelta(seconds=settings.NOTIFICATION_OUTBOX_CLAIM_SECONDS),
+    )
+    return list(NotificationOutbox.objects.filter(claimed_by=token, claimed_until__gt=now).order_by('id'))
+
+
+async def _deliver(channel_layer, entries):
+    sent, errors, failed_groups = [], {}, set()
+    for entry in entries:
+        if entry.group in failed_groups:
+            continue
+        try:
+            await channel_layer.group_send(entry.group, {'type': 'broadcast_notification', 'message': entry.payload})
+        except Exception as e:
+            errors[entry.pk] = e
+            failed_groups.add(entry.group)
+        else:
+            sent.append(entry.pk)
+    return sent, errors
+
+
+def dispatch_batch(batch_size=None, max_attempts=None):
+    """
+    Delivers one batch from the outbox. Returns a dict with the number of
+    rows sent, retried later and given up.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS
+    summary = {'sent': 0, 'retrying': 0, 'failed': 0}
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        logger.warning("Channels layer not configured; notification outbox not dispatched.")
+        return summary
+
+    now = timezone.now()
+    entries = claim_entries(batch_size, now)
+    if not entries:
+        return summary
+    sent, errors = async_to_sync(_deliver)(channel_layer, entries)
+
+    if sent:
+        NotificationOutbox.objects.filter(pk__in=sent).delete()
+    failed = [entry for entry in entries if entry.pk in errors]
+    for entry in failed:
+        entry.attempts += 1
+        entry.last_error = str(errors[entry.pk])[:1000]
+        if entry.attempts >= max_attempts:
+            entry.failed_at = now
+            logger.error(f"Giving up on notification outbox entry {entry.pk} for {entry.group}: {entry.last_error}")
+        else:
+            entry.next_attempt_at = now + timedelta(seconds=min(2 ** entry.attempts, MAX_BACKOFF_SECONDS))
+    # Failed rows and the rows of their groups that were skipped go back to the outbox.
+    released = [entry for entry in entries if entry.pk not in sent]
+    for entry in released:
+        entry.claimed_until = None
+    if released:
+        NotificationOutbox.objects.bulk_update(released, ['attempts', 'last_error', 'next_attempt_at', 'failed_at', 'claimed_until'])
+
+    summary['sent'] = len(sent)
+    summary['failed'] = sum(1 for entry in failed if entry.failed_at)
+    summary['retrying'] = len(failed) - summary['failed']
+    return summary
+
+
+async def _dispatch_forever(interval):
+    while True:
+        try:
+            summary = await database_sync_to_async(dispatch_batch)()
+        except Exception as e:
+            logger.warning(f"Notification outbox dispatch failed: {e}")
+            summary = {'sent': 0}
+        if not summary['sent']:
+            await asyncio.sleep(interval)
+
+
+def ensure_asgi_dispatcher():
+    """Starts the in-process dispatcher on the running event loop unless it is already running."""
+    if not settings.NOTIFICATION_OUTBOX_ASGI_DISPATCHER:
+        return
+    loop = asyncio.get_running_loop()
+    task = _asgi_dispatchers.get(loop)
+    if task is None or task.done():
+        _asgi_dispatchers[loop] = loop.create_task(_dispatch_forever(settings.NOTIFICATION_OUTBOX_POLL_INTERVAL))
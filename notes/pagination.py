@@ -0,0 +1,215 @@
+# notes/pagination.py
+
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite sort key, e.g. (-created_at, -id).
+
+    Pages are fetched with `WHERE (created_at, id) < (cursor values)` instead of
+    OFFSET, so deep pages cost the same as the first one and no COUNT(*) runs.
+    Views can override the key with `get_keyset_ordering()`; every field must be
+    unique in combination and sort in the same direction.
+
+    Existing page-number clients keep working: `?page=N` (or `?pagination=page`),
+    any `?ordering=` and ranked `?q=` searches fall back to
+    StandardResultsSetPagination.
+    `?include_total=true` adds an `approximate_count` that is cached for
+    NOTE_APPROXIMATE_COUNT_TTL seconds.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    total_query_param = 'include_total'
+    ordering = ('-created_at', '-id')
+    fallback_class = StandardResultsSetPagination
+    invalid_cursor_message = 'Invalid cursor.'
+
+    # When True, requests without any pagination parameter are not paginated at
+    # all, preserving the plain-list response of endpoints that never paginated.
+    paginate_only_on_request = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fallback = None
+
+        if self.use_page_numbers(request):
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        if self.paginate_only_on_request and not any(
+            param in request.query_params
+            for param in (self.cursor_query_param, self.page_size_query_param, self.total_query_param)
+        ):
+            return None
+
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering(view)
+        self.descending = self.fields[0].startswith('-')
+        self.names = [field.lstrip('-') for field in self.fields]
+
+        values, self.reverse = self.decode_cursor(request)
+        self.has_cursor = values is not None
+        self.total = self.get_approximate_count(queryset, request)
+
+        # Walking backwards flips both the comparison and the sort direction;
+        # the page is reversed again before it is returned.
+        forward_descending = self.descending != self.reverse
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, forward_descending))
+        sort = [f'-{name}' if forward_descending else name for name in self.names]
+        queryset = queryset.order_by(*sort)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next = self.has_cursor
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.has_cursor
+
+        self.page = results
+        return results
+
+    def use_page_numbers(self, request):
+        params = request.query_params
+        # Explicit ordering and ranked search (?q=) impose their own sort order.
+        return (
+            'page' in params
+            or params.get('pagination') == 'page'
+            or bool(params.get('ordering'))
+            or bool(params.get('q'))
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, view):
+        if view is not None and hasattr(view, 'get_keyset_ordering'):
+            fields = tuple(view.get_keyset_ordering())
+        else:
+            fields = tuple(self.ordering)
+        directions = {field.startswith('-') for field in fields}
+        assert len(directions) == 1, 'KeysetPagination requires all ordering fields to share one direction.'
+        return fields
+
+    def keyset_filter(self, values, descending):
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        for index, name in enumerate(self.names):
+            term = Q(**{f'{name}__{lookup}': values[index]})
+            for previous_name, previous_value in zip(self.names[:index], values[:index]):
+                term &= Q(**{previous_name: previous_value})
+            condition |= term
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+            values = payload['v']
+            if len(values) != len(self.names):
+                raise ValueError
+            return values, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        values = []
+        for name in self.names:
+            value = getattr(item, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = {'v': values}
+        if reverse:
+            payload['r'] = 1
+        token = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_approximate_count(self, queryset, request):
+        if request.query_params.get(self.total_query_param, '').lower() not in ('1', 'true', 'yes'):
+            return None
+        # The compiled SQL captures filters, search terms and the requesting user.
+        query_sql = str(queryset.order_by().query)
+        key = 'keyset-total:' + hashlib.md5(query_sql.encode('utf-8')).hexdigest()
+        total = cache.get(key)
+        if total is None:
+            total = queryset.order_by().count()
+            cache.set(key, total, settings.NOTE_APPROXIMATE_COUNT_TTL)
+        return total
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        payload = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.total is not None:
+            payload['approximate_count'] = self.total
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'approximate_count': {'type': 'integer', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class UserActivityPagination(KeysetPagination):
+    paginate_only_on_request = True
+
+
+class NotificationPagination(KeysetPagination):
+    # Notification ids are assigned in creation order, so the id alone is a
+    # unique sort key and the same value the read mark is compared against.
+    ordering = ('-id',)
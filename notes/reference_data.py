@@ -0,0 +1,79 @@
+# notes/reference_data.py
+"""
+Departments, courses, categories and faculties for /api/reference/.
+
+The rendered JSON is kept in process memory together with the version it was
+built from. The version lives in the shared Django cache (CACHES) and is
+bumped by the save/delete signals of the four models, so every worker process
+rebuilds on its next request after a change. It starts from the clock rather
+than 1, so a version lost to eviction never matches an older build.
+
+ETags are hashes of the rendered bytes, both here and for the per-resource
+viewsets (ReferenceETagMixin), so equal tags always mean equal content.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+from .models import Course, Department, Faculty, NoteCategory
+from .serializers import CourseSerializer, DepartmentSerializer, FacultySerializer, NoteCategorySerializer
+from .utils import on_commit_once
+
+VERSION_KEY = 'notes:reference-data:version'
+
+_lock = threading.Lock()
+_cached = {'version': None, 'content': None, 'etag': None}
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        start = time.time_ns()
+        cache.add(VERSION_KEY, start, timeout=None)
+        version = cache.get(VERSION_KEY, start)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_reference_data():
+    bump_version()
+    if connection.in_atomic_block:
+        # Rebuilds that ran before the commit saw the old rows.
+        on_commit_once(bump_version)
+
+
+def build_reference_data():
+    return {
+        'departments': DepartmentSerializer(Department.objects.order_by('name'), many=True).data,
+        'courses': CourseSerializer(Course.objects.select_related('department').order_by('name'), many=True).data,
+        'categories': NoteCategorySerializer(NoteCategory.objects.order_by('name'), many=True).data,
+        'faculties': FacultySerializer(Faculty.objects.select_related('department').order_by('name'), many=True).data,
+    }
+
+
+def content_etag(content):
+    return f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def get_reference_data():
+    """Returns (json_bytes, etag) for the current version, rebuilding if needed."""
+    version = get_version()
+    with _lock:
+        if _cached['version'] == version:
+            return _cached['content'], _cached['etag']
+    content = JSONRenderer().render(build_reference_data())
+    etag = content_etag(content)
+    with _lock:
+        _cached.update(version=version, content=content, etag=etag)
+    return content, etag
@@ -0,0 +1,122 @@
+# notes/response_cache.py
+"""
+Response cache for anonymous note list/detail requests.
+
+Serialized response data is cached under a key built from the current
+generation, the action, the host and the normalized query string. Writes to
+notes, ratings, likes, bookmarks and comments bump the generation (see
+notes.signals), which orphans every cached entry at once; stale entries simply
+expire after NOTE_RESPONSE_CACHE_TTL. Compressed bodies of these responses are
+cached under the same key by noteshare_backend.middleware.
+
+The generation has to live in a cache shared by every worker process (CACHES),
+or a write only invalidates the process that handled it. It starts from the
+clock rather than 1, so a generation lost to eviction or a cleared cache never
+matches entries cached under an earlier one.
+"""
+
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from rest_framework.response import Response
+
+from .utils import on_commit_once
+
+GENERATION_KEY = 'notes:response-cache:generation'
+STATS_KEYS = {
+    'hits': 'notes:response-cache:hits',
+    'misses': 'notes:response-cache:misses',
+    'invalidations': 'notes:response-cache:invalidations',
+}
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing or evicted: (re)create it. add() avoids clobbering a
+        # concurrent writer.
+        if cache.add(key, 1, timeout=None):
+            return 1
+        return cache.incr(key)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        start = time.time_ns()
+        cache.add(GENERATION_KEY, start, timeout=None)
+        generation = cache.get(GENERATION_KEY, start)
+    return generation
+
+
+def bump_generation():
+    _incr(GENERATION_KEY)
+    _incr(STATS_KEYS['invalidations'])
+
+
+def invalidate_note_responses():
+    """Invalidates all cached responses now and again once the transaction commits."""
+    if not settings.NOTE_RESPONSE_CACHE:
+        return
+    bump_generation()
+    if connection.in_atomic_block:
+        # Requests running before the commit still see the old rows and may
+        # cache them under the new generation.
+        on_commit_once(bump_generation)
+
+
+def normalize_query(query_params):
+    pairs = sorted((key, value) for key, values in query_params.lists() for value in values if value != '')
+    return urlencode(pairs)
+
+
+def cache_key(request, action, generation, pk=None):
+    query = normalize_query(request.query_params)
+    # Cached bodies hold absolute URLs (pagination links, file URLs), which differ by scheme and host.
+    fingerprint = hashlib.md5(f'{request.scheme}|{request.get_host()}|{action}|{pk}|{query}'.encode('utf-8')).hexdigest()
+    return f'notes:response:{generation}:{fingerprint}'
+
+
+def cached_anonymous_response(request, action, build_response, pk=None):
+    """
+    Returns the cached response for anonymous requests, calling
+    `build_response()` on a miss. Authenticated requests bypass the cache.
+    """
+    if not settings.NOTE_RESPONSE_CACHE or request.user.is_authenticated:
+        return build_response()
+
+    key = cache_key(request, action, get_generation(), pk)
+    cached = cache.get(key)
+    if cached is not None:
+        _incr(STATS_KEYS['hits'])
+        response = Response(cached)
+        response['X-Cache'] = 'HIT'
+        response.compression_cache_key = key
+        return response
+
+    _incr(STATS_KEYS['misses'])
+    response = build_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.NOTE_RESPONSE_CACHE_TTL)
+        # Lets CompressionMiddleware cache the compressed body under the same generation.
+        response.compression_cache_key = key
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def get_cache_stats():
+    values = cache.get_many(list(STATS_KEYS.values()))
+    stats = {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    stats['generation'] = get_generation()
+    return stats
+
+
+def reset_cache_stats():
+    cache.delete_many([STATS_KEYS['hits'], STATS_KEYS['misses']])
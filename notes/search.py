@@ -0,0 +1,251 @@
+# notes/search.py
+"""
+Full-text search over note metadata.
+
+SQLite uses an FTS5 virtual table (`notes_note_fts`, rowid = note id) ranked
+with bm25(); PostgreSQL uses a side table holding a weighted tsvector with a
+GIN index, ranked with ts_rank_cd(). Rows are rebuilt from signals after the
+triggering transaction commits. When search is disabled or the backend is not
+available, get_search_backend() returns None and callers fall back to the
+icontains SearchFilter.
+"""
+
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from .utils import on_commit_once
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+
+NOTE_CONTENT_TYPE_SQL = "(SELECT id FROM django_content_type WHERE app_label = 'notes' AND model = 'note')"
+
+# One row per note: id, title, description, tag names, taxonomy names.
+SQLITE_DOCUMENT_SQL = f"""
+    SELECT n.id,
+           n.title,
+           COALESCE(n.description, ''),
+           COALESCE((SELECT group_concat(t.name, ' ')
+                       FROM taggit_taggeditem ti
+                       JOIN taggit_tag t ON t.id = ti.tag_id
+                      WHERE ti.object_id = n.id
+                        AND ti.content_type_id = {NOTE_CONTENT_TYPE_SQL}), ''),
+           TRIM(COALESCE(cat.name, '') || ' ' || COALESCE(co.name, '') || ' ' ||
+                COALESCE(d.name, '') || ' ' || COALESCE(f.name, ''))
+      FROM notes_note n
+      LEFT JOIN notes_notecategory cat ON cat.id = n.category_id
+      LEFT JOIN notes_course co ON co.id = n.course_id
+      LEFT JOIN notes_department d ON d.id = n.department_id
+      LEFT JOIN notes_faculty f ON f.id = n.faculty_id
+"""
+
+POSTGRES_DOCUMENT_SQL = f"""
+    SELECT n.id,
+           n.title,
+           COALESCE(n.description, ''),
+           COALESCE((SELECT string_agg(t.name, ' ')
+                       FROM taggit_taggeditem ti
+                       JOIN taggit_tag t ON t.id = ti.tag_id
+                      WHERE ti.object_id = n.id
+                        AND ti.content_type_id = {NOTE_CONTENT_TYPE_SQL}), ''),
+           concat_ws(' ', cat.name, co.name, d.name, f.name)
+      FROM notes_note n
+      LEFT JOIN notes_notecategory cat ON cat.id = n.category_id
+      LEFT JOIN notes_course co ON co.id = n.course_id
+      LEFT JOIN notes_department d ON d.id = n.department_id
+      LEFT JOIN notes_faculty f ON f.id = n.faculty_id
+"""
+
+
+def _id_filter(note_ids):
+    if note_ids is None:
+        return '', []
+    placeholders = ', '.join(['%s'] * len(note_ids))
+    return f' WHERE n.id IN ({placeholders})', list(note_ids)
+
+
+class SQLiteFTSBackend:
+    vendor = 'sqlite'
+    table = 'notes_note_fts'
+
+    def create_schema(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            "USING fts5(title, description, tags, taxonomy, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+    def drop_schema(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index_notes(self, cursor, note_ids=None):
+        where, params = _id_filter(note_ids)
+        self.remove_notes(cursor, note_ids)
+        cursor.execute(
+            f"INSERT INTO {self.table} (rowid, title, description, tags, taxonomy) {SQLITE_DOCUMENT_SQL}{where}",
+            params,
+        )
+
+    def remove_notes(self, cursor, note_ids=None):
+        if note_ids is None:
+            cursor.execute(f"DELETE FROM {self.table}")
+            return
+        placeholders = ', '.join(['%s'] * len(note_ids))
+        cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", list(note_ids))
+
+    def search(self, cursor, query, limit):
+        match = self.to_match_expression(query)
+        if not match:
+            return []
+        # bm25() is lower-is-better; column weights: title, description, tags, taxonomy
+        cursor.execute(
+            f"SELECT rowid, bm25({self.table}, 10.0, 1.0, 5.0, 3.0) AS rank, "
+            f"snippet({self.table}, -1, %s, %s, '…', 16) "
+            f"FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rank LIMIT %s",
+            [HIGHLIGHT_START, HIGHLIGHT_END, match, limit],
+        )
+        return cursor.fetchall()
+
+    @staticmethod
+    def to_match_expression(query):
+        # Quote every term so user input can never be parsed as FTS5 syntax;
+        # the trailing * gives prefix matching while the user is typing.
+        terms = re.findall(r'\w+', query, flags=re.UNICODE)
+        return ' '.join(f'"{term}"*' for term in terms)
+
+
+class PostgresSearchBackend:
+    vendor = 'postgresql'
+    table = 'notes_note_search'
+
+    @property
+    def config(self):
+        return settings.NOTE_SEARCH_CONFIG
+
+    def create_schema(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "note_id bigint PRIMARY KEY REFERENCES notes_note (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "body text NOT NULL, "
+            "document tsvector NOT NULL)"
+        )
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_document_gin ON {self.table} USING GIN (document)")
+
+    def drop_schema(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index_notes(self, cursor, note_ids=None):
+        where, params = _id_filter(note_ids)
+        cfg = self.config
+        cursor.execute(
+            f"INSERT INTO {self.table} (note_id, body, document) "
+            "SELECT doc.id, "
+            "       concat_ws(' ', doc.title, doc.tags, doc.taxonomy, doc.description), "
+            "       setweight(to_tsvector(%s::regconfig, doc.title), 'A') || "
+            "       setweight(to_tsvector(%s::regconfig, doc.tags), 'B') || "
+            "       setweight(to_tsvector(%s::regconfig, doc.taxonomy), 'C') || "
+            "       setweight(to_tsvector(%s::regconfig, doc.description), 'D') "
+            f"FROM ({POSTGRES_DOCUMENT_SQL}{where}) AS doc (id, title, description, tags, taxonomy) "
+            "ON CONFLICT (note_id) DO UPDATE SET body = EXCLUDED.body, document = EXCLUDED.document",
+            [cfg, cfg, cfg, cfg] + params,
+        )
+
+    def remove_notes(self, cursor, note_ids=None):
+        if note_ids is None:
+            cursor.execute(f"DELETE FROM {self.table}")
+            return
+        cursor.execute(f"DELETE FROM {self.table} WHERE note_id = ANY(%s)", [list(note_ids)])
+
+    def search(self, cursor, query, limit):
+        cfg = self.config
+        cursor.execute(
+            "SELECT s.note_id, ts_rank_cd(s.document, q) AS rank, "
+            "       ts_headline(%s::regconfig, s.body, q, %s) "
+            f"FROM {self.table} s, websearch_to_tsquery(%s::regconfig, %s) q "
+            "WHERE s.document @@ q ORDER BY rank DESC LIMIT %s",
+            [cfg, f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxFragments=2', cfg, query, limit],
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {backend.vendor: backend for backend in (SQLiteFTSBackend(), PostgresSearchBackend())}
+
+_table_checked = {}
+
+
+def get_search_backend():
+    """
+    Returns the backend for the default database, or None when full-text
+    search is disabled, the database is not supported or the index table has
+    not been created yet.
+    """
+    if not settings.NOTE_FULLTEXT_SEARCH:
+        return None
+    backend = BACKENDS.get(connection.vendor)
+    if backend is None:
+        return None
+    if not _table_checked.get(connection.alias):
+        if backend.table not in connection.introspection.table_names():
+            logger.warning(f"Full-text search table {backend.table} is missing; falling back to icontains search.")
+            return None
+        _table_checked[connection.alias] = True
+    return backend
+
+
+def search_notes(query, limit=None):
+    """Returns [(note_id, rank, snippet), ...] best match first."""
+    backend = get_search_backend()
+    if backend is None:
+        return None
+    limit = limit or settings.NOTE_SEARCH_MAX_RESULTS
+    with connection.cursor() as cursor:
+        return backend.search(cursor, query, limit)
+
+
+def rebuild_search_index(note_ids=None):
+    backend = get_search_backend()
+    if backend is None:
+        return False
+    with transaction.atomic(), connection.cursor() as cursor:
+        backend.index_notes(cursor, note_ids)
+    return True
+
+
+def remove_from_search_index(note_ids):
+    backend = get_search_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.remove_notes(cursor, list(note_ids))
+
+
+_pending = threading.local()
+
+
+def schedule_reindex(note_ids):
+    """
+    Queues notes for reindexing once the current transaction commits. Several
+    saves of the same note (e.g. the note and then its tags) are coalesced
+    into one statement.
+    """
+    if not settings.NOTE_FULLTEXT_SEARCH:
+        return
+    if getattr(_pending, 'ids', None) is None:
+        _pending.ids = set()
+    _pending.ids.update(note_ids)
+    on_commit_once(_flush_pending)
+
+
+def _flush_pending():
+    note_ids = getattr(_pending, 'ids', None)
+    _pending.ids = None
+    if not note_ids:
+        return
+    try:
+        rebuild_search_index(sorted(note_ids))
+    except Exception as e:
+        logger.warning(f"Failed to update search index for notes {sorted(note_ids)}: {e}")
@@ -3,12 +3,28 @@ from rest_framework import serializers
 from rest_framework.reverse import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from .models import Note, StarRating, Comment, Like, Bookmark , Department, Course, NoteCategory, NoteRequest,Faculty,Contributor
+from django.db.models import Prefetch
+from .models import Note, StarRating, Comment, Like, Bookmark , Department, Course, NoteCategory, NoteRequest,Faculty,Contributor, Notification, NoteBlob, UploadSession
+from .blobs import attach_blob
 from taggit.serializers import (TagListSerializerField, TaggitSerializer)
 import os
 
 User = get_user_model()
 
+# Child collections that list endpoints can inline with ?expand=comments,star_ratings
+NOTE_EXPANDABLE_FIELDS = ('comments', 'star_ratings')
+
+
+def parse_expand_param(request):
+    """
+    Returns the set of expandable child collections requested via ?expand=.
+    Unknown names are ignored.
+    """
+    if request is None:
+        return set()
+    raw = request.query_params.get('expand', '')
+    return {name.strip() for name in raw.split(',') if name.strip() in NOTE_EXPANDABLE_FIELDS}
+
 
 class ContributorSerializer(serializers.ModelSerializer):
     full_name = serializers.CharField(source='user.get_full_name', read_only=True)
@@ -127,6 +143,10 @@ class NoteSerializer(serializers.ModelSerializer):
     uploader_last_name = serializers.CharField(source='uploader.last_name', read_only=True, allow_null=True)
     file_url = serializers.SerializerMethodField()
     file_name = serializers.SerializerMethodField()
+    file_sha256 = serializers.RegexField(
+        r'^[0-9a-f]{64}$', write_only=True, required=False,
+        help_text="SHA-256 of a file already stored on the server (see /notes/check-upload/); sent instead of `file`.",
+    )
     tags = TagListSerializerField(required=False)
     department = serializers.PrimaryKeyRelatedField(queryset=Department.objects.all(), required=False, allow_null=True)
     course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.all(), required=False, allow_null=True)
@@ -141,10 +161,10 @@ class NoteSerializer(serializers.ModelSerializer):
     comments = CommentSerializer(many=True, read_only=True)
     
     
-    average_rating = serializers.FloatField(source='calculated_average_rating', read_only=True)
-    likes_count = serializers.IntegerField(source='calculated_likes_count', read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
+    likes_count = serializers.IntegerField(read_only=True)
     is_liked_by_current_user = serializers.BooleanField(source='is_liked_by_current_user_annotated', read_only=True)
-    bookmarks_count = serializers.IntegerField(source='calculated_bookmarks_count', read_only=True)
+    bookmarks_count = serializers.IntegerField(read_only=True)
     is_bookmarked_by_current_user = serializers.BooleanField(source='is_bookmarked_by_current_user_annotated', read_only=True)
     # total_ratings = serializers.IntegerField(source='calculated_total_ratings', read_only=True)
     class Meta:
@@ -161,7 +181,9 @@ class NoteSerializer(serializers.ModelSerializer):
             'description',
             'file_url',
             'file',
+            'file_sha256',
             'file_name',
+            'original_filename',
             'faculty',     
             'faculty_name', 
             'course',
@@ -207,7 +229,8 @@ class NoteSerializer(serializers.ModelSerializer):
             'faculty_name',
         )
         extra_kwargs = {
-            'file': {'write_only': True, 'required': True},
+            'file': {'write_only': True, 'required': False},
+            'original_filename': {'write_only': True, 'required': False},
             'uploader': {'write_only': True, 'required': False},
             'category': {'required': True, 'allow_null': False},
             'course': {'required': False, 'allow_null': True}, 
@@ -223,9 +246,24 @@ class NoteSerializer(serializers.ModelSerializer):
     
     def get_file_name(self, obj):
         if obj.file and hasattr(obj.file, 'name'):
-            return os.path.basename(obj.file.name)
+            return obj.file_display_name
         return None
 
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        sha256 = attrs.pop('file_sha256', None)
+        if attrs.get('file'):
+            return attrs
+        if sha256:
+            blob = NoteBlob.objects.filter(sha256=sha256).first()
+            if blob is None:
+                raise serializers.ValidationError({'file_sha256': "No stored file has this hash; upload the file instead."})
+            attrs['blob'] = blob
+        elif self.instance is None and 'upload_session' not in self.context:
+            # Finalizing an upload session supplies the blob itself.
+            raise serializers.ValidationError({'file': "No file was submitted."})
+        return attrs
+
     def get_likes_count(self, obj):
         return obj.likes.count()
 
@@ -245,19 +283,81 @@ class NoteSerializer(serializers.ModelSerializer):
         return False
 
     def create(self, validated_data):
-        note = Note.objects.create(**validated_data)
+        blob = validated_data.pop('blob', None)
+        note = Note(**validated_data)
+        if blob is not None:
+            attach_blob(note, blob)
+        note.save()
         return note
 
     def update(self, instance, validated_data):
         new_file = validated_data.get('file')
-        if new_file and instance.file:
+        blob = validated_data.pop('blob', None)
+        if (new_file or blob) and instance.file and instance.blob_id is None:
+            # Files from before blob storage belong to this note alone.
             instance.file.delete(save=False)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
+        if blob is not None:
+            attach_blob(instance, blob)
         instance.save()
         return instance
 
 
+class NoteSummarySerializer(NoteSerializer):
+    """
+    Lean, read-only representation used by the note list endpoints.
+    Child rows are replaced by counts; `?expand=comments,star_ratings`
+    inlines at most NOTE_EXPAND_LIMIT of the newest rows per note.
+    """
+    star_ratings = None
+    comments = None
+    comments_count = serializers.IntegerField(read_only=True)
+    ratings_count = serializers.IntegerField(source='rating_count', read_only=True)
+
+    class Meta(NoteSerializer.Meta):
+        fields = tuple(
+            name for name in NoteSerializer.Meta.fields if name not in NOTE_EXPANDABLE_FIELDS
+        ) + ('comments_count', 'ratings_count')
+
+    @staticmethod
+    def setup_eager_loading(queryset, expand=()):
+        """
+        Prefetches only the expanded children; counts are read from the
+        stored counter columns on Note.
+        """
+        limit = settings.NOTE_EXPAND_LIMIT
+        if 'comments' in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                'comments',
+                queryset=Comment.objects.select_related('user').order_by('-created_at', '-id')[:limit],
+                to_attr='expanded_comments',
+            ))
+        if 'star_ratings' in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                'star_ratings',
+                queryset=StarRating.objects.select_related('user').order_by('-created_at', '-id')[:limit],
+                to_attr='expanded_star_ratings',
+            ))
+        return queryset
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        snippets = getattr(self.context.get('request'), 'search_snippets', None)
+        if snippets is not None:
+            data['search_snippet'] = snippets.get(instance.pk)
+        expand = self.context.get('expand') or ()
+        if 'star_ratings' in expand:
+            data['star_ratings'] = StarRatingSerializer(
+                getattr(instance, 'expanded_star_ratings', []), many=True, context=self.context
+            ).data
+        if 'comments' in expand:
+            data['comments'] = CommentSerializer(
+                getattr(instance, 'expanded_comments', []), many=True, context=self.context
+            ).data
+        return data
+
+
 
 class LikeSerializer(serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
@@ -316,4 +416,78 @@ class NoteRequestSerializer(serializers.ModelSerializer):
             'fulfilled_note_id',
         ]
     
-        read_only_fields = ['user', 'status', 'created_at', 'fulfilled_by_username', 'fulfilled_note_id']
\ No newline at end of file
+        read_only_fields = ['user', 'status', 'created_at', 'fulfilled_by_username', 'fulfilled_note_id']
+
+class NotificationSerializer(serializers.ModelSerializer):
+    """
+    Inbox entry. `is_read` needs the user's read mark in the context
+    (`read_mark`) and a `read_individually` annotation (notes.inbox).
+    """
+    actor = serializers.SerializerMethodField()
+    target = serializers.SerializerMethodField()
+    target_url = serializers.SerializerMethodField()
+    is_global = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'actor', 'verb', 'target', 'target_url', 'timestamp', 'is_global', 'is_read']
+
+    def get_actor(self, obj):
+        return str(obj.actor) if obj.actor else None
+
+    def get_target(self, obj):
+        return str(obj.target) if obj.target else None
+
+    def get_target_url(self, obj):
+        # Same links as the websocket payload in notes.outbox.notification_payload.
+        if isinstance(obj.target, Note):
+            return f"/notes/{obj.target.id}"
+        return "/note-requests"
+
+    def get_is_global(self, obj):
+        return obj.recipient_id is None
+
+    def get_is_read(self, obj):
+        return obj.pk <= self.context.get('read_mark', 0) or bool(getattr(obj, 'read_individually', False))
+
+
+class NotificationMarkReadSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=500)
+    up_to = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if 'ids' in attrs and 'up_to' in attrs:
+            raise serializers.ValidationError("Send either 'ids' or 'up_to', not both.")
+        return attrs
+
+
+class NoteUploadCheckSerializer(serializers.Serializer):
+    sha256 = serializers.RegexField(r'^[0-9a-f]{64}$')
+    size = serializers.IntegerField(min_value=0)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    sha256 = serializers.RegexField(r'^[0-9a-f]{64}$', required=False, allow_blank=True)
+    chunk_count = serializers.IntegerField(read_only=True)
+    next_chunk = serializers.IntegerField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'chunk_size', 'sha256', 'received', 'chunk_count', 'next_chunk', 'note', 'created_at', 'expires_at']
+        read_only_fields = ['id', 'received', 'note', 'created_at', 'expires_at']
+        extra_kwargs = {'chunk_size': {'required': False}}
+
+    def validate_size(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Empty files can't be uploaded.")
+        if value > settings.NOTE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files are limited to {settings.NOTE_UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+    def validate_chunk_size(self, value):
+        if not settings.NOTE_UPLOAD_MIN_CHUNK_SIZE <= value <= settings.NOTE_UPLOAD_MAX_CHUNK_SIZE:
+            raise serializers.ValidationError(
+                f"Chunk size must be between {settings.NOTE_UPLOAD_MIN_CHUNK_SIZE} and {settings.NOTE_UPLOAD_MAX_CHUNK_SIZE} bytes."
+            )
+        return value
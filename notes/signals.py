@@ -1,190 +1,332 @@
 # notes/signals.py
 
-from django.db.models.signals import post_save, post_delete
+from django.db import connection, transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.db.models import Avg, Count
+from django.db.models import Count
 from django.contrib.auth import get_user_model
-from .models import Note, StarRating, Comment, Contributor, NoteRequest, Notification 
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from .models import Note, StarRating, Comment, Contributor, NoteRequest, Notification, Like, Bookmark, Department, Course, NoteCategory, Faculty
+from .counters import IN_PLACE_FIELDS, adjust_note_counters
+from .contributors import queue_contributor_update
+from .search import schedule_reindex, remove_from_search_index
+from .content_store import schedule_extraction
+from .blobs import acquire_blob, release_blob
+from .utils import commit_batch
+from .inbox import notifications_created
+from .outbox import create_notification, enqueue_notifications
+from .response_cache import invalidate_note_responses
+from .reference_data import invalidate_reference_data
+from users.stats import adjust_user_stats, adjust_uploader_stats
+from users.dashboard import invalidate_dashboard
 from django.contrib.contenttypes.models import ContentType
-import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
-def update_contributor_stats(user):
-    if not user:
-        return
-    approved_notes = Note.objects.filter(uploader=user, is_approved=True)
-    note_count = approved_notes.count()
-    avg_rating_data = approved_notes.aggregate(avg_stars=Avg('star_ratings__stars'))
-    avg_rating = avg_rating_data['avg_stars'] if avg_rating_data['avg_stars'] is not None else 0.0
+APPROVED_VERB = 'your note was approved'
+PENDING_VERB = 'uploaded a new note (pending approval)'
+SEARCH_FIELDS = {'title', 'description', 'category_id', 'course_id', 'department_id', 'faculty_id'}
+# Saves that only write counters need none of the Note save effects.
+COUNTER_ONLY_FIELDS = IN_PLACE_FIELDS
+
+
+class _NoteSaveEffects:
+    """
+    Side effects of Note saves in one transaction, run together after commit:
+    notifications are inserted with one bulk_create, reindexing is scheduled
+    once, and each uploader's dashboard is invalidated once.
+    """
 
-    contributor_profile, created = Contributor.objects.update_or_create(
-        user=user,
-        defaults={
-            'note_contribution_count': note_count,
-            'average_star_rating': round(avg_rating, 2)
-        }
-    )
+    def __init__(self):
+        self.approved = {}
+        self.maybe_approved = {}
+        self.pending = {}
+        self.reindex = set()
+        self.uploaders = set()
 
-    if note_count == 0:
-        contributor_profile.delete()
+    def __call__(self):
+        # Served from ContentType's own cache after the first lookup.
+        content_types = ContentType.objects.get_for_models(Note, User)
+        note_type, user_type = content_types[Note], content_types[User]
+
+        if self.maybe_approved:
+            # Saves of notes that weren't loaded from the database can't tell
+            # whether approval changed, so fall back to the notification log.
+            notified = set(Notification.objects.filter(
+                verb=APPROVED_VERB, target_content_type=note_type, target_object_id__in=list(self.maybe_approved),
+            ).values_list('target_object_id', flat=True))
+            for pk, note in self.maybe_approved.items():
+                if pk not in notified:
+                    self.approved.setdefault(pk, note)
+
+        notifications = [
+            (note, verb, Notification(
+                actor_content_type=user_type, actor_object_id=note.uploader_id, verb=verb,
+                target_content_type=note_type, target_object_id=note.pk,
+                recipient_id=note.uploader_id if verb == APPROVED_VERB else None,
+            ))
+            for verb, notes in ((APPROVED_VERB, self.approved), (PENDING_VERB, self.pending))
+            for note in notes.values()
+        ]
+        if notifications:
+            try:
+                with transaction.atomic():
+                    created = Notification.objects.bulk_create([notification for _note, _verb, notification in notifications])
+                    enqueue_notifications(created)
+            except Exception as e:
+                logger.warning(f"Failed to create {len(notifications)} Note notifications: {e}")
+            else:
+                # bulk_create skips post_save, so unread counts are invalidated here.
+                notifications_created(created)
+
+        if self.reindex:
+            schedule_reindex(list(self.reindex))
+        for user_id in self.uploaders:
+            invalidate_dashboard(user_id)
 
 
 @receiver(post_save, sender=Note)
-def note_saved_or_approved(sender, instance, created, **kwargs):
-    update_contributor_stats(instance.uploader)
+def note_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    The only post_save receiver for Note. Stats are adjusted inside the
+    transaction; everything else is queued on _NoteSaveEffects. Saves that
+    change nothing (e.g. a repeated admin save) or only counters (e.g.
+    update_fields=['download_count']) do no work at all.
+    """
+    if not created and update_fields is not None and set(update_fields) <= COUNTER_ONLY_FIELDS:
+        return
+    changed = None if created else instance.changed_fields()
+    if changed is not None and update_fields is not None:
+        changed &= {Note._meta.get_field(name).attname for name in update_fields}
+    if changed is not None and not (changed - COUNTER_ONLY_FIELDS):
+        return
+    previous_blob_id = instance._loaded_values.get('blob_id') if changed else None
+    instance.reset_changed_fields()
+
+    effects = commit_batch(_NoteSaveEffects) or _NoteSaveEffects()
+    if created:
+        adjust_user_stats(instance.uploader_id, notes_uploaded=1)
+        if instance.is_approved:
+            queue_contributor_update(instance.uploader_id, note_contribution_count=1)
+            effects.approved[instance.pk] = instance
+        else:
+            effects.pending[instance.pk] = instance
+    elif changed is None:
+        if instance.is_approved:
+            effects.maybe_approved[instance.pk] = instance
+    elif 'is_approved' in changed:
+        # Ratings only count towards the uploader's average while approved.
+        # The instance's counters are as loaded; ratings may have landed since.
+        sign = 1 if instance.is_approved else -1
+        ratings = Note.objects.filter(pk=instance.pk).values('rating_sum', 'rating_count').get()
+        adjust_user_stats(
+            instance.uploader_id,
+            approved_rating_sum=sign * ratings['rating_sum'],
+            approved_rating_count=sign * ratings['rating_count'],
+        )
+        queue_contributor_update(
+            instance.uploader_id,
+            note_contribution_count=sign,
+            rating_sum=sign * ratings['rating_sum'],
+            rating_count=sign * ratings['rating_count'],
+        )
+        if instance.is_approved:
+            effects.approved[instance.pk] = instance
+
+    if created and instance.blob_id:
+        acquire_blob(instance.blob_id)
+    elif changed and 'blob_id' in changed:
+        if instance.blob_id:
+            acquire_blob(instance.blob_id)
+        if previous_blob_id:
+            release_blob(previous_blob_id)
+
+    if changed is None or changed & SEARCH_FIELDS:
+        effects.reindex.add(instance.pk)
+    # New uploads, replaced files and notes that were never extracted all go
+    # through the background pipeline.
+    if instance.file and (changed is None or 'file' in changed or not instance.file_hash):
+        schedule_extraction(instance.pk)
+    effects.uploaders.add(instance.uploader_id)
+    invalidate_note_responses()
+
+    if not connection.in_atomic_block:
+        effects()
 
 @receiver(post_delete, sender=Note)
 def note_deleted(sender, instance, **kwargs):
-    update_contributor_stats(instance.uploader)
+    # Likes, bookmarks, ratings and comments were deleted first and already
+    # reversed their own contributions.
+    adjust_user_stats(instance.uploader_id, notes_uploaded=-1, downloads_received=-instance.download_count)
+    if instance.is_approved:
+        queue_contributor_update(instance.uploader_id, note_contribution_count=-1)
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    invalidate_note_responses()
+    invalidate_dashboard(instance.uploader_id)
 
 @receiver(post_save, sender=StarRating)
 def rating_saved(sender, instance, created, **kwargs):
-    update_contributor_stats(instance.note.uploader)
+    if created:
+        star_delta, count_delta = instance.stars, 1
+    else:
+        previous = getattr(instance, '_loaded_stars', None)
+        star_delta = instance.stars - previous if previous is not None else 0
+        count_delta = 0
+    if star_delta or count_delta:
+        adjust_note_counters(instance.note_id, rating_sum=star_delta, rating_count=count_delta)
+        adjust_uploader_stats(instance.note_id, approved_only=True, approved_rating_sum=star_delta, approved_rating_count=count_delta)
+        if instance.note.is_approved:
+            queue_contributor_update(instance.note.uploader_id, rating_sum=star_delta, rating_count=count_delta)
+    instance._loaded_stars = instance.stars
+    invalidate_note_responses()
+    invalidate_dashboard(instance.user_id)
+
     # Notify note owner when someone rates their note (avoid self-notify)
     try:
         if created and instance.user_id != instance.note.uploader_id:
-            Notification.objects.create(
+            create_notification(
                 actor_content_type=ContentType.objects.get_for_model(instance.user),
                 actor_object_id=instance.user.pk,
                 verb=f"rated your note ({instance.stars}★)",
                 target_content_type=ContentType.objects.get_for_model(instance.note),
                 target_object_id=instance.note.pk,
+                recipient_id=instance.note.uploader_id,
             )
-            send_notification_broadcast(Notification.objects.latest('id'))
     except Exception as e:
         logger.debug(f"Rating notification skipped: {e}")
 
 
 @receiver(post_delete, sender=StarRating)
 def rating_deleted(sender, instance, **kwargs):
-    update_contributor_stats(instance.note.uploader)
+    stars = getattr(instance, '_loaded_stars', None) or instance.stars
+    adjust_note_counters(instance.note_id, rating_sum=-stars, rating_count=-1)
+    adjust_uploader_stats(instance.note_id, approved_only=True, approved_rating_sum=-stars, approved_rating_count=-1)
+    if instance.note.is_approved:
+        queue_contributor_update(instance.note.uploader_id, rating_sum=-stars, rating_count=-1)
+    invalidate_note_responses()
+    invalidate_dashboard(instance.user_id)
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        adjust_note_counters(instance.note_id, likes_count=1)
+        adjust_uploader_stats(instance.note_id, note_filter={'likes_count': 1}, notes_liked=1)
+        invalidate_note_responses()
+        invalidate_dashboard(instance.user_id)
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    adjust_note_counters(instance.note_id, likes_count=-1)
+    adjust_uploader_stats(instance.note_id, note_filter={'likes_count': 0}, notes_liked=-1)
+    invalidate_note_responses()
+    invalidate_dashboard(instance.user_id)
+
+@receiver(post_save, sender=Bookmark)
+def bookmark_created(sender, instance, created, **kwargs):
+    if created:
+        adjust_note_counters(instance.note_id, bookmarks_count=1)
+        adjust_uploader_stats(instance.note_id, note_filter={'bookmarks_count': 1}, notes_bookmarked=1)
+        adjust_user_stats(instance.user_id, bookmarks_made=1)
+        invalidate_note_responses()
+        invalidate_dashboard(instance.user_id)
+
+@receiver(post_delete, sender=Bookmark)
+def bookmark_deleted(sender, instance, **kwargs):
+    adjust_note_counters(instance.note_id, bookmarks_count=-1)
+    adjust_uploader_stats(instance.note_id, note_filter={'bookmarks_count': 0}, notes_bookmarked=-1)
+    adjust_user_stats(instance.user_id, bookmarks_made=-1)
+    invalidate_note_responses()
+    invalidate_dashboard(instance.user_id)
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    adjust_note_counters(instance.note_id, comments_count=-1)
+    adjust_uploader_stats(instance.note_id, reviews_received=-1)
+    invalidate_note_responses()
+    invalidate_dashboard(instance.user_id)
     
 
 
-def send_notification_broadcast(notification, extra: dict | None = None):
-    try:
-        channel_layer = get_channel_layer()
-        if not channel_layer:
-            logger.debug("Channels layer not configured; skipping notification broadcast.")
-            return
-        notification_data = {
-            'id': notification.id,
-            'actor': str(notification.actor),
-            'verb': notification.verb,
-            'target': str(notification.target) if notification.target else None,
-            'timestamp': notification.timestamp.isoformat(),
-            'target_url': f"/notes/{notification.target.id}" if notification.target and isinstance(notification.target, Note) else f"/note-requests",
-            'visibility': 'global',
-        }
-        if extra:
-            notification_data.update(extra)
-        async_to_sync(channel_layer.group_send)(
-            'notifications_group', 
-            {
-                'type': 'broadcast_notification', 
-                'message': notification_data
-            }
-        )
-    except Exception as e:
-        logger.warning(f"Skipping notification broadcast due to error: {e}")
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    if created:
+        notifications_created([instance])
 
 
 @receiver(post_save, sender=NoteRequest)
 def note_request_created(sender, instance, created, **kwargs):
     if created:
         try:
-            notification = Notification.objects.create(
+            # Global notification, broadcast to all users by the outbox dispatcher
+            create_notification(
                 actor_content_type=ContentType.objects.get_for_model(instance.user),
                 actor_object_id=instance.user.pk,
                 verb='requested a note',
                 target_content_type=ContentType.objects.get_for_model(instance),
                 target_object_id=instance.pk,
             )
-            # Broadcast to all users (global group)
-            send_notification_broadcast(notification)
-        except Exception as e:
-            logger.warning(f"Failed to create/broadcast notification for NoteRequest: {e}")
-
-
-def send_notification_to_user(user_id: int, notification: Notification):
-    # Fallback to global broadcast with recipient hint so clients can filter
-    send_notification_broadcast(notification, extra={'recipient_user_id': user_id, 'visibility': 'user'})
-
-
-@receiver(post_save, sender=Note)
-def note_approved_or_created(sender, instance, created, **kwargs):
-    update_fields = kwargs.get('update_fields') or []
-
-    # Only when approved
-    if not instance.is_approved:
-        return
-
-    # Avoid duplicate notifications for the same note approval
-    try:
-        approval_exists = Notification.objects.filter(
-            verb='your note was approved',
-            target_content_type=ContentType.objects.get_for_model(instance),
-            target_object_id=instance.pk,
-        ).exists()
-    except Exception:
-        approval_exists = False
-
-    # Trigger when:
-    # - created and already approved, or
-    # - 'is_approved' explicitly updated, or
-    # - no prior approval notification exists (covers admin saves with update_fields=None)
-    if created or ('is_approved' in update_fields) or (not approval_exists):
-        try:
-            notification = Notification.objects.create(
-                actor_content_type=ContentType.objects.get_for_model(instance.uploader),
-                actor_object_id=instance.uploader.pk,
-                verb='your note was approved',
-                target_content_type=ContentType.objects.get_for_model(instance),
-                target_object_id=instance.pk,
-            )
-            send_notification_to_user(instance.uploader_id, notification)
         except Exception as e:
-            logger.warning(f"Failed to create/send approval notification for Note: {e}")
-
-
-@receiver(post_save, sender=Note)
-def note_created_pending(sender, instance, created, **kwargs):
-    if created and not instance.is_approved:
-        try:
-            Notification.objects.create(
-                actor_content_type=ContentType.objects.get_for_model(instance.uploader),
-                actor_object_id=instance.uploader.pk,
-                verb='uploaded a new note (pending approval)',
-                target_content_type=ContentType.objects.get_for_model(instance),
-                target_object_id=instance.pk,
-            )
-        except Exception as e:
-            logger.warning(f"Failed to create pending notification for Note: {e}")
-        else:
-            try:
-                send_notification_broadcast(Notification.objects.latest('id'))
-            except Exception as e:
-                logger.debug(f"Broadcast skipped/failed after pending Note notification: {e}")
+            logger.warning(f"Failed to create notification for NoteRequest: {e}")
 
 
 @receiver(post_save, sender=Comment)
 def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        adjust_note_counters(instance.note_id, comments_count=1)
+        adjust_uploader_stats(instance.note_id, reviews_received=1)
+    invalidate_note_responses()
+    invalidate_dashboard(instance.user_id)
+
     # Notify note owner when someone comments on their note (avoid self-notify)
     try:
         if created and instance.user_id != instance.note.uploader_id:
-            Notification.objects.create(
+            create_notification(
                 actor_content_type=ContentType.objects.get_for_model(instance.user),
                 actor_object_id=instance.user.pk,
                 verb="commented on your note",
                 target_content_type=ContentType.objects.get_for_model(instance.note),
                 target_object_id=instance.note.pk,
+                recipient_id=instance.note.uploader_id,
             )
-            send_notification_broadcast(Notification.objects.latest('id'))
     except Exception as e:
-        logger.debug(f"Comment notification skipped: {e}")
\ No newline at end of file
+        logger.debug(f"Comment notification skipped: {e}")
+
+
+@receiver(post_delete, sender=Note)
+def note_search_index_remove(sender, instance, **kwargs):
+    remove_from_search_index([instance.pk])
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def note_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Note):
+        schedule_reindex([instance.pk])
+    elif pk_set:
+        schedule_reindex(pk_set)
+    invalidate_note_responses()
+
+def _reindex_notes_for(field_name):
+    def handler(sender, instance, created, **kwargs):
+        if not created:
+            schedule_reindex(Note.objects.filter(**{field_name: instance}).values_list('pk', flat=True))
+            invalidate_note_responses()
+    return handler
+
+# Renaming a department/course/category/faculty changes the indexed taxonomy text.
+for _model, _field in ((Department, 'department'), (Course, 'course'), (NoteCategory, 'category'), (Faculty, 'faculty')):
+    post_save.connect(_reindex_notes_for(_field), sender=_model, weak=False, dispatch_uid=f'search_reindex_{_field}')
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=NoteCategory)
+@receiver(post_delete, sender=NoteCategory)
+@receiver(post_save, sender=Faculty)
+@receiver(post_delete, sender=Faculty)
+def reference_data_changed(sender, instance, **kwargs):
+    invalidate_reference_data()
@@ -1,3 +1,1403 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import Storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import User, UserStats
+from .blobs import delete_orphaned_blob_files
+from .contributors import apply_contributor_deltas, queue_contributor_update, rebuild_all_contributors
+from .download_counter import DownloadCounterBuffer
+from .extraction import process_file
+from .inbox import get_unread_count
+from .models import (
+    Bookmark, Comment, Contributor, Course, Department, Faculty, Like, Note, NoteBlob, NoteCategory, NoteContent, Notification,
+    NotificationInboxState, NotificationOutbox, StarRating, UploadSession, UserNotificationStatus,
+)
+from . import content_store, ws_auth
+from .outbox import claim_entries, create_notification, dispatch_batch
+from .routing import websocket_urlpatterns
+from .search import rebuild_search_index, search_notes
+from .signals import APPROVED_VERB
+from .upload_sessions import ChunkRejected, expire_sessions, write_chunk
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(NOTE_RESPONSE_CACHE=False)
+class NoteFastListingParityTests(TestCase):
+    """The fast list path (notes.fast_listing) must render exactly what NoteSummarySerializer renders."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cse = Department.objects.create(name='CSE')
+        eee = Department.objects.create(name='EEE')
+        course = Course.objects.create(name='Algorithms', department=cse)
+        faculty = Faculty.objects.create(name='Dr. Rahman', department=cse)
+        lecture = NoteCategory.objects.create(name='Lecture')
+        slides = NoteCategory.objects.create(name='Slides')
+        cls.owner = User.objects.create_user(
+            username='owner', password='x', email='owner@example.com', student_id='111-111-111',
+            first_name='Nadia', last_name='Islam', department=cse,
+        )
+        cls.reader = User.objects.create_user(username='reader', password='x', email='reader@example.com', student_id='111-111-112')
+        cls.staff = User.objects.create_user(username='staff', password='x', email='staff@example.com', student_id='111-111-113', is_staff=True)
+
+        notes = [
+            Note.objects.create(
+                uploader=cls.owner, title='Sorting', description='Merge sort, quick sort', file='notes/blobs/aa/sorting.pdf',
+                original_filename='Sorting (final).pdf', category=lecture, course=course, department=cse, faculty=faculty,
+                semester='Spring 2025', is_approved=True,
+            ),
+            Note.objects.create(
+                uploader=cls.reader, title='Circuits', description=None, file='notes/user_2/circuits.docx',
+                category=slides, department=eee, is_approved=True,
+            ),
+            Note.objects.create(uploader=cls.reader, title='No file', file='', category=lecture, is_approved=True),
+            Note.objects.create(uploader=cls.owner, title='Pending', file='notes/user_1/pending.txt', category=None),
+        ]
+        for i in range(5):
+            notes.append(Note.objects.create(
+                uploader=cls.owner, title=f'Graphs {i}', file=f'notes/user_1/graphs-{i}.pdf', category=lecture,
+                course=course, is_approved=True,
+            ))
+        notes[0].tags.add('python', 'algorithms')
+        notes[1].tags.add('circuits')
+        notes[4].tags.add('algorithms', 'graphs', 'python')
+        Like.objects.create(note=notes[0], user=cls.reader)
+        Bookmark.objects.create(note=notes[1], user=cls.reader)
+        # Indexing normally runs after commit, which never happens inside a TestCase.
+        rebuild_search_index()
+
+    def setUp(self):
+        cache.clear()
+
+    def get_both(self, url, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        with override_settings(NOTE_FAST_LISTING=False):
+            expected = client.get(url)
+        with override_settings(NOTE_FAST_LISTING=True):
+            actual = client.get(url)
+        self.assertEqual(expected.status_code, 200, url)
+        self.assertEqual(actual.status_code, 200, url)
+        return expected, actual
+
+    def assert_parity(self, url, user=None):
+        expected, actual = self.get_both(url, user)
+        self.assertEqual(actual.content, expected.content, url)
+        return actual.json()
+
+    def test_pages_are_byte_identical(self):
+        urls = [
+            '/api/notes/',
+            '/api/notes/?page_size=100',
+            '/api/notes/?page=2&page_size=3',
+            '/api/notes/?ordering=-title',
+            '/api/notes/?tags__name=python',
+            '/api/notes/?category__name=Lecture&include_total=true',
+            '/api/notes/?search=sort',
+            '/api/notes/?q=sort',
+        ]
+        for user in (None, self.reader, self.staff):
+            for url in urls:
+                self.assert_parity(url, user)
+
+    def test_cursor_pages_are_byte_identical(self):
+        data = self.assert_parity('/api/notes/?page_size=3')
+        pages = 1
+        while data['next']:
+            data = self.assert_parity(data['next'])
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assert_parity(data['previous'])
+
+    def test_fast_path_skips_model_instances(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        # The notes query plus one for the tags, instead of building a Note per row.
+        with override_settings(NOTE_FAST_LISTING=True), self.assertNumQueries(2):
+            client.get('/api/notes/?page_size=100')
+
+
+@override_settings(NOTE_RESPONSE_CACHE=False)
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='x', email='owner@example.com', student_id='111-111-111')
+        notes = [
+            Note.objects.create(uploader=owner, title=f'Graphs {i}', file=f'notes/user_1/graphs-{i}.pdf', is_approved=True)
+            for i in range(7)
+        ]
+        # Three notes share a timestamp, so only the id breaks the tie between them.
+        start = timezone.now() - timedelta(days=1)
+        for i, note in enumerate(notes):
+            Note.objects.filter(pk=note.pk).update(created_at=start + timedelta(minutes=min(i, 3)))
+        rebuild_search_index()
+        cls.expected = list(Note.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response.json()
+
+    def cursor(self, link):
+        return parse_qs(urlsplit(link).query)['cursor'][0]
+
+    def test_cursor_encodes_the_sort_key_of_the_last_row(self):
+        data = self.get('/api/notes/?page_size=2&include_total=true')
+        self.assertEqual(data['approximate_count'], 7)
+        self.assertIsNone(data['previous'])
+        self.assertNotIn('page=', data['next'])
+        token = self.cursor(data['next'])
+        payload = json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        last = Note.objects.get(pk=data['results'][-1]['id'])
+        self.assertEqual(payload, {'v': [last.created_at.isoformat(), last.pk]})
+
+        for bad in ('not-a-cursor', urlsafe_b64encode(b'{"v":[1]}').decode()):
+            self.assertEqual(self.client.get(f'/api/notes/?cursor={bad}').status_code, 404)
+
+    def test_next_links_walk_every_row_once_across_ties(self):
+        url, seen, pages = '/api/notes/?page_size=2', [], 0
+        while url:
+            data = self.get(url)
+            seen += [note['id'] for note in data['results']]
+            url = data['next']
+            pages += 1
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(pages, 4)
+
+    def test_previous_links_walk_back_to_the_first_page(self):
+        data = self.get('/api/notes/?page_size=3')
+        forward = [[note['id'] for note in data['results']]]
+        while data['next']:
+            data = self.get(data['next'])
+            forward.append([note['id'] for note in data['results']])
+        token = self.cursor(data['previous'])
+        self.assertEqual(json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))['r'], 1)
+
+        backward = []
+        while data['previous']:
+            data = self.get(data['previous'])
+            backward.insert(0, [note['id'] for note in data['results']])
+        self.assertEqual(backward, forward[:-1])
+        self.assertIsNone(data['previous'])
+
+    def test_page_numbers_ordering_and_search_fall_back(self):
+        for query in ('page=2&page_size=2', 'pagination=page', 'ordering=title', 'q=graphs'):
+            data = self.get(f'/api/notes/?{query}')
+            self.assertEqual(data['count'], 7, query)
+            self.assertNotIn('cursor=', data['next'] or '', query)
+        self.assertEqual(self.get('/api/notes/?page=2&page_size=2')['results'][0]['id'], self.expected[2])
+
+
+@override_settings(NOTE_FULLTEXT_SEARCH=True, NOTE_RESPONSE_CACHE=False)
+class FullTextSearchTests(TestCase):
+    """notes.search: the index follows writes after commit; ?q= ranks and highlights."""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='x', email='owner@example.com', student_id='111-111-111')
+        self.department = Department.objects.create(name='Mathematics')
+        extraction = mock.patch('notes.signals.schedule_extraction')
+        extraction.start()
+        self.addCleanup(extraction.stop)
+
+    @contextmanager
+    def commit(self):
+        """Runs the block's on_commit callbacks, then drops them as a real commit would."""
+        queued = len(connection.run_on_commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            yield
+        # Left in place, they would make on_commit_once() skip later writes.
+        del connection.run_on_commit[queued:]
+
+    def create_note(self, title, **fields):
+        with self.commit():
+            return Note.objects.create(uploader=self.owner, title=title, file='notes/user_1/note.pdf', is_approved=True, **fields)
+
+    def found(self, query):
+        return [note_id for note_id, _rank, _snippet in search_notes(query)]
+
+    def test_index_follows_note_and_tag_writes(self):
+        note = self.create_note('Dijkstra shortest paths', department=self.department)
+        self.assertEqual(self.found('dijkstra'), [note.pk])
+        self.assertEqual(self.found('mathematics'), [note.pk])
+
+        with self.commit():
+            note.title = 'Bellman-Ford shortest paths'
+            note.save()
+        self.assertEqual(self.found('dijkstra'), [])
+        self.assertEqual(self.found('bellman'), [note.pk])
+
+        with self.commit():
+            note.tags.add('graphs')
+        self.assertEqual(self.found('graphs'), [note.pk])
+        with self.commit():
+            note.tags.remove('graphs')
+        self.assertEqual(self.found('graphs'), [])
+
+        with self.commit():
+            self.department.name = 'Computer Science'
+            self.department.save()
+        self.assertEqual(self.found('mathematics'), [])
+        self.assertEqual(self.found('computer'), [note.pk])
+
+        note.delete()
+        self.assertEqual(self.found('bellman'), [])
+
+    def test_results_are_ranked_and_highlighted(self):
+        in_description = self.create_note('Lecture 4', description='Proofs about matrices and eigenvalues')
+        in_title = self.create_note('Eigenvalues cheat sheet')
+        self.create_note('Unrelated')
+        self.assertEqual(self.found('eigenvalues'), [in_title.pk, in_description.pk])
+
+        for fast in (False, True):
+            with override_settings(NOTE_FAST_LISTING=fast):
+                results = APIClient().get('/api/notes/?q=eigen').json()['results']
+            self.assertEqual([note['id'] for note in results], [in_title.pk, in_description.pk])
+            self.assertIn('<mark>Eigenvalues</mark>', results[0]['search_snippet'])
+            self.assertIn('<mark>eigenvalues</mark>', results[1]['search_snippet'])
+        self.assertEqual(APIClient().get('/api/notes/?q=nothing-matches').json()['results'], [])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, NOTE_DOWNLOAD_BUFFERING=True, NOTE_DOWNLOAD_FLUSH_THRESHOLD=3)
+class DownloadCounterTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='x', email='reader@example.com', student_id='111-111-112')
+        self.note = Note.objects.create(
+            uploader=self.user, title='Sorting', file=SimpleUploadedFile('sorting.txt', b'merge sort'), is_approved=True,
+        )
+        # Timers are started by hand below instead of firing on a thread.
+        timer = mock.patch('notes.download_counter.threading.Timer')
+        self.Timer = timer.start()
+        self.addCleanup(timer.stop)
+        self.buffer = DownloadCounterBuffer()
+
+    def stored_count(self):
+        self.note.refresh_from_db(fields=['download_count'])
+        return self.note.download_count
+
+    def test_threshold_flushes_in_one_batch(self):
+        self.buffer.increment(self.note.pk)
+        self.buffer.increment(self.note.pk)
+        self.assertEqual(self.stored_count(), 0)
+        self.assertEqual(self.Timer.call_count, 1)
+
+        self.buffer.increment(self.note.pk)
+        self.assertEqual(self.stored_count(), 3)
+        self.assertEqual(self.buffer.pending_for(self.note.pk), 0)
+        self.Timer.return_value.cancel.assert_called_once()
+
+    def test_timer_flushes_what_is_pending(self):
+        self.buffer.increment(self.note.pk)
+        flush_from_timer = self.Timer.call_args.args[1]
+        with mock.patch('notes.download_counter.connection'):
+            flush_from_timer()
+        self.assertEqual(self.stored_count(), 1)
+
+    def test_failed_flush_keeps_the_counts_and_rearms_the_timer(self):
+        self.buffer.increment(self.note.pk)
+        failing = mock.patch('notes.download_counter.write_download_counts', side_effect=RuntimeError('database is locked'))
+        with failing, self.assertLogs('notes.download_counter', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending_for(self.note.pk), 1)
+        self.assertEqual(self.Timer.call_count, 2)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.stored_count(), 1)
+
+    def test_download_reports_the_live_count(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('notes.download_counter.download_buffer', self.buffer):
+            counts = [client.get(f'/api/notes/{self.note.pk}/download/')['X-Download-Count'] for _ in range(2)]
+            self.assertEqual(counts, ['1', '2'])
+            self.assertEqual(self.stored_count(), 0)
+            self.assertEqual(client.get(f'/download/note/{self.note.pk}/')['X-Download-Count'], '3')
+        self.assertEqual(self.stored_count(), 3)
+
+
+class RemoteStorage(Storage):
+    """Stands in for S3-style storages, which have no local paths."""
+
+    def __init__(self):
+        self.files = {}
+
+    def _open(self, name, mode='rb'):
+        return ContentFile(self.files[name], name=name)
+
+    def _save(self, name, content):
+        self.files[name] = content.read()
+        return name
+
+    def exists(self, name):
+        return name in self.files
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, NOTE_DOWNLOAD_BUFFERING=False, NOTE_FILE_OFFLOAD_HEADER='')
+class NoteDownloadTests(TestCase):
+    content = b'0123456789' * 10
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='x', email='reader@example.com', student_id='111-111-112')
+        self.note = Note.objects.create(
+            uploader=self.user, title='Sorting', file=SimpleUploadedFile('sorting.txt', self.content), is_approved=True,
+        )
+        self.url = f'/api/notes/{self.note.pk}/download/'
+        self.etag = f'"{self.note.file_hash}"'
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download_count(self):
+        self.note.refresh_from_db(fields=['download_count'])
+        return self.note.download_count
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual((response['ETag'], response['Accept-Ranges']), (self.etag, 'bytes'))
+        self.assertEqual(response['X-Download-Count'], '1')
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        # Resuming is not another download.
+        self.assertNotIn('X-Download-Count', response)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+        self.assertEqual(self.download_count(), 0)
+
+    def test_if_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=self.etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['X-Download-Count'], '1')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=50-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_if_none_match(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.download_count(), 0)
+
+    @override_settings(NOTE_FILE_OFFLOAD_HEADER='X-Accel-Redirect', NOTE_FILE_OFFLOAD_PREFIX='/protected-media/')
+    def test_offload_header(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.note.file.name}')
+        self.assertEqual(response['X-Download-Count'], '1')
+
+        with override_settings(NOTE_FILE_OFFLOAD_HEADER='X-Sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.note.file.path)
+
+    def test_storage_without_paths(self):
+        storage = RemoteStorage()
+        storage.save(self.note.file.name, ContentFile(self.content))
+        with mock.patch.object(Note._meta.get_field('file'), 'storage', storage):
+            response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), self.content)
+            self.assertEqual((response['ETag'], response['X-Download-Count']), (self.etag, '1'))
+            self.assertNotIn('Accept-Ranges', response)
+
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+            self.assertEqual(response.status_code, 304)
+
+
+@override_settings(NOTE_RESPONSE_CACHE=True)
+class NoteResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='x', email='owner@example.com', student_id='111-111-111')
+        self.reader = User.objects.create_user(username='reader', password='x', email='reader@example.com', student_id='111-111-112')
+        self.note = Note.objects.create(uploader=self.owner, title='Sorting', file='notes/user_1/sorting.pdf', is_approved=True)
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def assert_invalidated_by(self, write, field, expected):
+        urls = ['/api/notes/', f'/api/notes/{self.note.pk}/']
+        for url in urls:
+            self.anonymous.get(url)
+            self.assertEqual(self.anonymous.get(url)['X-Cache'], 'HIT')
+        write()
+        for url in urls:
+            self.assertEqual(self.anonymous.get(url)['X-Cache'], 'MISS', url)
+        self.assertEqual(self.anonymous.get(urls[0]).json()['results'][0][field], expected)
+
+    def post(self, url, data=None):
+        response = self.client.post(url, data)
+        self.assertIn(response.status_code, (200, 201), response.content)
+
+    def test_like_invalidates(self):
+        self.assert_invalidated_by(lambda: self.post(f'/api/notes/{self.note.pk}/toggle-like/'), 'likes_count', 1)
+
+    def test_comment_invalidates(self):
+        self.assert_invalidated_by(lambda: self.post('/api/comments/', {'note': self.note.pk, 'text': 'Thanks!'}), 'comments_count', 1)
+
+    def test_rating_invalidates(self):
+        self.assert_invalidated_by(lambda: self.post('/api/star-ratings/', {'note': self.note.pk, 'stars': 4}), 'average_rating', 4.0)
+
+    def test_http_and_https_are_cached_apart(self):
+        Note.objects.create(uploader=self.owner, title='Graphs', file='notes/user_1/graphs.pdf', is_approved=True)
+        url = '/api/notes/?page_size=1'
+        plain = self.anonymous.get(url)
+        secure = self.anonymous.get(url, secure=True)
+        self.assertEqual((plain['X-Cache'], secure['X-Cache']), ('MISS', 'MISS'))
+        self.assertTrue(plain.json()['next'].startswith('http://'))
+        self.assertTrue(secure.json()['next'].startswith('https://'))
+        self.assertEqual(self.anonymous.get(url, secure=True)['X-Cache'], 'HIT')
+
+    def test_write_outside_a_request_invalidates(self):
+        # What the admin or a shell does; with the shared cache other workers see it too.
+        def rename():
+            note = Note.objects.get(pk=self.note.pk)
+            note.title = 'Sorting, revised'
+            note.save()
+        self.assert_invalidated_by(rename, 'title', 'Sorting, revised')
+
+
+class ReferenceDataETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='CSE')
+        Course.objects.create(name='Algorithms', department=self.department)
+        self.client = APIClient()
+
+    def test_bootstrap_revalidates(self):
+        response = self.client.get('/api/reference/')
+        self.assertEqual(response.json()['departments'][0]['name'], 'CSE')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/reference/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Department.objects.create(name='EEE')
+        response = self.client.get('/api/reference/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_resource_etag_follows_the_content(self):
+        for url in ('/api/departments/', f'/api/departments/{self.department.pk}/', '/api/courses/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag))
+
+            # An update that bumps no version, as from a process with a stale one.
+            Department.objects.filter(pk=self.department.pk).update(name=f'CSE ({url})')
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+
+class NoteSaveEffectsTests(TestCase):
+    """notes.signals.note_saved: one dispatcher, effects batched per transaction."""
+
+    def setUp(self):
+        self.uploader = User.objects.create_user(username='owner', password='x', email='owner@example.com', student_id='111-111-111')
+        extraction = mock.patch('notes.signals.schedule_extraction')
+        self.schedule_extraction = extraction.start()
+        self.addCleanup(extraction.stop)
+
+    def create_note(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            note = Note.objects.create(uploader=self.uploader, title='Sorting', file='notes/user_1/sorting.pdf', **fields)
+        return Note.objects.get(pk=note.pk)
+
+    def approvals(self):
+        return Notification.objects.filter(verb=APPROVED_VERB, recipient=self.uploader)
+
+    def test_approval_notifies_once(self):
+        note = self.create_note()
+        outbox = NotificationOutbox.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            note.is_approved = True
+            note.save()
+            note.save()
+        self.assertEqual(self.approvals().count(), 1)
+        self.assertEqual(NotificationOutbox.objects.count(), outbox + 1)
+        self.assertEqual(NotificationOutbox.objects.last().group, f'user_{self.uploader.pk}')
+
+        # Later edits of an approved note don't approve it again.
+        with self.captureOnCommitCallbacks(execute=True):
+            note.title = 'Sorting, revised'
+            note.save()
+        self.assertEqual(self.approvals().count(), 1)
+        self.assertEqual(NotificationOutbox.objects.count(), outbox + 1)
+
+    def test_counter_saves_have_no_effects(self):
+        note = self.create_note(is_approved=True)
+        effects = ['schedule_reindex', 'invalidate_note_responses', 'invalidate_dashboard', 'adjust_user_stats', 'queue_contributor_update']
+        mocks = {}
+        for name in effects:
+            patcher = mock.patch(f'notes.signals.{name}')
+            mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.schedule_extraction.reset_mock()
+        notifications = Notification.objects.count()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            note.download_count = 5
+            note.save(update_fields=['download_count'])
+            Note(pk=note.pk, uploader=self.uploader, download_count=6).save(update_fields=['download_count'])
+        self.assertEqual(callbacks, [])
+        for name, effect in mocks.items():
+            effect.assert_not_called()
+        self.schedule_extraction.assert_not_called()
+        self.assertEqual(Notification.objects.count(), notifications)
+
+    def test_effects_run_once_per_commit(self):
+        first, second = self.create_note(), self.create_note()
+        with mock.patch('notes.signals.schedule_reindex') as schedule_reindex, \
+                mock.patch('notes.signals.invalidate_dashboard') as invalidate_dashboard, \
+                mock.patch('notes.contributors.apply_contributor_deltas', wraps=apply_contributor_deltas) as apply_deltas, \
+                self.captureOnCommitCallbacks(execute=True):
+            for note in (first, second):
+                note.is_approved = True
+                note.title = f'{note.title} (approved)'
+                note.save()
+            first.description = 'Merge sort'
+            first.save()
+
+        schedule_reindex.assert_called_once()
+        self.assertCountEqual(schedule_reindex.call_args.args[0], [first.pk, second.pk])
+        invalidate_dashboard.assert_called_once_with(self.uploader.pk)
+        apply_deltas.assert_called_once()
+        self.assertEqual(apply_deltas.call_args.args[1]['note_contribution_count'], 2)
+        self.assertEqual(self.approvals().count(), 2)
+
+        contributor = Contributor.objects.get(user=self.uploader)
+        self.assertEqual(contributor.note_contribution_count, 2)
+        self.assertEqual(UserStats.objects.get(user=self.uploader).notes_uploaded, 2)
+
+
+class NotificationInboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='x', email='reader@example.com', student_id='111-111-112')
+        self.other = User.objects.create_user(username='other', password='x', email='other@example.com', student_id='111-111-113')
+        self.user_type = ContentType.objects.get_for_model(User)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, recipient=None):
+        return create_notification(
+            actor_content_type=self.user_type, actor_object_id=self.other.pk, verb='requested a note',
+            recipient=recipient,
+        )
+
+    def unread_count(self):
+        return self.client.get('/api/notifications/unread-count/').json()['unread_count']
+
+    def unread_ids(self):
+        return {item['id'] for item in self.client.get('/api/notifications/', {'unread': 'true'}).json()['results']}
+
+    def mark_read(self, data=None):
+        response = self.client.post('/api/notifications/mark-read/', data or {}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['unread_count']
+
+    def test_ids_mark_only_targeted_notifications(self):
+        global_one = self.notify()
+        mine, also_mine = self.notify(self.user), self.notify(self.user)
+        theirs = self.notify(self.other)
+        self.assertEqual(self.unread_count(), 3)
+
+        self.assertEqual(self.mark_read({'ids': [global_one.pk, mine.pk, theirs.pk]}), 2)
+        self.assertEqual(self.unread_ids(), {global_one.pk, also_mine.pk})
+        # Global notifications never get per-user rows.
+        self.assertEqual(list(UserNotificationStatus.objects.values_list('user', 'notification')), [(self.user.pk, mine.pk)])
+
+    def test_up_to_moves_the_high_water_mark(self):
+        older = [self.notify(), self.notify(self.user)]
+        self.mark_read({'ids': [older[1].pk]})
+        newer = [self.notify(), self.notify(self.user)]
+
+        self.assertEqual(self.mark_read({'up_to': newer[0].pk}), 1)
+        self.assertEqual(self.unread_ids(), {newer[1].pk})
+        self.assertEqual(NotificationInboxState.objects.get(user=self.user).last_read_notification_id, newer[0].pk)
+        # Rows below the mark are redundant once it covers them.
+        self.assertFalse(UserNotificationStatus.objects.exists())
+
+        # The mark never moves back.
+        self.assertEqual(self.mark_read({'up_to': older[0].pk}), 1)
+        self.assertEqual(NotificationInboxState.objects.get(user=self.user).last_read_notification_id, newer[0].pk)
+
+    def test_marking_everything_read_hides_older_notifications(self):
+        self.notify()
+        self.notify(self.user)
+        self.assertEqual(self.mark_read(), 0)
+        results = self.client.get('/api/notifications/').json()['results']
+        self.assertEqual([item['is_read'] for item in results], [True, True])
+
+        newest = self.notify()
+        self.assertEqual(self.unread_ids(), {newest.pk})
+
+    def test_new_notifications_invalidate_the_cached_count(self):
+        self.notify(self.user)
+        self.assertEqual(get_unread_count(self.user), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user), 1)
+
+        self.notify()
+        self.assertEqual(get_unread_count(self.user), 2)
+        self.notify(self.user)
+        self.assertEqual(get_unread_count(self.user), 3)
+        # Someone else's notification leaves this user's cached count alone.
+        self.notify(self.other)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user), 3)
+
+
+class FakeChannelLayer:
+    """Records group_send calls and fails for the groups in `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    async def group_send(self, group, message):
+        if group in self.failing:
+            raise ConnectionError(f'{group} unreachable')
+        self.sent.append((group, message['message']['id']))
+
+
+@override_settings(NOTIFICATION_OUTBOX_MAX_ATTEMPTS=3)
+class NotificationOutboxDispatchTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='x', email='alice@example.com', student_id='111-111-114')
+        self.bob = User.objects.create_user(username='bob', password='x', email='bob@example.com', student_id='111-111-115')
+        self.user_type = ContentType.objects.get_for_model(User)
+        self.layer = FakeChannelLayer()
+        patcher = mock.patch('notes.outbox.get_channel_layer', return_value=self.layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def notify(self, recipient):
+        return create_notification(
+            actor_content_type=self.user_type, actor_object_id=recipient.pk, verb='commented on your note',
+            recipient=recipient,
+        )
+
+    def test_claimed_rows_and_groups_are_not_claimed_again(self):
+        first, second = self.notify(self.alice), self.notify(self.alice)
+        third = self.notify(self.bob)
+        claimed = claim_entries(1)
+        self.assertEqual([entry.notification_id for entry in claimed], [first.pk])
+
+        # Another dispatcher skips the claimed row and the rest of its group.
+        self.assertEqual([entry.notification_id for entry in claim_entries(10)], [third.pk])
+        self.assertEqual(claim_entries(10), [])
+
+        # A lapsed claim is taken over.
+        later = timezone.now() + timedelta(seconds=61)
+        self.assertEqual([entry.notification_id for entry in claim_entries(10, later)], [first.pk, second.pk, third.pk])
+
+    def test_a_failed_row_holds_back_its_group_only(self):
+        alice_first, alice_second = self.notify(self.alice), self.notify(self.alice)
+        bob_first = self.notify(self.bob)
+        self.layer.failing = {f'user_{self.alice.pk}'}
+
+        self.assertEqual(dispatch_batch(), {'sent': 1, 'retrying': 1, 'failed': 0})
+        self.assertEqual(self.layer.sent, [(f'user_{self.bob.pk}', bob_first.pk)])
+        failed, waiting = NotificationOutbox.objects.order_by('id')
+        self.assertEqual((failed.notification_id, failed.attempts), (alice_first.pk, 1))
+        self.assertIn('unreachable', failed.last_error)
+        self.assertEqual((waiting.notification_id, waiting.attempts), (alice_second.pk, 0))
+        self.assertIsNone(failed.claimed_until)
+        self.assertIsNone(waiting.claimed_until)
+
+        # Bob's group keeps flowing while Alice's backs off.
+        bob_second = self.notify(self.bob)
+        self.layer.failing = set()
+        self.assertEqual(dispatch_batch(), {'sent': 1, 'retrying': 0, 'failed': 0})
+        self.assertEqual(self.layer.sent[-1], (f'user_{self.bob.pk}', bob_second.pk))
+
+        # Once the backoff has passed, Alice's rows go out in order.
+        with mock.patch('notes.outbox.timezone.now', return_value=failed.next_attempt_at + timedelta(seconds=1)):
+            self.assertEqual(dispatch_batch(), {'sent': 2, 'retrying': 0, 'failed': 0})
+        self.assertEqual(self.layer.sent[-2:], [(f'user_{self.alice.pk}', alice_first.pk), (f'user_{self.alice.pk}', alice_second.pk)])
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_failures_back_off_and_are_given_up(self):
+        self.notify(self.alice)
+        self.layer.failing = {f'user_{self.alice.pk}'}
+        now = timezone.now()
+        for attempt, backoff in ((1, 2), (2, 4)):
+            with mock.patch('notes.outbox.timezone.now', return_value=now):
+                self.assertEqual(dispatch_batch(), {'sent': 0, 'retrying': 1, 'failed': 0})
+                # Not due again until the backoff has passed.
+                self.assertEqual(dispatch_batch(), {'sent': 0, 'retrying': 0, 'failed': 0})
+            entry = NotificationOutbox.objects.get()
+            self.assertEqual(entry.attempts, attempt)
+            self.assertEqual(entry.next_attempt_at - now, timedelta(seconds=backoff))
+            now = entry.next_attempt_at + timedelta(seconds=1)
+
+        with mock.patch('notes.outbox.timezone.now', return_value=now), self.assertLogs('notes.outbox', 'ERROR'):
+            self.assertEqual(dispatch_batch(), {'sent': 0, 'retrying': 0, 'failed': 1})
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual((entry.attempts, entry.failed_at), (3, now))
+
+        # Given-up rows are kept for the admin and never sent again.
+        self.layer.failing = set()
+        with mock.patch('notes.outbox.timezone.now', return_value=now + timedelta(days=1)):
+            self.assertEqual(dispatch_batch(), {'sent': 0, 'retrying': 0, 'failed': 0})
+        self.assertEqual(self.layer.sent, [])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class NoteBlobTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='x', email='owner@example.com', student_id='111-111-111')
+        self.category = NoteCategory.objects.create(name='Lecture')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        extraction = mock.patch('notes.signals.schedule_extraction')
+        extraction.start()
+        self.addCleanup(extraction.stop)
+        self.addCleanup(shutil.rmtree, os.path.join(MEDIA_ROOT, 'notes'), ignore_errors=True)
+
+    def upload(self, name, content, **data):
+        data = {'title': name, 'category': self.category.pk, 'file': SimpleUploadedFile(name, content), **data}
+        response = self.client.post('/api/notes/', data, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Note.objects.get(pk=response.json()['note']['id'])
+
+    def blob_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), MEDIA_ROOT)
+            for root, _, names in os.walk(os.path.join(MEDIA_ROOT, 'notes', 'blobs')) for name in names
+        )
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload('sorting.pdf', b'merge sort')
+        second = self.upload('sorting (copy).pdf', b'merge sort')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual((first.file.name, second.original_filename), (second.file.name, 'sorting (copy).pdf'))
+        self.assertEqual(NoteBlob.objects.get().ref_count, 2)
+        self.assertEqual(self.blob_files(), [first.file.name])
+
+    def test_reference_counts_follow_replace_and_delete(self):
+        first = self.upload('sorting.pdf', b'merge sort')
+        second = self.upload('copy.pdf', b'merge sort')
+        blob = first.blob
+
+        # Only staff may edit a note after creation, and only their own.
+        self.owner.is_staff = True
+        self.owner.save()
+        response = self.client.patch(f'/api/notes/{second.pk}/', {'file': SimpleUploadedFile('graphs.pdf', b'bfs')}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        second.refresh_from_db()
+        self.assertNotEqual(second.blob_id, blob.pk)
+        blob.refresh_from_db()
+        self.assertEqual((blob.ref_count, second.blob.ref_count), (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertFalse(NoteBlob.objects.filter(pk=blob.pk).exists())
+        self.assertEqual(self.blob_files(), [second.file.name])
+
+    def test_check_upload_then_create_by_hash(self):
+        content = b'merge sort'
+        sha256 = hashlib.sha256(content).hexdigest()
+        check = {'sha256': sha256, 'size': len(content)}
+        self.assertEqual(self.client.post('/api/notes/check-upload/', check, format='json').json(), {'exists': False})
+        response = self.client.post('/api/notes/', {'title': 'Sorting', 'category': self.category.pk, 'file_sha256': sha256}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('file_sha256', response.json())
+
+        stored = self.upload('sorting.pdf', content)
+        self.assertEqual(self.client.post('/api/notes/check-upload/', check, format='json').json(), {'exists': True})
+        self.assertEqual(self.client.post('/api/notes/check-upload/', {**check, 'size': 1}, format='json').json(), {'exists': False})
+
+        response = self.client.post('/api/notes/', {
+            'title': 'Sorting again', 'category': self.category.pk, 'file_sha256': sha256, 'original_filename': 'mine.pdf',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        note = Note.objects.get(pk=response.json()['note']['id'])
+        self.assertEqual((note.blob_id, note.file.name, note.file_hash), (stored.blob_id, stored.file.name, sha256))
+        self.assertEqual(note.original_filename, 'mine.pdf')
+        self.assertEqual(NoteBlob.objects.get().ref_count, 2)
+
+    def test_a_file_left_by_a_rollback_is_reused(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.upload('sorting.pdf', b'merge sort')
+            raise RuntimeError
+        self.assertFalse(NoteBlob.objects.exists())
+        [left] = self.blob_files()
+
+        note = self.upload('sorting.pdf', b'merge sort')
+        self.assertEqual(note.file.name, left)
+        self.assertEqual(self.blob_files(), [left])
+
+    def test_orphaned_blob_files_are_deleted(self):
+        note = self.upload('sorting.pdf', b'merge sort')
+        storage = NoteBlob._meta.get_field('file').storage
+        orphan = storage.save('notes/blobs/ab/abc.pdf', ContentFile(b'left behind'))
+
+        # Files younger than the grace period may belong to an upload in flight.
+        self.assertEqual(delete_orphaned_blob_files(), 0)
+        later = timezone.now() + timedelta(hours=2)
+        self.assertEqual(delete_orphaned_blob_files(later, dry_run=True), 1)
+        self.assertEqual(delete_orphaned_blob_files(later), 1)
+        self.assertFalse(storage.exists(orphan))
+        self.assertEqual(self.blob_files(), [note.file.name])
+
+
+def pdf_bytes(*pages):
+    """A minimal PDF with one line of Helvetica text per page."""
+    count = len(pages)
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % (4 + 2 * n) for n in range(count)), count),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for n, text in enumerate(pages):
+        stream = b'BT /F1 12 Tf 72 720 Td (%s) Tj ET' % text.encode('latin-1')
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (5 + 2 * n))
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+    out = io.BytesIO(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    out.write(b''.join(b'%010d 00000 n \n' % offset for offset in offsets))
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def docx_bytes(*pages):
+    """A minimal DOCX with one paragraph per page, separated by page breaks."""
+    w = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+    page_break = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+    body = page_break.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in pages)
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as archive:
+        archive.writestr('word/document.xml', f'<w:document xmlns:w="{w}"><w:body>{body}</w:body></w:document>')
+    return out.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class NoteContentExtractionTests(TestCase):
+    """notes.extraction runs in worker processes; notes.content_store stores results by file hash."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='x', email='owner@example.com', student_id='111-111-111')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.addCleanup(shutil.rmtree, os.path.join(MEDIA_ROOT, 'notes'), ignore_errors=True)
+
+    def upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/notes/', {'title': name, 'file': SimpleUploadedFile(name, content)}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Note.objects.get(pk=response.json()['note']['id'])
+
+    def test_pdf_and_docx_pages(self):
+        for name, content, extractor in (
+            ('slides.pdf', pdf_bytes('Sorting basics', 'Merge sort'), 'pypdf'),
+            ('notes.docx', docx_bytes('Sorting basics', 'Merge sort'), 'docx'),
+        ):
+            path = os.path.join(MEDIA_ROOT, name)
+            with open(path, 'wb') as f:
+                f.write(content)
+            self.addCleanup(os.remove, path)
+            result = process_file(path)
+            self.assertEqual((result['status'], result['extractor']), ('ready', extractor), name)
+            self.assertEqual(result['text'], 'Sorting basics\nMerge sort', name)
+            self.assertEqual(result['page_offsets'], [0, 15], name)
+            self.assertEqual(result['file_hash'], hashlib.sha256(content).hexdigest())
+            self.assertEqual(process_file(path, known_hashes={result['file_hash']})['status'], 'known')
+
+    def test_extraction_runs_in_the_process_pool(self):
+        with mock.patch('notes.signals.schedule_extraction'):
+            note = self.upload('slides.pdf', pdf_bytes('Dynamic programming'))
+        executor = ProcessPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        # The result is stored from the pool's callback thread; capture it there
+        # and store it here, where the test transaction is visible.
+        with mock.patch('notes.content_store.get_executor', return_value=executor), \
+                mock.patch('notes.content_store.store_extraction_result') as store, \
+                override_settings(NOTE_EXTRACTION_EAGER=False):
+            content_store._submit(note.pk)
+            executor.shutdown(wait=True)
+        (note_id, result), _ = store.call_args
+        self.assertEqual((note_id, result['status'], result['text']), (note.pk, 'ready', 'Dynamic programming'))
+        self.assertFalse(content_store._in_flight)
+
+        content_store.store_extraction_result(note_id, result)
+        content = NoteContent.objects.get()
+        self.assertEqual((content.file_hash, content.status, content.page_count), (result['file_hash'], NoteContent.Status.READY, 1))
+        note.refresh_from_db()
+        self.assertEqual(note.file_hash, content.file_hash)
+
+    @override_settings(NOTE_EXTRACTION_EAGER=True)
+    def test_identical_files_share_one_content_row(self):
+        content = docx_bytes('Graph traversal')
+        first = self.upload('graphs.docx', content)
+        with mock.patch('notes.content_store.process_file') as process:
+            second = self.upload('graphs copy.docx', content)
+        process.assert_not_called()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.file_hash, second.file_hash)
+        self.assertEqual(NoteContent.objects.get().text, 'Graph traversal')
+
+    @override_settings(NOTE_EXTRACTION_EAGER=True)
+    def test_failed_and_unsupported_files_are_recorded(self):
+        self.upload('broken.pdf', b'%PDF-1.4 not really a pdf')
+        self.upload('diagram.png', b'\x89PNG not extracted')
+        failed, unsupported = NoteContent.objects.order_by('status')
+        self.assertEqual((failed.status, failed.text, failed.page_count), (NoteContent.Status.FAILED, '', 0))
+        self.assertTrue(failed.error)
+        self.assertEqual(unsupported.status, NoteContent.Status.UNSUPPORTED)
+        self.assertIn('.png', unsupported.error)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT, NOTE_UPLOAD_SESSION_DIR=os.path.join(MEDIA_ROOT, 'upload_sessions'),
+    NOTE_UPLOAD_MIN_CHUNK_SIZE=4,
+)
+class UploadSessionTests(TestCase):
+    content = b'0123456789'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='x', email='owner@example.com', student_id='111-111-111')
+        self.category = NoteCategory.objects.create(name='Lecture')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        extraction = mock.patch('notes.signals.schedule_extraction')
+        extraction.start()
+        self.addCleanup(extraction.stop)
+        for directory in ('notes', 'upload_sessions'):
+            self.addCleanup(shutil.rmtree, os.path.join(MEDIA_ROOT, directory), ignore_errors=True)
+
+    def open_session(self, **data):
+        data = {'filename': 'sorting.pdf', 'size': len(self.content), 'chunk_size': 4, **data}
+        response = self.client.post('/api/upload-sessions/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return UploadSession.objects.get(pk=response.json()['id'])
+
+    def put_chunk(self, session, number, data, sha256=None):
+        return self.client.generic(
+            'PUT', f'/api/upload-sessions/{session.pk}/chunks/{number}/', data,
+            content_type='application/octet-stream', HTTP_X_CHUNK_SHA256=sha256 or hashlib.sha256(data).hexdigest(),
+        )
+
+    def upload_all(self, session):
+        for number in range(3):
+            response = self.put_chunk(session, number, self.content[number * 4:number * 4 + 4])
+            self.assertEqual(response.status_code, 200, response.content)
+
+    def finalize(self, session):
+        return self.client.post(f'/api/upload-sessions/{session.pk}/finalize/', {'title': 'Sorting', 'category': self.category.pk}, format='json')
+
+    def part_file(self, session):
+        with open(session.path, 'rb') as f:
+            return f.read()
+
+    def test_a_chunk_with_a_wrong_checksum_is_cut_off(self):
+        session = self.open_session()
+        self.put_chunk(session, 0, b'0123')
+        response = self.put_chunk(session, 1, b'4567', sha256='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['next_chunk'], 1)
+        self.assertEqual(self.part_file(session), b'0123')
+        session.refresh_from_db()
+        self.assertEqual(session.received, 4)
+
+    def test_a_repeated_chunk_is_acknowledged_without_a_write(self):
+        session = self.open_session()
+        self.put_chunk(session, 0, b'0123')
+        response = self.put_chunk(session, 0, b'abcd')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'received': 4, 'next_chunk': 1, 'duplicate': True})
+        self.assertEqual(self.part_file(session), b'0123')
+
+    def test_a_chunk_ahead_of_the_upload_is_refused(self):
+        session = self.open_session()
+        response = self.put_chunk(session, 2, b'89')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['next_chunk'], 0)
+        self.assertEqual(self.part_file(session), b'')
+
+    def test_short_chunks_are_refused(self):
+        session = self.open_session()
+        self.assertEqual(self.put_chunk(session, 0, b'012').status_code, 400)
+
+        # A body that ends before its Content-Length is cut off again.
+        with self.assertRaisesMessage(ChunkRejected, 'ended 1 bytes early'):
+            write_chunk(session, 0, io.BytesIO(b'012'), 4, hashlib.sha256(b'0123').hexdigest())
+        self.assertEqual(self.part_file(session), b'')
+        session.refresh_from_db()
+        self.assertEqual(session.received, 0)
+
+    def test_finalize_creates_the_note(self):
+        session = self.open_session(sha256=hashlib.sha256(self.content).hexdigest())
+        self.upload_all(session)
+        response = self.finalize(session)
+        self.assertEqual(response.status_code, 201, response.content)
+        note = Note.objects.get(pk=response.json()['note']['id'])
+        self.assertEqual((note.original_filename, note.file_hash), ('sorting.pdf', hashlib.sha256(self.content).hexdigest()))
+        with note.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(note.blob.ref_count, 1)
+        self.assertEqual(UploadSession.objects.get().note, note)
+        self.assertFalse(os.path.exists(session.path))
+
+    def test_a_repeated_finalize_returns_the_same_note(self):
+        session = self.open_session()
+        self.upload_all(session)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.finalize(session)
+        second = self.finalize(session)
+        self.assertEqual(second.status_code, 201, second.content)
+        self.assertEqual(second.json(), first.json())
+        note = Note.objects.get()
+        self.assertEqual(note.blob.ref_count, 1)
+        self.assertEqual(self.client.get(f'/api/upload-sessions/{session.pk}/').json()['note'], note.pk)
+        # Finalized sessions don't count as uploads in progress.
+        with override_settings(NOTE_UPLOAD_MAX_OPEN_SESSIONS=1):
+            self.open_session()
+
+    def test_finalize_with_a_mismatched_declared_hash_discards_the_session(self):
+        session = self.open_session(sha256='0' * 64)
+        self.upload_all(session)
+        response = self.finalize(session)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(session.path))
+        self.assertFalse(Note.objects.exists())
+
+    def test_a_failed_note_save_leaves_the_session_intact(self):
+        session = self.open_session()
+        self.upload_all(session)
+        with mock.patch('notes.serializers.NoteSerializer.create', side_effect=DatabaseError('disk full')), \
+                self.assertRaises(DatabaseError):
+            self.finalize(session)
+        self.assertTrue(UploadSession.objects.filter(pk=session.pk).exists())
+        self.assertEqual(self.part_file(session), self.content)
+
+        # The client can simply finalize again.
+        self.assertEqual(self.finalize(session).status_code, 201)
+
+    def test_expire_sessions_removes_idle_sessions_and_stray_files(self):
+        idle, active = self.open_session(), self.open_session()
+        UploadSession.objects.filter(pk=idle.pk).update(expires_at=timezone.now())
+        stray, young = (os.path.join(settings.NOTE_UPLOAD_SESSION_DIR, name) for name in ('998.part', '999.part'))
+        for path in (stray, young):
+            open(path, 'wb').close()
+        old = (timezone.now() - timedelta(seconds=settings.NOTE_UPLOAD_SESSION_TTL + 60)).timestamp()
+        os.utime(stray, (old, old))
+
+        self.assertEqual(expire_sessions(dry_run=True), (1, 1))
+        self.assertTrue(os.path.exists(stray))
+        self.assertEqual(expire_sessions(), (1, 1))
+        self.assertEqual(list(UploadSession.objects.values_list('pk', flat=True)), [active.pk])
+        self.assertFalse(os.path.exists(idle.path))
+        self.assertFalse(os.path.exists(stray))
+        # Young files may belong to a session that is still being created.
+        self.assertTrue(os.path.exists(young))
+        self.assertTrue(os.path.exists(active.path))
+
+
+class NoteCounterTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='x', email='owner@example.com', student_id='111-111-111')
+        self.readers = [
+            User.objects.create_user(username=f'reader{i}', password='x', email=f'reader{i}@example.com', student_id=f'111-111-12{i}')
+            for i in range(3)
+        ]
+        extraction = mock.patch('notes.signals.schedule_extraction')
+        extraction.start()
+        self.addCleanup(extraction.stop)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.note = Note.objects.create(uploader=self.owner, title='Sorting', file='notes/user_1/sorting.pdf', is_approved=True)
+
+    def counters(self):
+        return Note.objects.filter(pk=self.note.pk).values(
+            'likes_count', 'bookmarks_count', 'comments_count', 'rating_sum', 'rating_count', 'average_rating',
+        ).get()
+
+    def test_signals_keep_the_counters(self):
+        for reader in self.readers[:2]:
+            Like.objects.create(note=self.note, user=reader)
+            Comment.objects.create(note=self.note, user=reader, text='Thanks')
+        Bookmark.objects.create(note=self.note, user=self.readers[0])
+        ratings = [StarRating.objects.create(note=self.note, user=reader, stars=stars) for reader, stars in zip(self.readers, (1, 2, 2))]
+        self.assertEqual(self.counters(), {
+            'likes_count': 2, 'bookmarks_count': 1, 'comments_count': 2,
+            'rating_sum': 5, 'rating_count': 3, 'average_rating': 1.67,
+        })
+
+        rating = StarRating.objects.get(pk=ratings[0].pk)
+        rating.stars = 5
+        rating.save()
+        Like.objects.filter(user=self.readers[0]).delete()
+        ratings[1].delete()
+        self.assertEqual(self.counters(), {
+            'likes_count': 1, 'bookmarks_count': 1, 'comments_count': 2,
+            'rating_sum': 7, 'rating_count': 2, 'average_rating': 3.5,
+        })
+
+    def test_full_saves_leave_the_counters_alone(self):
+        note = Note.objects.get(pk=self.note.pk)
+        # Engagement that lands after `note` was loaded.
+        Like.objects.create(note=self.note, user=self.readers[0])
+        StarRating.objects.create(note=self.note, user=self.readers[0], stars=4)
+        Note.objects.filter(pk=note.pk).update(download_count=3)
+
+        note.title = 'Sorting, revised'
+        note.save()
+        stored = Note.objects.get(pk=note.pk)
+        self.assertEqual(stored.title, 'Sorting, revised')
+        self.assertEqual((stored.likes_count, stored.rating_count, stored.average_rating, stored.download_count), (1, 1, 4.0, 3))
+
+    def test_approval_counts_ratings_added_since_the_note_was_loaded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            note = Note.objects.create(uploader=self.owner, title='Graphs', file='notes/user_1/graphs.pdf')
+        note = Note.objects.get(pk=note.pk)
+        StarRating.objects.create(note=note, user=self.readers[0], stars=4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            note.is_approved = True
+            note.save()
+        stats = UserStats.objects.get(user=self.owner)
+        self.assertEqual((stats.approved_rating_sum, stats.approved_rating_count), (4, 1))
+        contributor = Contributor.objects.get(user=self.owner)
+        self.assertEqual((contributor.note_contribution_count, contributor.rating_sum, contributor.rating_count), (2, 4, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            note.is_approved = False
+            note.save()
+        stats.refresh_from_db()
+        contributor.refresh_from_db()
+        self.assertEqual((stats.approved_rating_sum, stats.approved_rating_count), (0, 0))
+        self.assertEqual((contributor.note_contribution_count, contributor.rating_sum, contributor.rating_count), (1, 0, 0))
+
+    def test_repair_note_counters(self):
+        Like.objects.create(note=self.note, user=self.readers[0])
+        for reader, stars in zip(self.readers, (1, 2, 2)):
+            StarRating.objects.create(note=self.note, user=reader, stars=stars)
+        expected = self.counters()
+        Note.objects.filter(pk=self.note.pk).update(likes_count=7, rating_sum=0, average_rating=0.0)
+
+        out = io.StringIO()
+        call_command('repair_note_counters', '--dry-run', stdout=out)
+        self.assertIn('1 notes have drifted counters', out.getvalue())
+        self.assertEqual(self.counters()['likes_count'], 7)
+
+        call_command('repair_note_counters', stdout=io.StringIO())
+        self.assertEqual(self.counters(), expected)
+
+
+class ContributorTests(TestCase):
+    """notes.contributors: queued deltas and the update_contributors rebuild."""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='x', email=f'user{i}@example.com', student_id=f'111-111-13{i}')
+            for i in range(4)
+        ]
+        self.reader = User.objects.create_user(username='reader', password='x', email='reader@example.com', student_id='111-111-139')
+        extraction = mock.patch('notes.signals.schedule_extraction')
+        extraction.start()
+        self.addCleanup(extraction.stop)
+
+    def profile(self, user):
+        return Contributor.objects.filter(user=user).values_list(
+            'note_contribution_count', 'rating_sum', 'rating_count', 'average_star_rating',
+        ).first()
+
+    def test_deltas_are_merged_into_one_update_per_user(self):
+        first, second = self.users[:2]
+        for user in (first, second):
+            Contributor.objects.create(user=user, note_contribution_count=1, rating_sum=4, rating_count=1, average_star_rating=4.0)
+        with mock.patch('notes.contributors.apply_contributor_deltas', wraps=apply_contributor_deltas) as apply_deltas, \
+                self.captureOnCommitCallbacks(execute=True):
+            queue_contributor_update(first.pk, note_contribution_count=1)
+            queue_contributor_update(first.pk, rating_sum=5, rating_count=1)
+            queue_contributor_update(second.pk, rating_sum=-4, rating_count=-1)
+            queue_contributor_update(first.pk, rating_sum=3, rating_count=1)
+            self.assertEqual(apply_deltas.call_count, 0)
+        self.assertEqual(sorted(call.args for call in apply_deltas.call_args_list), [
+            (first.pk, {'note_contribution_count': 1, 'rating_sum': 8, 'rating_count': 2}),
+            (second.pk, {'note_contribution_count': 0, 'rating_sum': -4, 'rating_count': -1}),
+        ])
+        self.assertEqual(self.profile(first), (2, 12, 3, 4.0))
+        self.assertEqual(self.profile(second), (1, 0, 0, 0.0))
+
+    def test_rolled_back_savepoints_drop_their_deltas(self):
+        user = self.users[0]
+        Contributor.objects.create(user=user, note_contribution_count=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_contributor_update(user.pk, rating_sum=5, rating_count=1)
+            try:
+                with transaction.atomic():
+                    queue_contributor_update(user.pk, note_contribution_count=1, rating_sum=1, rating_count=1)
+                    raise DatabaseError('rolled back')
+            except DatabaseError:
+                pass
+            with transaction.atomic():
+                queue_contributor_update(user.pk, rating_sum=3, rating_count=1)
+        self.assertEqual(self.profile(user), (1, 8, 2, 4.0))
+
+    def create_notes(self):
+        """user0: rated notes, stale profile; user1: no profile; user2: only a pending note; user3: up to date."""
+        raters = [self.reader] + [
+            User.objects.create_user(username=f'rater{i}', password='x', email=f'rater{i}@example.com', student_id=f'111-111-14{i}')
+            for i in range(2)
+        ]
+        for user, approved, stars in ((0, True, (5, 4)), (0, True, (2,)), (1, True, ()), (2, False, ()), (3, True, (4,))):
+            note = Note.objects.create(uploader=self.users[user], title='Note', file='notes/user_1/note.pdf', is_approved=approved)
+            for rater, value in zip(raters, stars):
+                StarRating.objects.create(note=note, user=rater, stars=value)
+        # Profiles as they might have drifted; nothing above was committed, so signals wrote none.
+        Contributor.objects.create(user=self.users[0], note_contribution_count=1, rating_sum=5, rating_count=1, average_star_rating=5.0)
+        Contributor.objects.create(user=self.users[2], note_contribution_count=1)
+        Contributor.objects.create(user=self.users[3], note_contribution_count=1, rating_sum=4, rating_count=1, average_star_rating=4.0)
+        return [(1, 5, 1, 5.0), None, (1, 0, 0, 0.0), (1, 4, 1, 4.0)], [(2, 11, 3, 3.67), (1, 0, 0, 0.0), None, (1, 4, 1, 4.0)]
+
+    def profiles(self):
+        return [self.profile(user) for user in self.users]
+
+    def test_rebuild_all_contributors(self):
+        before, after = self.create_notes()
+        summary = {'created': 1, 'updated': 1, 'unchanged': 1, 'deleted': 1}
+        self.assertEqual(rebuild_all_contributors(batch_size=1, dry_run=True), summary)
+        self.assertEqual(self.profiles(), before)
+
+        self.assertEqual(rebuild_all_contributors(batch_size=1), summary)
+        self.assertEqual(self.profiles(), after)
+        self.assertEqual(rebuild_all_contributors(), {'created': 0, 'updated': 0, 'unchanged': 3, 'deleted': 0})
+
+    def test_update_contributors_command(self):
+        before, after = self.create_notes()
+        out = io.StringIO()
+        call_command('update_contributors', '--dry-run', stdout=out)
+        self.assertIn('Dry run, nothing written: 1 created, 1 updated, 1 unchanged, 1 deleted', out.getvalue())
+        self.assertEqual(self.profiles(), before)
+
+        out = io.StringIO()
+        call_command('update_contributors', '--rebuild', '--batch-size', '2', stdout=out)
+        self.assertIn('Rebuilt contributor profiles: 1 created, 1 updated, 1 unchanged, 1 deleted', out.getvalue())
+        self.assertEqual(self.profiles(), after)
+
+        Contributor.objects.all().delete()
+        out = io.StringIO()
+        call_command('update_contributors', stdout=out)
+        self.assertIn('Successfully updated 3 contributor profiles.', out.getvalue())
+        self.assertEqual(self.profiles(), after)
+
+
+@override_settings(NOTIFICATION_OUTBOX_ASGI_DISPATCHER=False)
+class WebSocketAuthTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='x', email='reader@example.com', student_id='111-111-112')
+        ws_auth._token_cache.clear()
+        self.addCleanup(ws_auth._token_cache.clear)
+        async_to_sync(get_channel_layer().flush)()
+        self.application = ws_auth.JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+
+    def token(self, user=None, **lifetime):
+        token = AccessToken.for_user(user or self.user)
+        if lifetime:
+            token.set_exp(lifetime=timedelta(**lifetime))
+        return str(token)
+
+    async def connect(self, path='/ws/notifications/', subprotocols=None):
+        """Connects and returns the accepted subprotocol and the user groups the socket joined."""
+        communicator = WebsocketCommunicator(self.application, path, subprotocols=subprotocols)
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        groups = {group for group, channels in get_channel_layer().groups.items() if group.startswith('user_') and channels}
+        await communicator.disconnect()
+        return subprotocol, groups
+
+    async def test_token_in_the_query_string(self):
+        self.assertEqual(await self.connect(f'/ws/notifications/?token={self.token()}'), (None, {f'user_{self.user.pk}'}))
+
+    async def test_token_as_subprotocol_is_echoed(self):
+        self.assertEqual(await self.connect(subprotocols=['jwt', self.token()]), ('jwt', {f'user_{self.user.pk}'}))
+
+    async def test_expired_or_invalid_tokens_stay_anonymous(self):
+        for token in (self.token(seconds=-1), 'not-a-token', self.token()[:-4] + 'abcd'):
+            self.assertEqual(await self.connect(f'/ws/notifications/?token={token}'), (None, set()), token)
+        self.assertEqual(await self.connect(subprotocols=['jwt', 'not-a-token']), ('jwt', set()))
+
+    async def test_inactive_users_are_rejected(self):
+        await database_sync_to_async(User.objects.filter(pk=self.user.pk).update)(is_active=False)
+        self.assertEqual(await self.connect(f'/ws/notifications/?token={self.token()}'), (None, set()))
+
+    def test_verified_tokens_are_cached_until_they_expire(self):
+        token = self.token()
+        self.assertEqual(ws_auth.validate_token(token), self.user.pk)
+        with mock.patch('rest_framework_simplejwt.tokens.AccessToken', side_effect=AssertionError('verified again')):
+            self.assertEqual(ws_auth.validate_token(token), self.user.pk)
+
+        # An entry past the token's expiry is verified again (and rejected).
+        key = ws_auth._cache_key(token)
+        ws_auth._token_cache[key] = (self.user.pk, time.time() - 1)
+        with mock.patch('rest_framework_simplejwt.tokens.AccessToken', side_effect=TokenError('expired')):
+            self.assertIsNone(ws_auth.validate_token(token))
+        self.assertNotIn(key, ws_auth._token_cache)
+
+    @override_settings(WS_JWT_CACHE_SIZE=2)
+    def test_the_least_recently_used_token_is_evicted(self):
+        tokens = [self.token(minutes=minutes) for minutes in (10, 20, 30)]
+        for token in tokens[:2]:
+            ws_auth.validate_token(token)
+        ws_auth.validate_token(tokens[0])
+        ws_auth.validate_token(tokens[2])
+        self.assertEqual(list(ws_auth._token_cache), [ws_auth._cache_key(tokens[0]), ws_auth._cache_key(tokens[2])])
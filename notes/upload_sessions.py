@@ -0,0 +1,180 @@
+# notes/upload_sessions.py
+"""
+Resumable chunked uploads.
+
+A client opens a session with the file's name and size, PUTs numbered
+chunks (raw bytes plus an X-Chunk-SHA256 header) and finalizes the session
+into a Note. Each chunk is streamed straight to its offset in the session's
+.part file while it is hashed, so nothing is buffered in memory or copied
+through a temporary file; a chunk whose checksum doesn't match is cut off
+again. Finalizing hashes the completed file once and, after the note row is
+saved, moves it into blob storage (notes.blobs) with a rename; the session
+is left untouched when the note can't be saved. A finalized session records
+its note and stays until it expires, so a client retrying a finalize whose
+response it never saw gets the same note back instead of an error.
+
+Chunks are accepted in order: a chunk that was already received is
+acknowledged without being written (the client may not have seen the
+response), a chunk past the received bytes is refused so the client resumes
+from `next_chunk`.
+"""
+
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from .blobs import get_or_store_blob
+from .extraction import hash_file
+from .models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class ChunkRejected(Exception):
+    """The chunk can't be written; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class SessionFile(File):
+    # FileSystemStorage moves files that expose temporary_file_path() instead of copying them.
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def new_expiry():
+    return timezone.now() + timedelta(seconds=settings.NOTE_UPLOAD_SESSION_TTL)
+
+
+def create_session(user, filename, size, chunk_size=None, sha256=''):
+    session = UploadSession.objects.create(
+        user=user,
+        filename=os.path.basename(filename)[:255],
+        size=size,
+        chunk_size=chunk_size or settings.NOTE_UPLOAD_CHUNK_SIZE,
+        sha256=sha256,
+        expires_at=new_expiry(),
+    )
+    os.makedirs(settings.NOTE_UPLOAD_SESSION_DIR, exist_ok=True)
+    open(session.path, 'wb').close()
+    return session
+
+
+def write_chunk(session, number, stream, length, sha256):
+    """
+    Streams chunk `number` from `stream` into the session file. Returns False
+    for a chunk that was already received, True once it is written.
+    """
+    offset = number * session.chunk_size
+    if offset >= session.size:
+        raise ChunkRejected(f"Chunk {number} is past the end of the file ({session.chunk_count} chunks).")
+    if offset < session.received:
+        return False
+    if offset > session.received:
+        raise ChunkRejected(f"Chunk {number} is ahead of the upload; send chunk {session.next_chunk} next.", status=409)
+    expected = min(session.chunk_size, session.size - offset)
+    if length != expected:
+        raise ChunkRejected(f"Chunk {number} must be {expected} bytes, got {length}.")
+
+    digest = hashlib.sha256()
+    with open(session.path, 'r+b') as f:
+        f.seek(offset)
+        remaining = length
+        while remaining:
+            data = stream.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            digest.update(data)
+            f.write(data)
+            remaining -= len(data)
+        if remaining or digest.hexdigest() != sha256:
+            f.truncate(offset)
+            if remaining:
+                raise ChunkRejected(f"Chunk {number} ended {remaining} bytes early.")
+            raise ChunkRejected(f"Chunk {number} doesn't match its X-Chunk-SHA256.")
+
+    session.received = offset + length
+    session.expires_at = new_expiry()
+    session.save(update_fields=['received', 'expires_at', 'updated_at'])
+    return True
+
+
+def verify_session(session):
+    """
+    Returns the hash of a completely received session file; raises
+    ChunkRejected if the file is incomplete or, discarding the session,
+    doesn't match the declared hash.
+    """
+    if session.received != session.size:
+        raise ChunkRejected(f"The upload is incomplete: {session.received} of {session.size} bytes received.", status=409)
+    sha256 = hash_file(session.path)
+    if session.sha256 and sha256 != session.sha256:
+        discard_session(session)
+        raise ChunkRejected("The uploaded file doesn't match the declared sha256; start a new session.")
+    return sha256
+
+
+def finalize_session(session, note, sha256):
+    """
+    Moves a verified session file into blob storage and records `note` on
+    the session, which is kept until it expires. Returns the blob. Called in
+    the transaction that saves the note, after the note itself; a .part file
+    that isn't moved is removed on commit.
+    """
+    path = session.path
+    with open(path, 'rb') as f:
+        blob, created = get_or_store_blob(SessionFile(f, name=session.filename), sha256=sha256)
+    if not created:
+        logger.info(f"Upload session {session.pk} matches stored blob {sha256[:12]}; not stored again.")
+    session.note = note
+    session.expires_at = new_expiry()
+    session.save(update_fields=['note', 'expires_at', 'updated_at'])
+    transaction.on_commit(partial(remove_session_file, path))
+    return blob
+
+
+def remove_session_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard_session(session):
+    remove_session_file(session.path)
+    session.delete()
+
+
+def expire_sessions(now=None, dry_run=False):
+    """
+    Deletes sessions idle past their expiry and .part files that have no
+    session left. Returns (sessions, stray_files).
+    """
+    now = now or timezone.now()
+    expired = list(UploadSession.objects.filter(expires_at__lte=now))
+    if not dry_run:
+        for session in expired:
+            discard_session(session)
+
+    stray = 0
+    directory = settings.NOTE_UPLOAD_SESSION_DIR
+    if os.path.isdir(directory):
+        live = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+        cutoff = (now - timedelta(seconds=settings.NOTE_UPLOAD_SESSION_TTL)).timestamp()
+        for entry in os.scandir(directory):
+            # Young files may belong to a session that is still being created.
+            if entry.name.endswith('.part') and entry.name not in live and entry.stat().st_mtime < cutoff:
+                stray += 1
+                if not dry_run:
+                    os.remove(entry.path)
+    return len(expired), stray
@@ -0,0 +1,42 @@
+# notes/uploads.py
+"""
+Upload handlers that hash files while they stream in.
+
+Drop-in replacements for Django's default handlers (FILE_UPLOAD_HANDLERS):
+the finished UploadedFile gets a `sha256` attribute, which notes.blobs uses to
+find duplicates without reading the file again.
+"""
+
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingMixin:
+    def new_file(self, *args, **kwargs):
+        # Set first: the memory handler ends new_file() by raising StopFutureHandlers.
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def hash_chunk(self, raw_data):
+        self.digest.update(raw_data)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.sha256 = self.digest.hexdigest()
+        return uploaded
+
+
+class HashingMemoryFileUploadHandler(HashingMixin, MemoryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        # Larger files are passed on to the temporary-file handler, which hashes them.
+        if self.activated:
+            self.hash_chunk(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+
+class HashingTemporaryFileUploadHandler(HashingMixin, TemporaryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        self.hash_chunk(raw_data)
+        return super().receive_data_chunk(raw_data, start)
@@ -11,8 +11,12 @@ from .views import (
                     MyNoteRequestsView, 
                     FacultyViewSet, 
                     ContributorViewSet,
+                    NotificationViewSet,
+                    UploadSessionViewSet,
                     PublicNoteRequestViewSet,
-                    test_note_request_create
+                    test_note_request_create,
+                    response_cache_stats,
+                    ReferenceDataView
                 )
 
 
@@ -26,6 +30,8 @@ router.register(r'courses', CourseViewSet, basename='course')
 router.register(r'star-ratings', StarRatingViewSet, basename='star-rating')
 router.register(r'comments', CommentViewSet, basename='comment')
 router.register(r'notes', NoteViewSet, basename='note')
+router.register(r'notifications', NotificationViewSet, basename='notification')
+router.register(r'upload-sessions', UploadSessionViewSet, basename='upload-session')
 
 urlpatterns = [
     # Place specific paths before router to avoid conflicts
@@ -35,6 +41,8 @@ urlpatterns = [
     # Legacy paths to support existing frontend calls
     path('my-note-requests/', MyNoteRequestsView.as_view(), name='my-note-request-list-create-legacy'),
     path('notes/my-note-requests/', MyNoteRequestsView.as_view(), name='my-note-request-list-create-notes-prefix'),
+    path('notes/cache-stats/', response_cache_stats, name='note-response-cache-stats'),
+    path('reference/', ReferenceDataView.as_view(), name='reference-data'),
     path('', include(router.urls)), 
     
 
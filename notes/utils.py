@@ -0,0 +1,70 @@
+# notes/utils.py
+
+import threading
+
+from django.db import connection, transaction
+
+_local = threading.local()
+
+
+def is_on_commit_queued(callback):
+    """True if `callback` is waiting for the current transaction to commit."""
+    return connection.in_atomic_block and any(func is callback for _sids, func, _robust in connection.run_on_commit)
+
+
+def on_commit_once(callback):
+    """
+    Registers `callback` to run after the current transaction commits, unless
+    the same callback is already queued for it. Outside an atomic block the
+    callback runs immediately, like transaction.on_commit().
+    """
+    if is_on_commit_queued(callback):
+        return
+    transaction.on_commit(callback)
+
+
+def commit_batch(factory):
+    """
+    Returns the batch collecting deferred work of one kind for the current
+    transaction. The first call in a transaction creates it with `factory()`
+    and registers it with on_commit, so the batch (a callable) runs once
+    after commit with everything added to it. A batch discarded by a rollback
+    is replaced on the next call. Returns None outside an atomic block, where
+    callers should do the work immediately.
+    """
+    if not connection.in_atomic_block:
+        return None
+    batches = getattr(_local, 'batches', None)
+    if batches is None:
+        batches = _local.batches = {}
+    entry = batches.get(factory)
+    if entry is not None and is_on_commit_queued(entry[1]):
+        return entry[0]
+
+    batch = factory()
+
+    def run():
+        if batches.get(factory) is entry:
+            del batches[factory]
+        batch()
+
+    entry = batches[factory] = (batch, run)
+    transaction.on_commit(run)
+    return batch
+
+
+def move_batch_last(factory):
+    """
+    Moves the queued batch for `factory` behind the on_commit callbacks
+    registered after it, so it runs once they have. The entry keeps the
+    savepoints it was registered in, so rollbacks still discard it as before.
+    """
+    entry = getattr(_local, 'batches', {}).get(factory)
+    if entry is None:
+        return
+    hooks = connection.run_on_commit
+    # Searched from the end: the batch was moved last on the previous call.
+    for index in range(len(hooks) - 1, -1, -1):
+        if hooks[index][1] is entry[1]:
+            hooks.append(hooks.pop(index))
+            return
@@ -1,52 +1,96 @@
 # notes/views.py
 
-from rest_framework import viewsets, permissions, status, serializers, generics
+from rest_framework import viewsets, permissions, status, serializers, generics, mixins
 import rest_framework
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.http import FileResponse, Http404
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.views import APIView
 import os
 from django.views.decorators.cache import never_cache
 from django.utils.decorators import method_decorator
-import mimetypes
+from django.utils.functional import cached_property
+from django.utils import timezone
 from rest_framework.reverse import reverse
-from django.db.models import Exists, OuterRef
-from rest_framework.pagination import PageNumberPagination
-from .models import Note, StarRating, Comment, Like, Bookmark, Department, Course, NoteCategory, NoteRequest, Faculty, Contributor
-from .serializers import NoteSerializer, StarRatingSerializer, CommentSerializer, LikeSerializer, BookmarkSerializer, DepartmentSerializer, CourseSerializer, NoteCategorySerializer, NoteRequestSerializer,  FacultySerializer, ContributorSerializer
+from django.db.models import Exists, OuterRef, Prefetch
+from .pagination import KeysetPagination, NotificationPagination, StandardResultsSetPagination
+from .models import Note, NoteBlob, NoteContent, StarRating, Comment, Like, Bookmark, Department, Course, NoteCategory, NoteRequest, Faculty, Contributor, UploadSession
+from .serializers import NoteSerializer, NoteSummarySerializer, parse_expand_param, StarRatingSerializer, CommentSerializer, LikeSerializer, BookmarkSerializer, DepartmentSerializer, CourseSerializer, NoteCategorySerializer, NoteRequestSerializer,  FacultySerializer, ContributorSerializer, NotificationSerializer, NotificationMarkReadSerializer, NoteUploadCheckSerializer, UploadSessionSerializer
 from .permissions import IsOwnerOrReadOnly, IsRatingOrCommentOwnerOrReadOnly
 
-from django.db.models import Avg, Count, Case, When, BooleanField, F, Value 
-from django.db.models.functions import Coalesce
+from django.db.models import BooleanField, F, Value
 from rest_framework.exceptions import PermissionDenied
 import logging
-from .filters import ContributorFilter
+from .filters import ContributorFilter, FullTextSearchFilter
+from .content_store import schedule_extraction
+from .download_counter import record_download
+from .file_delivery import serve_note_file
+from .response_cache import cached_anonymous_response, get_cache_stats, reset_cache_stats
+from .reference_data import content_etag, get_reference_data
+from .content_reader import read_document_page, read_lines
+from .extraction import file_type_for
+from .fast_listing import note_rows, serialize_note_rows, use_fast_listing
+from .blobs import attach_blob
+from .upload_sessions import ChunkRejected, create_session, discard_session, finalize_session, verify_session, write_chunk
+from .inbox import annotate_read_individually, get_read_mark, get_unread_count, mark_read as mark_notifications_read, visible_notifications
 logger = logging.getLogger(__name__)
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.conf import settings
+
+class ReferenceETagMixin:
+    """
+    Conditional GET for the reference-data viewsets. The ETag is a hash of the
+    rendered response, so it changes whenever the data does, whichever
+    process wrote it; a match is answered with an empty 304.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+        response.render()
+        response['ETag'] = content_etag(response.content)
+        not_modified = get_conditional_response(request, etag=response['ETag'], response=response)
+        return not_modified if not_modified is not None else response
+
+
+class ReferenceDataView(APIView):
+    """
+    Departments, courses, categories and faculties in one cached response.
+    Clients should revalidate with If-None-Match.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        content, etag = get_reference_data()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
 
-class FacultyViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Faculty.objects.all().order_by('name')
+class FacultyViewSet(ReferenceETagMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Faculty.objects.select_related('department').order_by('name')
     serializer_class = FacultySerializer
     permission_classes = [permissions.AllowAny]
 
 
-class NoteCategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class NoteCategoryViewSet(ReferenceETagMixin, viewsets.ReadOnlyModelViewSet):
     queryset = NoteCategory.objects.all().order_by('name')
     serializer_class = NoteCategorySerializer
     permission_classes = [permissions.AllowAny]
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10 
-    page_size_query_param = 'page_size'
-    max_page_size = 100
 class NoteViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'put', 'patch', 'delete', 'head', 'options']
     serializer_class = NoteSerializer
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, SearchFilter, FullTextSearchFilter, OrderingFilter]
     filterset_fields = {
         'category__name': ['exact', 'icontains'],
         'department__name': ['exact', 'icontains'],
@@ -72,7 +116,7 @@ class NoteViewSet(viewsets.ModelViewSet):
         # FIX: Added 'download' to IsAuthenticated permission check
         if self.action in ['list', 'retrieve']:
             permission_classes = [permissions.AllowAny] 
-        elif self.action in ['create', 'download', 'toggle_like', 'toggle_bookmark', 'my_uploaded_notes', 'get_content']:
+        elif self.action in ['create', 'check_upload', 'download', 'toggle_like', 'toggle_bookmark', 'my_uploaded_notes', 'get_content']:
             permission_classes = [permissions.IsAuthenticated]
         elif self.action == 'destroy':
             permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
@@ -80,22 +124,21 @@ class NoteViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
         return [permission() for permission in permission_classes]
 
+    def get_serializer_class(self):
+        if self.action in ['list', 'my_uploaded_notes']:
+            return NoteSummarySerializer
+        return NoteSerializer
+
     def get_queryset(self):
         user = self.request.user
         queryset = Note.objects.all()
 
-        queryset = queryset.select_related('uploader', 'department', 'course', 'category', 'faculty').prefetch_related(
-            'star_ratings',
-            'comments',
-        )
-
-        # --- সমাধান: Annotation কী-গুলো Serializer-এর `source`-এর সাথে মেলানো হয়েছে ---
-        base_annotations = {
-            'calculated_average_rating': Coalesce(Avg('star_ratings__stars'), Value(0.0)),
-            'calculated_likes_count': Count('likes', distinct=True),
-            'calculated_bookmarks_count': Count('bookmarks', distinct=True),
-        }
-        queryset = queryset.annotate(**base_annotations)
+        queryset = queryset.select_related('uploader', 'uploader__department', 'department', 'course', 'category', 'faculty').prefetch_related('tags')
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                Prefetch('star_ratings', queryset=StarRating.objects.select_related('user')),
+                Prefetch('comments', queryset=Comment.objects.select_related('user')),
+            )
 
         if user.is_authenticated:
             likes_subquery = Like.objects.filter(note=OuterRef('pk'), user=user)
@@ -115,13 +158,34 @@ class NoteViewSet(viewsets.ModelViewSet):
             if not user.is_authenticated or not user.is_staff:
                 queryset = queryset.filter(is_approved=True)
 
+        if self.action == 'list':
+            queryset = NoteSummarySerializer.setup_eager_loading(queryset, parse_expand_param(self.request))
+
         return queryset.order_by('-created_at', '-id')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context.update({"request": self.request})
+        context.update({"request": self.request, "expand": parse_expand_param(self.request)})
         return context
 
+    def list(self, request, *args, **kwargs):
+        return cached_anonymous_response(request, 'list', lambda: self.list_notes(request, *args, **kwargs))
+
+    def list_notes(self, request, *args, **kwargs):
+        if not use_fast_listing(parse_expand_param(request)):
+            return super().list(request, *args, **kwargs)
+        # Same rows and pagination as the serializer path, read as tuples (notes.fast_listing).
+        rows = note_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_note_rows(page, request))
+        return Response(serialize_note_rows(rows, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_anonymous_response(
+            request, 'retrieve', lambda: super(NoteViewSet, self).retrieve(request, *args, **kwargs), pk=kwargs.get('pk')
+        )
+
 
     def perform_create(self, serializer):
         serializer.save(uploader=self.request.user)
@@ -138,11 +202,24 @@ class NoteViewSet(viewsets.ModelViewSet):
         }
         return Response(response_data, status=status.HTTP_201_CREATED, headers=headers)
 
+    @action(detail=False, methods=['post'], url_path='check-upload')
+    def check_upload(self, request):
+        """
+        Pre-upload check. The client sends the SHA-256 and size of the file it
+        is about to upload; if the server already stores that content, the
+        note can be created with `file_sha256` (and `original_filename`)
+        instead of the file itself.
+        """
+        serializer = NoteUploadCheckSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        exists = NoteBlob.objects.filter(**serializer.validated_data).exists()
+        return Response({"exists": exists})
+
     @action(detail=True, methods=['get'], url_path='download')
     def download(self, request, pk=None):
         """
-        Increments download count and serves the file for download.
-        This version is more robust for cloud environments.
+        Serves the file for download (see notes.file_delivery) and counts it
+        through the buffered download counter (notes.download_counter).
         """
         try:
             note = self.get_object()
@@ -152,25 +229,12 @@ class NoteViewSet(viewsets.ModelViewSet):
                 logger.warning(f"Note {pk} has no file associated.")
                 raise Http404("File not found for this note.")
 
-            # Atomically increment download count
-            note.download_count = F('download_count') + 1
-            note.save(update_fields=['download_count'])
-            note.refresh_from_db()
+            if not note.file.storage.exists(note.file.name):
+                logger.error(f"File for note {pk} does not exist in storage: {note.file.name}")
+                raise Http404("File not found.")
+
+            return serve_note_file(request, note, lambda: record_download(note))
 
-            
-            file_name = os.path.basename(note.file.name)
-            mime_type, _ = mimetypes.guess_type(file_name)
-            
-            # Use the file object's open method, which works with any storage backend
-            response = FileResponse(note.file.open('rb'), as_attachment=True, filename=file_name)
-            
-            if mime_type:
-                response['Content-Type'] = mime_type
-            
-            
-            response['X-Download-Count'] = note.download_count
-            return response
-            
         except Http404 as e:
             logger.warning(f"Download request failed for note {pk}: {e}")
             return Response({"detail": str(e)}, status=status.HTTP_404_NOT_FOUND)
@@ -184,20 +248,19 @@ class NoteViewSet(viewsets.ModelViewSet):
         note = self.get_object()
         user = request.user
         
-        like_instance = Like.objects.filter(user=user, note=note)
+        with transaction.atomic():
+            like_instance = Like.objects.filter(user=user, note=note)
 
-        if like_instance.exists():
-            like_instance.delete()
-            liked = False
-            message = "Note unliked successfully."
-        else:
-            Like.objects.create(user=user, note=note)
-            liked = True
-            message = "Note liked successfully."
+            if like_instance.exists():
+                like_instance.delete()
+                liked = False
+                message = "Note unliked successfully."
+            else:
+                Like.objects.create(user=user, note=note)
+                liked = True
+                message = "Note liked successfully."
 
-        note.refresh_from_db()
-        
-        likes_count = note.likes.count()
+            likes_count = Note.objects.values_list('likes_count', flat=True).get(pk=note.pk)
 
         return Response({
             "message": message,
@@ -212,21 +275,19 @@ class NoteViewSet(viewsets.ModelViewSet):
         note = self.get_object()
         user = request.user
 
-        bookmark_instance = Bookmark.objects.filter(user=user, note=note)
-
-        if bookmark_instance.exists():
-            bookmark_instance.delete()
-            bookmarked = False
-            message = "Note removed from bookmarks."
-        else:
-            Bookmark.objects.create(user=user, note=note)
-            bookmarked = True
-            message = "Note bookmarked successfully."
-
+        with transaction.atomic():
+            bookmark_instance = Bookmark.objects.filter(user=user, note=note)
 
-        note.refresh_from_db()
+            if bookmark_instance.exists():
+                bookmark_instance.delete()
+                bookmarked = False
+                message = "Note removed from bookmarks."
+            else:
+                Bookmark.objects.create(user=user, note=note)
+                bookmarked = True
+                message = "Note bookmarked successfully."
 
-        bookmarks_count = note.bookmarks.count()
+            bookmarks_count = Note.objects.values_list('bookmarks_count', flat=True).get(pk=note.pk)
 
         return Response({
             "message": message,
@@ -237,8 +298,9 @@ class NoteViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'], url_path='content')
     def get_content(self, request, pk=None):
         """
-        Extract and return text content from the note file.
-        Supports various file types including DOC, DOCX, PDF, TXT, etc.
+        Return a bounded slice of the note's text. Text and code files are
+        paged by line with ?offset=&limit= or ?page=; extracted DOCX/PDF
+        content (see notes.content_store) is paged by document page with ?page=.
         """
         logger.info(f"Content endpoint called for note {pk} by user {request.user.username}")
         try:
@@ -253,81 +315,102 @@ class NoteViewSet(viewsets.ModelViewSet):
                 logger.error(f"File for note {pk} does not exist on disk at: {file_path}")
                 raise Http404("File not found.")
 
-            file_name = os.path.basename(file_path)
+            file_name = note.file_display_name
             file_extension = os.path.splitext(file_name)[1].lower()
-
-            # Handle different file types
-            if file_extension in ['.txt', '.md', '.json', '.xml', '.csv', '.log', '.ini', '.conf', '.cfg']:
-                # Text files - read directly
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                except UnicodeDecodeError:
-                    # Try with different encoding
-                    with open(file_path, 'r', encoding='latin-1') as f:
-                        content = f.read()
-                
-                return Response({
-                    "content": content,
-                    "file_type": "text",
-                    "file_name": file_name
-                })
-
-            elif file_extension in ['.js', '.jsx', '.ts', '.tsx', '.html', '.css', '.scss', '.sass', '.less', '.php', '.py', '.java', '.cpp', '.c', '.cs', '.rb', '.go', '.rs', '.swift', '.kt', '.dart', '.r', '.sql', '.sh', '.bat', '.ps1', '.yaml', '.yml', '.toml', '.env']:
-                # Code files - read as text
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                except UnicodeDecodeError:
-                    with open(file_path, 'r', encoding='latin-1') as f:
-                        content = f.read()
-                
-                return Response({
-                    "content": content,
-                    "file_type": "code",
-                    "file_name": file_name
-                })
-
-            elif file_extension in ['.doc', '.docx']:
-                # For DOC/DOCX files, return a message indicating external processing is needed
-                # In a production environment, you would use libraries like python-docx or mammoth
+            file_type = file_type_for(file_name)
+
+            if file_type in ('text', 'code'):
+                # Served straight from disk in bounded slices (see notes.content_reader).
+                if not note.file_hash:
+                    schedule_extraction(note.pk)
+                offset, limit, page = self._get_content_window(request)
+                if page is not None:
+                    offset = (page - 1) * limit
+                window = read_lines(file_path, offset, limit, settings.NOTE_CONTENT_MAX_BYTES)
+                next_offset = offset + window.line_count
                 response_data = {
-                    "content": "This is a Microsoft Word document. Text extraction requires additional processing. Please download the file to view its contents.",
-                    "file_type": "document",
+                    "content": window.text,
+                    "file_type": file_type,
                     "file_name": file_name,
-                    "requires_processing": True
+                    "offset": offset,
+                    "limit": limit,
+                    "line_count": window.line_count,
+                    "total_lines": window.total_lines,
+                    "next_offset": next_offset if next_offset < window.total_lines else None,
+                    "truncated": window.truncated,
                 }
-                logger.info(f"Returning response for {file_extension} file: {response_data}")
+                if page is not None:
+                    response_data["page"] = page
+                    response_data["page_count"] = max(1, -(-window.total_lines // limit))
                 return Response(response_data)
 
-            elif file_extension == '.pdf':
-                # For PDF files, return a message indicating external processing is needed
-                # In a production environment, you would use libraries like PyPDF2 or pdfplumber
+            content = None
+            if note.file_hash:
+                content = NoteContent.objects.filter(file_hash=note.file_hash).defer('text').first()
+
+            if content is not None and content.status == NoteContent.Status.READY:
+                _offset, _limit, page = self._get_content_window(request)
+                page = page or 1
+                if page > max(content.page_count, 1):
+                    raise Http404("Invalid page.")
+                text, truncated = read_document_page(content, page, settings.NOTE_CONTENT_MAX_BYTES)
                 return Response({
-                    "content": "This is a PDF document. Text extraction requires additional processing. Please download the file to view its contents.",
-                    "file_type": "pdf",
+                    "content": text,
+                    "file_type": file_type,
                     "file_name": file_name,
-                    "requires_processing": True
+                    "page": page,
+                    "page_count": content.page_count,
+                    "next_page": page + 1 if page < content.page_count else None,
+                    "truncated": truncated,
                 })
 
-            else:
-                # For other file types, return a generic message
-                response_data = {
-                    "content": f"This is a {file_extension.upper()} file. Text content extraction is not supported for this file type. Please download the file to view its contents.",
-                    "file_type": "other",
+            if content is None and file_extension in ('.docx', '.pdf'):
+                schedule_extraction(note.pk)
+                return Response({
+                    "content": "This document is still being processed. Please try again shortly or download the file to view its contents.",
+                    "file_type": file_type,
                     "file_name": file_name,
-                    "requires_processing": True
-                }
-                logger.info(f"Returning response for {file_extension} file: {response_data}")
-                return Response(response_data)
+                    "requires_processing": True,
+                    "processing": True,
+                })
+
+            response_data = {
+                "content": f"This is a {file_extension.upper()} file. Text content extraction is not supported for this file type. Please download the file to view its contents.",
+                "file_type": file_type,
+                "file_name": file_name,
+                "requires_processing": True
+            }
+            if content is not None and content.status == NoteContent.Status.FAILED:
+                response_data["content"] = "Text could not be extracted from this file. Please download the file to view its contents."
+            logger.info(f"Returning response for {file_extension} file: {response_data}")
+            return Response(response_data)
 
         except Http404 as e:
             logger.warning(f"Content request failed for note {pk}: {e}")
             return Response({"detail": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Error extracting content for note {pk}: {e}", exc_info=True)
             return Response({"detail": "An internal server error occurred while extracting content."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def _get_content_window(self, request):
+        """Parses ?offset=&limit= (lines) and ?page= for the content endpoint."""
+        params = request.query_params
+        window = {}
+        for name, default, minimum in (('offset', 0, 0), ('limit', settings.NOTE_CONTENT_PAGE_LINES, 1), ('page', None, 1)):
+            value = params.get(name)
+            if value in (None, ''):
+                window[name] = default
+                continue
+            try:
+                window[name] = int(value)
+            except ValueError:
+                raise serializers.ValidationError({name: "A valid integer is required."})
+            if window[name] < minimum:
+                raise serializers.ValidationError({name: f"Ensure this value is greater than or equal to {minimum}."})
+        return window['offset'], min(window['limit'], settings.NOTE_CONTENT_MAX_LINES), window['page']
+
     @action(detail=False, methods=['get'], url_path='my-notes')
     def my_uploaded_notes(self, request):
         """
@@ -335,25 +418,15 @@ class NoteViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
 
-        queryset = Note.objects.filter(uploader=user).order_by('-created_at').select_related('uploader', 'department', 'course').prefetch_related(
-            'star_ratings', 'comments', 'likes', 'bookmarks'
-        )
+        queryset = Note.objects.filter(uploader=user).order_by('-created_at').select_related(
+            'uploader', 'uploader__department', 'department', 'course', 'category', 'faculty'
+        ).prefetch_related('tags')
 
         queryset = queryset.annotate(
-            calculated_average_rating=Coalesce(Avg('star_ratings__stars'), Value(0.0)),
-            calculated_likes_count=Count('likes', distinct=True),
-            calculated_bookmarks_count=Count('bookmarks', distinct=True),
-            is_liked_by_current_user_annotated=Case(
-                When(likes__user=user, then=Value(True)),
-                default=Value(False),
-                output_field=BooleanField()
-            ),
-            is_bookmarked_by_current_user_annotated=Case(
-                When(bookmarks__user=user, then=Value(True)),
-                default=Value(False),
-                output_field=BooleanField()
-            )
+            is_liked_by_current_user_annotated=Exists(Like.objects.filter(note=OuterRef('pk'), user=user)),
+            is_bookmarked_by_current_user_annotated=Exists(Bookmark.objects.filter(note=OuterRef('pk'), user=user)),
         )
+        queryset = NoteSummarySerializer.setup_eager_loading(queryset, parse_expand_param(request))
 
 
         queryset = self.filter_queryset(queryset)
@@ -375,14 +448,83 @@ class NoteViewSet(viewsets.ModelViewSet):
 
 
 
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable uploads (see notes.upload_sessions). POST opens a session,
+    PUT chunks/<n>/ sends chunk n as the raw request body with an
+    X-Chunk-SHA256 header, GET reports where to resume and POST finalize/
+    takes the usual note fields and creates the Note from the uploaded file.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user, expires_at__gt=timezone.now())
+
+    def perform_create(self, serializer):
+        if self.get_queryset().filter(note__isnull=True).count() >= settings.NOTE_UPLOAD_MAX_OPEN_SESSIONS:
+            raise serializers.ValidationError(
+                {"detail": f"You already have {settings.NOTE_UPLOAD_MAX_OPEN_SESSIONS} uploads in progress; finish or cancel one first."}
+            )
+        serializer.instance = create_session(self.request.user, **serializer.validated_data)
+
+    def perform_destroy(self, instance):
+        discard_session(instance)
 
-class DepartmentViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<number>\d+)')
+    def chunk(self, request, pk=None, number=None):
+        # The body is streamed to disk by write_chunk; request.data would read it into memory.
+        sha256 = request.headers.get('X-Chunk-SHA256', '').lower()
+        if len(sha256) != 64:
+            return Response({"detail": "The X-Chunk-SHA256 header is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        with transaction.atomic():
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            try:
+                written = write_chunk(session, int(number), request.stream, length, sha256)
+            except ChunkRejected as e:
+                return Response({"detail": str(e), "next_chunk": session.next_chunk}, status=e.status)
+        return Response({
+            "received": session.received,
+            "next_chunk": session.next_chunk,
+            "duplicate": not written,
+        })
+
+    @action(detail=True, methods=['post'], url_path='finalize')
+    def finalize(self, request, pk=None):
+        with transaction.atomic():
+            # Locked like chunk(), so concurrent finalizes of one session create one note.
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if session.note_id is None:
+                context = {"request": request, "upload_session": session}
+                serializer = NoteSerializer(data=request.data, context=context)
+                serializer.is_valid(raise_exception=True)
+                try:
+                    sha256 = verify_session(session)
+                except ChunkRejected as e:
+                    return Response({"detail": str(e), "next_chunk": session.next_chunk}, status=e.status)
+                # The note goes in first, so a save that fails leaves the session file where it was.
+                note = serializer.save(uploader=request.user, original_filename=session.filename)
+                attach_blob(note, finalize_session(session, note, sha256))
+                note.save()
+        # A repeated finalize (the client never saw the first response) gets the same answer.
+        return Response(
+            {"message": "Note submitted, wait for admin approval.", "note": NoteSerializer(session.note, context={"request": request}).data},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+
+class DepartmentViewSet(ReferenceETagMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Department.objects.all().order_by('name')
     serializer_class = DepartmentSerializer
     permission_classes = [permissions.AllowAny] 
 
-class CourseViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Course.objects.all().order_by('name')
+class CourseViewSet(ReferenceETagMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Course.objects.select_related('department').order_by('name')
     serializer_class = CourseSerializer
     permission_classes = [permissions.AllowAny]
     filterset_fields = ['department'] 
@@ -412,7 +554,16 @@ class StarRatingViewSet(viewsets.ModelViewSet):
         if existing_rating:
             raise serializers.ValidationError({"detail": "You have already rated this note. You can update your existing rating by sending a PUT/PATCH request to its ID."})
 
-        serializer.save(user=self.request.user, note=note_instance)
+        with transaction.atomic():
+            serializer.save(user=self.request.user, note=note_instance)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
 
 class CommentViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'put', 'patch', 'delete', 'head', 'options']
@@ -436,7 +587,12 @@ class CommentViewSet(viewsets.ModelViewSet):
         if existing_comment:
             raise serializers.ValidationError({"detail": "You have already commented on this note. You can update your existing comment by sending a PUT/PATCH request to its ID."})
 
-        serializer.save(user=self.request.user, note=note_instance)
+        with transaction.atomic():
+            serializer.save(user=self.request.user, note=note_instance)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
 
 
 @api_view(['POST'])
@@ -539,37 +695,84 @@ class ContributorViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = ContributorFilter
     search_fields = ['user__username', 'user__first_name', 'user__last_name', 'user__email']
 
+class NotificationViewSet(viewsets.GenericViewSet):
+    """
+    The requesting user's inbox: global notifications plus the ones targeted
+    at them, newest first with keyset pagination. `?unread=true` lists only
+    unread ones.
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationPagination
+
+    @cached_property
+    def read_mark(self):
+        return get_read_mark(self.request.user)
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = annotate_read_individually(visible_notifications(user), user)
+        if self.request.query_params.get('unread', '').lower() in ('1', 'true', 'yes'):
+            queryset = queryset.filter(pk__gt=self.read_mark, read_individually=False)
+        return queryset.select_related('actor_content_type', 'target_content_type').prefetch_related('actor', 'target')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['read_mark'] = self.read_mark
+        return context
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        return Response({'unread_count': get_unread_count(request.user)})
+
+    @action(detail=False, methods=['post'], url_path='mark-read', serializer_class=NotificationMarkReadSerializer)
+    def mark_read(self, request):
+        """
+        Without a body marks everything read. `up_to` moves the read mark to
+        that id; `ids` marks individual notifications targeted at the user.
+        """
+        serializer = NotificationMarkReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        unread = mark_notifications_read(request.user, **serializer.validated_data)
+        return Response({'unread_count': unread})
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def download_note_file(request, pk):
     try:
         note = Note.objects.get(pk=pk)
-        
-        note.download_count = F('download_count') + 1
-        note.save(update_fields=['download_count'])
-        note.refresh_from_db()
 
         if not note.file:
             logger.warning(f"Note {pk} has no file associated.")
             raise Http404("File not found.")
             
-        file_path = note.file.path
-        if not os.path.exists(file_path):
-            logger.error(f"File for note {pk} does not exist on disk at: {file_path}")
+        if not note.file.storage.exists(note.file.name):
+            logger.error(f"File for note {pk} does not exist in storage: {note.file.name}")
             raise Http404("File not found.")
             
-        file_name = os.path.basename(file_path)
-        mime_type, _ = mimetypes.guess_type(file_path)
-        
-        response = FileResponse(open(file_path, 'rb'), as_attachment=True, filename=file_name)
-        if mime_type:
-            response['Content-Type'] = mime_type
-            
-        return response
-        
+        return serve_note_file(request, note, lambda: record_download(note))
+
     except Note.DoesNotExist:
         logger.warning(f"Download request for non-existent note: {pk}")
         raise Http404("Note not found.")
     except Exception as e:
         logger.error(f"Error serving file for note {pk}: {e}", exc_info=True)
-        raise Http404("An error occurred while trying to serve the file.")
\ No newline at end of file
+        raise Http404("An error occurred while trying to serve the file.")
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([permissions.IsAdminUser])
+def response_cache_stats(request):
+    """
+    Hit/miss statistics of the anonymous note response cache.
+    DELETE resets the hit and miss counters.
+    """
+    if request.method == 'DELETE':
+        reset_cache_stats()
+    return Response(get_cache_stats())
@@ -0,0 +1,113 @@
+# notes/ws_auth.py
+"""
+JWT authentication for WebSocket connections.
+
+Browsers can't set an Authorization header on a WebSocket handshake, so the
+access token is taken from either
+  - the query string:  /ws/notifications/?token=<access>
+  - the subprotocols:  new WebSocket(url, ['jwt', '<access>'])
+When the subprotocol form is used, `scope['jwt_subprotocol']` names the
+protocol the consumer has to echo back when accepting.
+
+Decoded tokens are cached in-process until they expire (WS_JWT_CACHE_SIZE
+entries), so reconnect storms don't re-verify the same token. Connections
+without a token keep whatever user the session middleware found.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+
+logger = logging.getLogger(__name__)
+
+JWT_SUBPROTOCOL = 'jwt'
+TOKEN_QUERY_PARAM = 'token'
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+
+def get_token_from_scope(scope):
+    """Returns (token, subprotocol) from the handshake, or (None, None)."""
+    subprotocols = scope.get('subprotocols') or []
+    if JWT_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(JWT_SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], JWT_SUBPROTOCOL
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    tokens = query.get(TOKEN_QUERY_PARAM)
+    if tokens:
+        return tokens[0], None
+    return None, None
+
+
+def _cache_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def validate_token(token):
+    """Returns the user id of a valid access token, or None. Results are cached until the token expires."""
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    key = _cache_key(token)
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            user_id, expires_at = cached
+            if expires_at > now:
+                _token_cache.move_to_end(key)
+                return user_id
+            del _token_cache[key]
+
+    try:
+        access = AccessToken(token)
+    except TokenError as e:
+        logger.debug(f"Rejected WebSocket token: {e}")
+        return None
+    user_id = access.get(api_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return None
+
+    with _token_cache_lock:
+        _token_cache[key] = (user_id, access.get('exp', now))
+        while len(_token_cache) > settings.WS_JWT_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return user_id
+
+
+@database_sync_to_async
+def get_token_user(token):
+    """The active user for an access token, else AnonymousUser. Verification is CPU work, so it runs off the event loop too."""
+    user_id = validate_token(token)
+    if user_id is None:
+        return AnonymousUser()
+    user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+    return user or AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        token, subprotocol = get_token_from_scope(scope)
+        if token:
+            scope = dict(scope)
+            scope['user'] = await get_token_user(token)
+            scope['jwt_subprotocol'] = subprotocol
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    # Session auth runs first so a valid token overrides the session user.
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
@@ -1,17 +1,21 @@
 # noteshare_backend/asgi.py
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import notes.routing 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'noteshare_backend.settings')
 
+# Initialise Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from notes.ws_auth import JWTAuthMiddlewareStack
+import notes.routing 
+
 application = ProtocolTypeRouter({
-  "http": get_asgi_application(),
-  "websocket": AuthMiddlewareStack(
+  "http": django_asgi_app,
+  "websocket": JWTAuthMiddlewareStack(
         URLRouter(
             notes.routing.websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+})
@@ -0,0 +1,332 @@
+# noteshare_backend/channel_layer.py
+"""
+Channel layer shared by local worker processes through one SQLite file.
+
+InMemoryChannelLayer only reaches sockets held by the process that calls
+group_send, which pins the ASGI server to a single worker. This layer keeps
+messages and group memberships in a WAL-mode SQLite database, so any number of
+daphne/uvicorn workers on the same host can talk to each other without Redis.
+
+  - send/group_send are single INSERT transactions; group fan-out inserts one
+    row per member channel with executemany.
+  - Each process runs one poller per event loop that fetches all messages for
+    its own process-specific channels ("specific.<client>!...") with a single
+    indexed query and hands them to per-channel asyncio queues. Other
+    channel names are polled directly by receive().
+  - Messages older than `expiry` are dropped; a channel with an expired
+    message is removed from all its groups, and memberships older than
+    `group_expiry` lapse, like the in-memory layer.
+  - `capacity`/`channel_capacity` cap queued messages per channel: send()
+    raises ChannelFull, group_send() skips full channels. The poller stops
+    taking messages for a channel whose local queue holds `capacity` of them,
+    so a slow consumer can't grow process memory; the rest wait in the
+    database and count against the capacity there.
+  - Receiving uses DELETE ... RETURNING (SQLite 3.35+) and only takes the
+    write lock when there are messages to remove (or, every
+    `cleanup_interval`, to sweep expired ones).
+
+Messages are pickled, so the database file must only be writable by the
+application (it is created with 0600 permissions).
+
+    CHANNEL_LAYERS = {"default": {
+        "BACKEND": "noteshare_backend.channel_layer.SQLiteChannelLayer",
+        "CONFIG": {"path": "/var/run/noteshare/channels.sqlite3"},
+    }}
+"""
+
+import asyncio
+import os
+import pickle
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    inbox TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    body BLOB NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_messages_inbox ON channel_messages (inbox, id);
+CREATE INDEX IF NOT EXISTS channel_messages_channel ON channel_messages (channel, expires);
+CREATE TABLE IF NOT EXISTS channel_groups (
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    joined REAL NOT NULL,
+    PRIMARY KEY (group_name, channel)
+);
+CREATE INDEX IF NOT EXISTS channel_groups_channel ON channel_groups (channel);
+"""
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(
+        self,
+        path='channels.sqlite3',
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        poll_interval=0.02,
+        batch_size=200,
+        cleanup_interval=5.0,
+        **kwargs
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.cleanup_interval = cleanup_interval
+        self.client_prefix = uuid.uuid4().hex[:12]
+        # All SQLite work for this layer happens on one thread and connection;
+        # WAL mode lets the other processes read and write concurrently.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-channel-layer')
+        self._db = None
+        self._queues = {}
+        self._waiters = {}
+        self._pollers = {}
+        self._last_cleanup = 0.0
+
+    # Database access (runs on the layer's thread)
+
+    def _connect(self):
+        if self._db is None:
+            if not os.path.exists(self.path):
+                os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _insert(self, channels, message, skip_full):
+        db = self._connect()
+        now = time.time()
+        body = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            queued = {}
+            for start in range(0, len(channels), 500):
+                chunk = channels[start:start + 500]
+                queued.update(db.execute(
+                    f"SELECT channel, COUNT(*) FROM channel_messages WHERE channel IN ({','.join('?' * len(chunk))}) "
+                    f"AND expires > ? GROUP BY channel",
+                    (*chunk, now),
+                ))
+            rows = []
+            for channel in channels:
+                if queued.get(channel, 0) >= self.get_capacity(channel):
+                    if skip_full:
+                        continue
+                    raise ChannelFull(channel)
+                rows.append((self.non_local_name(channel), channel, body, now + self.expiry))
+            db.executemany('INSERT INTO channel_messages (inbox, channel, body, expires) VALUES (?, ?, ?, ?)', rows)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def _take(self, column, value, limit, skip_channels=()):
+        """
+        Removes and returns up to `limit` live messages for an inbox or
+        channel, leaving those for `skip_channels` in place. The write lock is
+        only taken when there is something to delete, so idle polling never
+        competes with senders.
+        """
+        db = self._connect()
+        now = time.time()
+        skip = f" AND channel NOT IN ({','.join('?' * len(skip_channels))})" if skip_channels else ''
+        rows = db.execute(
+            f'SELECT id, channel, expires, body FROM channel_messages WHERE {column} = ? AND expires > ?{skip} ORDER BY id LIMIT ?',
+            (value, now, *skip_channels, limit),
+        ).fetchall()
+        if rows:
+            # Another process may have taken some of them since the SELECT
+            # (shared channel names); only the rows this DELETE removed are ours.
+            taken = {row[0] for row in db.execute(
+                f"DELETE FROM channel_messages WHERE id IN ({','.join('?' * len(rows))}) RETURNING id", [row[0] for row in rows],
+            )}
+            rows = [row for row in rows if row[0] in taken]
+        if now - self._last_cleanup > self.cleanup_interval:
+            self._clean_expired(now)
+        return [(channel, expires, pickle.loads(body)) for _id, channel, expires, body in rows]
+
+    def _clean_expired(self, now):
+        db = self._connect()
+        self._last_cleanup = now
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # A channel that let a message expire is gone; drop it from groups.
+            db.execute(
+                'DELETE FROM channel_groups WHERE channel IN '
+                '(SELECT DISTINCT channel FROM channel_messages WHERE expires <= ?)',
+                (now,),
+            )
+            db.execute('DELETE FROM channel_messages WHERE expires <= ?', (now,))
+            db.execute('DELETE FROM channel_groups WHERE joined < ?', (now - self.group_expiry,))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def _group_channels(self, group):
+        cutoff = time.time() - self.group_expiry
+        rows = self._connect().execute(
+            'SELECT channel FROM channel_groups WHERE group_name = ? AND joined >= ?', (group, cutoff),
+        )
+        return [row[0] for row in rows]
+
+    def _group_add(self, group, channel):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO channel_groups (group_name, channel, joined) VALUES (?, ?, ?)',
+            (group, channel, time.time()),
+        )
+
+    def _group_discard(self, group, channel):
+        self._connect().execute('DELETE FROM channel_groups WHERE group_name = ? AND channel = ?', (group, channel))
+
+    def _discard_channels(self, channels):
+        db = self._connect()
+        for start in range(0, len(channels), 500):
+            chunk = channels[start:start + 500]
+            db.execute(f"DELETE FROM channel_groups WHERE channel IN ({','.join('?' * len(chunk))})", chunk)
+
+    def _flush(self):
+        db = self._connect()
+        db.execute('DELETE FROM channel_messages')
+        db.execute('DELETE FROM channel_groups')
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+        await self._run(self._insert, [channel], message, False)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        if '!' not in channel:
+            while True:
+                messages = await self._run(self._take, 'channel', channel, 1)
+                if messages:
+                    return messages[0][2]
+                await asyncio.sleep(self.poll_interval)
+
+        loop = asyncio.get_running_loop()
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = asyncio.Queue()
+        self._ensure_poller(loop, self.non_local_name(channel))
+        self._waiters[channel] = self._waiters.get(channel, 0) + 1
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires > time.time():
+                    return message
+        finally:
+            self._waiters[channel] -= 1
+            if not self._waiters[channel]:
+                del self._waiters[channel]
+                if queue.empty() and self._queues.get(channel) is queue:
+                    del self._queues[channel]
+
+    def _ensure_poller(self, loop, inbox):
+        key = (loop, inbox)
+        task = self._pollers.get(key)
+        if task is None or task.done():
+            self._pollers[key] = loop.create_task(self._poll(inbox))
+
+    async def _poll(self, inbox):
+        """Moves messages for this process's channels from the database to their queues."""
+        last_sweep = time.time()
+        while any(channel.startswith(inbox) for channel in self._queues):
+            # Messages for channels whose local queue is full stay in the
+            # database, where they keep counting against the channel's capacity.
+            full = [
+                channel for channel, queue in self._queues.items()
+                if channel.startswith(inbox) and queue.qsize() >= self.get_capacity(channel)
+            ]
+            messages = await self._run(self._take, 'inbox', inbox, self.batch_size, full)
+            for channel, expires, message in messages:
+                queue = self._queues.get(channel)
+                if queue is None:
+                    queue = self._queues[channel] = asyncio.Queue()
+                queue.put_nowait((expires, message))
+            if time.time() - last_sweep > self.cleanup_interval:
+                last_sweep = time.time()
+                dead = self._expire_local()
+                if dead:
+                    await self._run(self._discard_channels, dead)
+            if len(messages) < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def _expire_local(self):
+        """
+        Drops expired messages queued in this process for channels nobody is
+        receiving from and returns those channels so they leave their groups.
+        """
+        now = time.time()
+        dead = []
+        for channel, queue in list(self._queues.items()):
+            if self._waiters.get(channel):
+                continue
+            expired = False
+            while not queue.empty() and queue._queue[0][0] <= now:
+                queue.get_nowait()
+                expired = True
+            if expired:
+                dead.append(channel)
+            if queue.empty():
+                del self._queues[channel]
+        return dead
+
+    async def new_channel(self, prefix='specific'):
+        return f"{prefix}.{self.client_prefix}!{uuid.uuid4().hex}"
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        await self._run(self._group_add, group, channel)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), "Invalid channel name"
+        assert self.valid_group_name(group), "Invalid group name"
+        await self._run(self._group_discard, group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+        channels = await self._run(self._group_channels, group)
+        if channels:
+            await self._run(self._insert, channels, message, True)
+
+    # Flush extension
+
+    async def flush(self):
+        for task in self._pollers.values():
+            task.cancel()
+        self._pollers = {}
+        self._queues = {}
+        await self._run(self._flush)
+
+    async def close(self):
+        for task in self._pollers.values():
+            task.cancel()
+        self._pollers = {}
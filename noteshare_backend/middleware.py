@@ -0,0 +1,120 @@
+# noteshare_backend/middleware.py
+"""
+Brotli/gzip compression for API responses.
+
+Django's GZipMiddleware knows neither Brotli nor per-path limits, and
+WhiteNoise only compresses static files. CompressionMiddleware negotiates
+`br` (when the `brotli` package is installed) or `gzip` from Accept-Encoding
+for JSON and text responses under RESPONSE_COMPRESSION_PATHS that are at
+least RESPONSE_COMPRESSION_MIN_SIZE bytes. Streaming responses (note
+downloads) are left alone, and so is everything under
+RESPONSE_COMPRESSION_EXCLUDED_PATHS: the auth endpoints return tokens next
+to request-controlled input, which compression would leak (BREACH).
+
+Responses served through the note response cache carry its key
+(`compression_cache_key`, see notes.response_cache); their compressed bodies
+are cached under that key, so a cache hit skips compression as well and the
+entries are orphaned together when the generation changes.
+
+`python manage.py bench_compression` compares sizes and CPU time per level.
+"""
+
+import gzip
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/xml')
+ACCEPT_ENCODING_RE = re.compile(r'^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def accepted_encodings(header):
+    """Returns {coding: q} from an Accept-Encoding header; unparsable entries are skipped."""
+    encodings = {}
+    for part in header.split(','):
+        match = ACCEPT_ENCODING_RE.match(part)
+        if not match:
+            continue
+        try:
+            q = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        encodings[match.group(1).lower()] = q
+    return encodings
+
+
+def negotiate_encoding(header):
+    """Picks 'br' or 'gzip' for an Accept-Encoding header, preferring br on a tie; None for neither."""
+    encodings = accepted_encodings(header or '')
+    wildcard = encodings.get('*', 0.0)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = encodings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(content, encoding, level=None):
+    if encoding == 'br':
+        quality = settings.RESPONSE_COMPRESSION_BROTLI_QUALITY if level is None else level
+        return brotli.compress(content, quality=quality)
+    level = settings.RESPONSE_COMPRESSION_GZIP_LEVEL if level is None else level
+    # mtime=0 keeps the output (and so cached copies) identical for identical bodies.
+    return gzip.compress(content, compresslevel=level, mtime=0)
+
+
+def compressed_cache_key(key, encoding, content_type):
+    return f'{key}:{encoding}:{content_type}'
+
+
+class CompressionMiddleware(MiddlewareMixin):
+
+    def process_response(self, request, response):
+        if not settings.RESPONSE_COMPRESSION or not self.should_compress(request, response):
+            return response
+        # Whether or not this one gets compressed, the representation depends on it.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+
+        key = getattr(response, 'compression_cache_key', None)
+        content_type = response.get('Content-Type', '')
+        body = cache.get(compressed_cache_key(key, encoding, content_type)) if key else None
+        if body is None:
+            body = compress(response.content, encoding)
+            if key:
+                cache.set(compressed_cache_key(key, encoding, content_type), body, settings.NOTE_RESPONSE_CACHE_TTL)
+        if len(body) >= len(response.content):
+            return response
+
+        response.content = body
+        response['Content-Length'] = str(len(body))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            # The bytes differ from the uncompressed representation's.
+            response['ETag'] = 'W/' + etag
+        return response
+
+    def should_compress(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding') or response.status_code not in (200, 201, 203):
+            return False
+        if not request.path.startswith(tuple(settings.RESPONSE_COMPRESSION_PATHS)):
+            return False
+        if request.path.startswith(tuple(settings.RESPONSE_COMPRESSION_EXCLUDED_PATHS)):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.endswith('+json')
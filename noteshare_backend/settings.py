@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'noteshare_backend.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
     'django.middleware.common.CommonMiddleware',
@@ -74,11 +75,30 @@ ASGI_APPLICATION = 'noteshare_backend.asgi.application'  # Enable ASGI for Chann
 AUTH_USER_MODEL = 'users.User'
 
 # Local dev: In-memory channel layer (no Redis required)
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
+# "memory" only reaches sockets in the same process. "sqlite" shares groups and
+# messages between all local worker processes through a WAL-mode SQLite file.
+CHANNEL_LAYER = config('CHANNEL_LAYER', default='memory')
+if CHANNEL_LAYER == 'sqlite':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "noteshare_backend.channel_layer.SQLiteChannelLayer",
+            "CONFIG": {
+                "path": config('CHANNEL_LAYER_PATH', default=str(BASE_DIR / 'channels.sqlite3')),
+                "capacity": config('CHANNEL_LAYER_CAPACITY', default=100, cast=int),
+                "expiry": 60,
+                "group_expiry": 86400,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+
+# Decoded WebSocket JWTs kept in memory per process (see notes.ws_auth)
+WS_JWT_CACHE_SIZE = config('WS_JWT_CACHE_SIZE', default=1024, cast=int)
 
 # DATABASES = {
 #     'default': dj_database_url.config(
@@ -99,6 +119,20 @@ DATABASES = {
     }
 }
 
+# --- Cache ---
+# Shared by all worker processes on the host: the note response cache generation, the
+# reference-data version and unread-count versions must change for every process at once.
+# A process-local backend (locmem) is only correct with a single worker.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+}
+
 # Database connection optimization
 # DATABASES['default']['CONN_MAX_AGE'] = 600  # 10 minutes
 # DATABASES['default']['OPTIONS'] = {
@@ -154,7 +188,7 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
 ]
 
-CORS_EXPOSE_HEADERS = ['Content-Disposition']
+CORS_EXPOSE_HEADERS = ['Content-Disposition', 'X-Download-Count', 'Content-Range', 'Accept-Ranges', 'ETag']
 CORS_ALLOW_CREDENTIALS = True
 
 
@@ -189,10 +223,16 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Hash uploads while they stream in so identical note files are stored once (notes.blobs)
+FILE_UPLOAD_HANDLERS = [
+    'notes.uploads.HashingMemoryFileUploadHandler',
+    'notes.uploads.HashingTemporaryFileUploadHandler',
+]
 
 
 # --- Email Configuration ---
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))  # file backend only
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
 EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
@@ -200,11 +240,94 @@ EMAIL_USE_SSL = config('EMAIL_USE_SSL', default=False, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='') 
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='') 
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
+# Emails are queued (users.email_queue) and sent in batches over one connection, by a
+# background thread in the web process or, with EMAIL_QUEUE_BACKGROUND off, by `send_queued_emails`
+EMAIL_QUEUE_BACKGROUND = config('EMAIL_QUEUE_BACKGROUND', default=True, cast=bool)
+EMAIL_QUEUE_EAGER = config('EMAIL_QUEUE_EAGER', default=False, cast=bool)  # send right after commit instead
+EMAIL_QUEUE_BATCH_SIZE = config('EMAIL_QUEUE_BATCH_SIZE', default=50, cast=int)
+EMAIL_QUEUE_MAX_ATTEMPTS = config('EMAIL_QUEUE_MAX_ATTEMPTS', default=6, cast=int)
+EMAIL_QUEUE_POLL_INTERVAL = config('EMAIL_QUEUE_POLL_INTERVAL', default=30.0, cast=float)
+EMAIL_QUEUE_CLAIM_SECONDS = config('EMAIL_QUEUE_CLAIM_SECONDS', default=300, cast=int)
+EMAIL_QUEUE_KEEP_SENT_DAYS = config('EMAIL_QUEUE_KEEP_SENT_DAYS', default=7, cast=int)
+# Uploaded profile pictures are resized into these square renditions (users.profile_pictures) by a
+# background thread after the upload commits; ?size= serves the smallest one at least that large
+PROFILE_PICTURE_SIZES = config('PROFILE_PICTURE_SIZES', default='48,128,512', cast=lambda v: sorted(int(s) for s in v.split(',') if s.strip()))
+PROFILE_PICTURE_FORMAT = config('PROFILE_PICTURE_FORMAT', default='WEBP')  # or JPEG
+PROFILE_PICTURE_QUALITY = config('PROFILE_PICTURE_QUALITY', default=80, cast=int)
+PROFILE_PICTURE_WORKERS = config('PROFILE_PICTURE_WORKERS', default=1, cast=int)
+PROFILE_PICTURE_EAGER = config('PROFILE_PICTURE_EAGER', default=False, cast=bool)  # resize right after commit instead
 
 
 # --- Other Settings ---
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# --- Notes API Tuning ---
+# Max comments / star ratings inlined per note when a list is requested with ?expand=
+NOTE_EXPAND_LIMIT = config('NOTE_EXPAND_LIMIT', default=5, cast=int)
+# Note list pages without ?expand= are built from .values_list() rows (notes.fast_listing)
+NOTE_FAST_LISTING = config('NOTE_FAST_LISTING', default=True, cast=bool)
+# Seconds an `approximate_count` (cursor pagination with ?include_total=true) is reused
+NOTE_APPROXIMATE_COUNT_TTL = config('NOTE_APPROXIMATE_COUNT_TTL', default=300, cast=int)
+# Ranked ?q= search (SQLite FTS5 / PostgreSQL tsvector). Disable to fall back to icontains.
+NOTE_FULLTEXT_SEARCH = config('NOTE_FULLTEXT_SEARCH', default=True, cast=bool)
+NOTE_SEARCH_MAX_RESULTS = config('NOTE_SEARCH_MAX_RESULTS', default=200, cast=int)
+NOTE_SEARCH_CONFIG = config('NOTE_SEARCH_CONFIG', default='simple')  # PostgreSQL text search configuration
+# Text extraction for the content endpoint runs in a process pool of this size.
+NOTE_EXTRACTION_WORKERS = config('NOTE_EXTRACTION_WORKERS', default=2, cast=int)
+NOTE_EXTRACTION_EAGER = config('NOTE_EXTRACTION_EAGER', default=False, cast=bool)  # extract inline instead
+# /content/ slices: default and max lines per response, and a hard byte cap per response
+NOTE_CONTENT_PAGE_LINES = config('NOTE_CONTENT_PAGE_LINES', default=500, cast=int)
+NOTE_CONTENT_MAX_LINES = config('NOTE_CONTENT_MAX_LINES', default=5000, cast=int)
+NOTE_CONTENT_MAX_BYTES = config('NOTE_CONTENT_MAX_BYTES', default=1024 * 1024, cast=int)
+# Downloads are counted in memory and written in bulk after this many downloads or seconds
+NOTE_DOWNLOAD_BUFFERING = config('NOTE_DOWNLOAD_BUFFERING', default=True, cast=bool)
+NOTE_DOWNLOAD_FLUSH_THRESHOLD = config('NOTE_DOWNLOAD_FLUSH_THRESHOLD', default=100, cast=int)
+NOTE_DOWNLOAD_FLUSH_INTERVAL = config('NOTE_DOWNLOAD_FLUSH_INTERVAL', default=5.0, cast=float)
+# Hand note downloads to the front proxy: 'X-Accel-Redirect' (nginx, URL under the prefix
+# below) or 'X-Sendfile' (absolute path). Empty serves files from Django with Range/ETag support.
+NOTE_FILE_OFFLOAD_HEADER = config('NOTE_FILE_OFFLOAD_HEADER', default='')
+NOTE_FILE_OFFLOAD_PREFIX = config('NOTE_FILE_OFFLOAD_PREFIX', default='/protected-media/')
+# Resumable uploads (/api/upload-sessions/): chunks are written in place under this directory,
+# which should be on the same filesystem as MEDIA_ROOT so finalizing is a rename
+NOTE_UPLOAD_SESSION_DIR = config('NOTE_UPLOAD_SESSION_DIR', default=str(MEDIA_ROOT / 'upload_sessions'))
+NOTE_UPLOAD_SESSION_TTL = config('NOTE_UPLOAD_SESSION_TTL', default=86400, cast=int)  # seconds since the last chunk
+NOTE_UPLOAD_CHUNK_SIZE = config('NOTE_UPLOAD_CHUNK_SIZE', default=5 * 1024 * 1024, cast=int)
+NOTE_UPLOAD_MIN_CHUNK_SIZE = config('NOTE_UPLOAD_MIN_CHUNK_SIZE', default=256 * 1024, cast=int)
+NOTE_UPLOAD_MAX_CHUNK_SIZE = config('NOTE_UPLOAD_MAX_CHUNK_SIZE', default=32 * 1024 * 1024, cast=int)
+NOTE_UPLOAD_MAX_SIZE = config('NOTE_UPLOAD_MAX_SIZE', default=500 * 1024 * 1024, cast=int)
+NOTE_UPLOAD_MAX_OPEN_SESSIONS = config('NOTE_UPLOAD_MAX_OPEN_SESSIONS', default=5, cast=int)
+# Anonymous note list/detail responses are cached until a note, rating, like, bookmark or comment changes
+NOTE_RESPONSE_CACHE = config('NOTE_RESPONSE_CACHE', default=True, cast=bool)
+NOTE_RESPONSE_CACHE_TTL = config('NOTE_RESPONSE_CACHE_TTL', default=300, cast=int)
+# br/gzip compression of API responses (noteshare_backend.middleware) for bodies of at least
+# MIN_SIZE bytes; bodies of cached note responses are cached compressed alongside them.
+# Only public listings by default: responses that echo secrets (JWTs from login, refresh
+# and registration) must never be compressed (BREACH), so EXCLUDED_PATHS wins over PATHS
+RESPONSE_COMPRESSION = config('RESPONSE_COMPRESSION', default=True, cast=bool)
+RESPONSE_COMPRESSION_MIN_SIZE = config('RESPONSE_COMPRESSION_MIN_SIZE', default=1024, cast=int)
+RESPONSE_COMPRESSION_BROTLI_QUALITY = config('RESPONSE_COMPRESSION_BROTLI_QUALITY', default=4, cast=int)  # 0-11
+RESPONSE_COMPRESSION_GZIP_LEVEL = config('RESPONSE_COMPRESSION_GZIP_LEVEL', default=6, cast=int)  # 1-9
+RESPONSE_COMPRESSION_PATHS = config(
+    'RESPONSE_COMPRESSION_PATHS',
+    default='/api/notes/,/api/reference/,/api/departments/,/api/courses/,/api/categories/,/api/faculties/',
+    cast=lambda v: [p.strip() for p in v.split(',') if p.strip()],
+)
+RESPONSE_COMPRESSION_EXCLUDED_PATHS = config(
+    'RESPONSE_COMPRESSION_EXCLUDED_PATHS', default='/api/users/', cast=lambda v: [p.strip() for p in v.split(',') if p.strip()],
+)
+# Per-user dashboard payloads; dropped early whenever the user writes something
+DASHBOARD_CACHE_TTL = config('DASHBOARD_CACHE_TTL', default=60, cast=int)
+# Cached unread notification counts; versioned keys make new notifications visible immediately
+NOTIFICATION_UNREAD_CACHE_TTL = config('NOTIFICATION_UNREAD_CACHE_TTL', default=300, cast=int)
+# Real-time notifications go through an outbox drained by `manage.py dispatch_notifications`
+# or, unless disabled, by a task in each ASGI process. Dispatchers claim rows for
+# NOTIFICATION_OUTBOX_CLAIM_SECONDS before sending, so several can run side by side
+NOTIFICATION_OUTBOX_ASGI_DISPATCHER = config('NOTIFICATION_OUTBOX_ASGI_DISPATCHER', default=True, cast=bool)
+NOTIFICATION_OUTBOX_BATCH_SIZE = config('NOTIFICATION_OUTBOX_BATCH_SIZE', default=100, cast=int)
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = config('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+NOTIFICATION_OUTBOX_POLL_INTERVAL = config('NOTIFICATION_OUTBOX_POLL_INTERVAL', default=0.5, cast=float)
+NOTIFICATION_OUTBOX_CLAIM_SECONDS = config('NOTIFICATION_OUTBOX_CLAIM_SECONDS', default=60, cast=int)
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Note Sharing Platform API',
     'DESCRIPTION': 'API documentation for the Note Sharing Platform project.',
@@ -0,0 +1,200 @@
+import asyncio
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import mock, skipUnless
+
+from channels.exceptions import ChannelFull
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from .channel_layer import SQLiteChannelLayer
+from .middleware import CompressionMiddleware, brotli, negotiate_encoding
+
+
+class SQLiteChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'channels.sqlite3')
+
+    def make_layer(self, **config):
+        layer = SQLiteChannelLayer(path=self.path, poll_interval=0.005, **config)
+        self.addCleanup(layer._executor.shutdown)
+        return layer
+
+    async def receive(self, layer, channel, timeout=1.0):
+        return await asyncio.wait_for(layer.receive(channel), timeout)
+
+    async def test_send_and_receive(self):
+        layer = self.make_layer()
+        await layer.send('notifications', {'type': 'test.message', 'n': 1})
+        self.assertEqual(await self.receive(layer, 'notifications'), {'type': 'test.message', 'n': 1})
+
+        # Process-specific channels go through the per-process poller.
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'test.message', 'n': 2})
+        self.assertEqual((await self.receive(layer, channel))['n'], 2)
+        await layer.close()
+
+    async def test_group_send_reaches_another_process(self):
+        sender, receiver = self.make_layer(), self.make_layer()
+        channel = await receiver.new_channel()
+        await receiver.group_add('user_1', channel)
+        await sender.group_send('user_1', {'type': 'test.message', 'n': 1})
+        self.assertEqual((await self.receive(receiver, channel))['n'], 1)
+        await receiver.close()
+
+    async def test_send_to_a_full_channel_raises(self):
+        layer = self.make_layer(capacity=1)
+        await layer.send('notifications', {'type': 'test.message'})
+        with self.assertRaises(ChannelFull):
+            await layer.send('notifications', {'type': 'test.message'})
+
+    async def test_group_send_skips_full_channels(self):
+        layer = self.make_layer(capacity=1)
+        for channel in ('full', 'empty'):
+            await layer.group_add('everyone', channel)
+        await layer.send('full', {'type': 'test.message', 'n': 1})
+        await layer.group_send('everyone', {'type': 'test.message', 'n': 2})
+
+        self.assertEqual((await self.receive(layer, 'empty'))['n'], 2)
+        self.assertEqual((await self.receive(layer, 'full'))['n'], 1)
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(layer, 'full', timeout=0.1)
+
+    async def test_expired_message_removes_the_channel_from_its_groups(self):
+        layer = self.make_layer(expiry=0.05, cleanup_interval=0)
+        for channel in ('stalled', 'alive'):
+            await layer.group_add('everyone', channel)
+        await layer.send('stalled', {'type': 'test.message'})
+        await asyncio.sleep(0.1)
+
+        # Any receive sweeps expired messages.
+        await layer.send('alive', {'type': 'test.message'})
+        await self.receive(layer, 'alive')
+        self.assertEqual(await layer._run(layer._group_channels, 'everyone'), ['alive'])
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(layer, 'stalled', timeout=0.1)
+
+    async def test_group_membership_lapses_after_group_expiry(self):
+        layer = self.make_layer(group_expiry=0.05)
+        await layer.group_add('everyone', 'member')
+        await asyncio.sleep(0.1)
+        await layer.group_send('everyone', {'type': 'test.message'})
+        self.assertEqual(await layer._run(layer._group_channels, 'everyone'), [])
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(layer, 'member', timeout=0.1)
+
+        # Joining again renews the membership.
+        await layer.group_add('everyone', 'member')
+        await layer.group_send('everyone', {'type': 'test.message', 'n': 1})
+        self.assertEqual((await self.receive(layer, 'member'))['n'], 1)
+
+    async def test_idle_polling_takes_no_write_lock(self):
+        layer = self.make_layer(cleanup_interval=60)
+        await layer.send('warmup', {'type': 'test.message'})
+        await self.receive(layer, 'warmup')
+        writer = sqlite3.connect(self.path, isolation_level=None)
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            # Would wait for the writer's lock if polling an empty inbox wrote.
+            taken = await asyncio.wait_for(layer._run(layer._take, 'inbox', 'specific.idle!', 10), 1.0)
+        finally:
+            writer.execute('ROLLBACK')
+            writer.close()
+        self.assertEqual(taken, [])
+
+    async def test_a_slow_consumer_leaves_messages_in_the_database(self):
+        layer = self.make_layer(capacity=2)
+        listening, slow = await layer.new_channel(), await layer.new_channel()
+        # A pending receive keeps the process's poller running.
+        waiter = asyncio.ensure_future(layer.receive(listening))
+        await asyncio.sleep(0.05)
+        for n in range(2):
+            await layer.send(slow, {'type': 'test.message', 'n': n})
+        await asyncio.sleep(0.05)
+        self.assertEqual(layer._queues[slow].qsize(), 2)
+
+        # The local queue is full, so these stay in the database and count against the capacity.
+        for n in range(2, 4):
+            await layer.send(slow, {'type': 'test.message', 'n': n})
+        await asyncio.sleep(0.05)
+        self.assertEqual(layer._queues[slow].qsize(), 2)
+        with self.assertRaises(ChannelFull):
+            await layer.send(slow, {'type': 'test.message', 'n': 4})
+
+        self.assertEqual([(await self.receive(layer, slow))['n'] for _ in range(4)], [0, 1, 2, 3])
+        waiter.cancel()
+        await layer.close()
+
+
+@override_settings(RESPONSE_COMPRESSION=True, RESPONSE_COMPRESSION_MIN_SIZE=100)
+class CompressionMiddlewareTests(SimpleTestCase):
+    payload = {'results': [{'title': f'Note {i}', 'description': 'Merge sort, quick sort'} for i in range(20)]}
+
+    def respond(self, path='/api/notes/', accept_encoding='gzip', payload=None, etag=None):
+        def get_response(request):
+            response = JsonResponse(self.payload if payload is None else payload)
+            if etag:
+                response['ETag'] = etag
+            return response
+        request = RequestFactory().get(path, HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(get_response)(request)
+
+    def test_negotiation(self):
+        cases = {
+            'gzip, br': 'br',
+            'br;q=0.5, gzip': 'gzip',
+            'br;q=0, gzip;q=0': None,
+            '*': 'br',
+            '*;q=0.5, gzip': 'gzip',
+            'br;q=0, *': 'gzip',
+            'identity': None,
+            '': None,
+            None: None,
+        }
+        # Only whether the brotli package is importable matters here.
+        with mock.patch('noteshare_backend.middleware.brotli', object()):
+            for header, expected in cases.items():
+                self.assertEqual(negotiate_encoding(header), expected, header)
+        with mock.patch('noteshare_backend.middleware.brotli', None):
+            self.assertEqual(negotiate_encoding('br, gzip'), 'gzip')
+            self.assertIsNone(negotiate_encoding('br'))
+
+    def test_compresses_with_gzip(self):
+        response = self.respond()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), JsonResponse(self.payload).content)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_compresses_with_brotli(self):
+        response = self.respond(accept_encoding='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), JsonResponse(self.payload).content)
+
+    def test_small_and_unaccepted_bodies_are_sent_as_is(self):
+        for response in (self.respond(payload={'ok': True}), self.respond(accept_encoding='identity')):
+            self.assertFalse(response.has_header('Content-Encoding'))
+            # The representation still depends on Accept-Encoding.
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_strong_etags_become_weak(self):
+        self.assertEqual(self.respond(etag='"abc"')['ETag'], 'W/"abc"')
+        self.assertEqual(self.respond(etag='W/"abc"')['ETag'], 'W/"abc"')
+        self.assertEqual(self.respond(etag='"abc"', payload={'ok': True})['ETag'], '"abc"')
+
+    @override_settings(RESPONSE_COMPRESSION_PATHS=['/api/'])
+    def test_auth_endpoints_are_never_compressed(self):
+        for path in ('/api/users/login/', '/api/users/token/refresh/', '/api/users/register/'):
+            response = self.respond(path)
+            self.assertFalse(response.has_header('Content-Encoding'), path)
+            self.assertFalse(response.has_header('Vary'), path)
+        self.assertEqual(self.respond('/api/notifications/')['Content-Encoding'], 'gzip')
+
+    def test_default_paths_cover_only_public_listings(self):
+        self.assertEqual(self.respond('/api/reference/')['Content-Encoding'], 'gzip')
+        self.assertFalse(self.respond('/api/notifications/').has_header('Content-Encoding'))
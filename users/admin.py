@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin 
 from django.utils.html import format_html 
 
-from .models import User 
+from .models import QueuedEmail, User 
+from .profile_pictures import profile_picture_url
 
 @admin.register(User) 
 class UserAdmin(BaseUserAdmin):
@@ -62,13 +63,13 @@ class UserAdmin(BaseUserAdmin):
     )
     def profile_picture_thumbnail(self, obj):
         if obj.profile_picture:
-            return format_html('<img src="{}" width="40" height="40" style="object-fit: cover; border-radius: 50%;" />', obj.profile_picture.url)
+            return format_html('<img src="{}" width="40" height="40" style="object-fit: cover; border-radius: 50%;" />', profile_picture_url(obj, 40))
         return "-" 
     profile_picture_thumbnail.short_description = 'Pic' 
 
     def profile_picture_display(self, obj):
         if obj.profile_picture:
-            return format_html('<img src="{}" width="150" height="150" style="object-fit: cover;" />', obj.profile_picture.url)
+            return format_html('<img src="{}" width="150" height="150" style="object-fit: cover;" />', profile_picture_url(obj, 150))
         return "No image uploaded"
     profile_picture_display.short_description = 'Current Profile Picture'
 
@@ -76,4 +77,17 @@ class UserAdmin(BaseUserAdmin):
     def get_skills_display(self, obj):
         return ", ".join([o.name for o in obj.skills.all()])
     get_skills_display.short_description = 'Skills'
- 
\ No newline at end of file
+ 
+
+
+@admin.register(QueuedEmail)
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    # The bodies may carry password-reset and verification links; staff never see them.
+    exclude = ('body', 'html_body')
+    readonly_fields = ('subject', 'from_email', 'to', 'attempts', 'claimed_by', 'last_error', 'created_at', 'sent_at')
+
+    def has_add_permission(self, request):
+        return False
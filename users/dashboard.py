@@ -0,0 +1,96 @@
+# users/dashboard.py
+"""
+Dashboard assembly for DashboardDataView.
+
+The payload is built from a fixed query plan, independent of how many notes,
+ratings or comments the user has:
+
+    1. the user with department and stats, 2. their skills,
+    3. ids of the 5 most recent uploads, 4. ids of the 5 latest bookmarks,
+    5. both note lists in one query, 6-8. tags, ratings and comments for them,
+    9. the category distribution.
+
+Results are cached per user for DASHBOARD_CACHE_TTL seconds and dropped on
+the user's own writes (see invalidate_dashboard and its callers).
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Prefetch
+from notes.models import Bookmark, Comment, Like, Note, StarRating
+from notes.serializers import NoteSerializer
+from .models import User
+from .serializers import UserSerializer
+
+PIE_CHART_COLORS = ["#6366F1", "#EC4899", "#F59E0B", "#10B981", "#8B5CF6", "#F43F5E"]
+RECENT_LIMIT = 5
+
+
+def dashboard_cache_key(user_id):
+    return f'dashboard:{user_id}'
+
+
+def invalidate_dashboard(user_id):
+    if user_id:
+        cache.delete(dashboard_cache_key(user_id))
+
+
+def _dashboard_notes(user, note_ids):
+    notes = Note.objects.filter(pk__in=note_ids).select_related(
+        'uploader', 'uploader__department', 'department', 'course', 'category', 'faculty'
+    ).prefetch_related(
+        'tags',
+        Prefetch('star_ratings', queryset=StarRating.objects.select_related('user')),
+        Prefetch('comments', queryset=Comment.objects.select_related('user')),
+    ).annotate(
+        is_liked_by_current_user_annotated=Exists(Like.objects.filter(note=OuterRef('pk'), user=user)),
+        is_bookmarked_by_current_user_annotated=Exists(Bookmark.objects.filter(note=OuterRef('pk'), user=user)),
+    )
+    return {note.pk: note for note in notes}
+
+
+def build_dashboard(request):
+    user = User.objects.select_related('department', 'stats').get(pk=request.user.pk)
+    context = {'request': request}
+    user_data = UserSerializer(user, context=context).data
+
+    recent_ids = list(Note.objects.filter(uploader=user).order_by('-created_at').values_list('pk', flat=True)[:RECENT_LIMIT])
+    bookmarked_ids = list(
+        Bookmark.objects.filter(user=user, note__is_approved=True).order_by('-created_at').values_list('note_id', flat=True)[:RECENT_LIMIT]
+    )
+    notes = _dashboard_notes(user, set(recent_ids) | set(bookmarked_ids))
+
+    category_distribution = Note.objects.filter(uploader=user) \
+                                    .values('category__name') \
+                                    .annotate(value=Count('id')) \
+                                    .order_by('-value')
+
+    return {
+        'user': user_data,
+        'stats': {
+            'uploads': user_data.get('total_notes_uploaded', 0),
+            'downloads': user_data.get('total_notes_downloaded', 0),
+            'totalReviews': user_data.get('total_reviews_received', 0),
+            'avgRating': user_data.get('average_rating_of_all_notes', 0.0),
+        },
+        'myNotes': NoteSerializer([notes[pk] for pk in recent_ids if pk in notes], many=True, context=context).data,
+        'bookmarks': NoteSerializer([notes[pk] for pk in bookmarked_ids if pk in notes], many=True, context=context).data,
+        'performanceData': [
+            {**item, 'name': item['category__name'], 'color': PIE_CHART_COLORS[i % len(PIE_CHART_COLORS)]}
+            for i, item in enumerate(category_distribution) if item.get('category__name')
+        ],
+    }
+
+
+def get_dashboard(request):
+    """Returns (data, cache_hit) for the requesting user."""
+    key = dashboard_cache_key(request.user.pk)
+    # Absolute URLs in the payload depend on the host the request came in on.
+    origin = f'{request.scheme}://{request.get_host()}'
+    cached = cache.get(key) or {}
+    if origin in cached:
+        return cached[origin], True
+    data = build_dashboard(request)
+    cached[origin] = data
+    cache.set(key, cached, settings.DASHBOARD_CACHE_TTL)
+    return data, False
@@ -0,0 +1,223 @@
+# users/email_queue.py
+"""
+Outgoing email queue.
+
+Views call enqueue_email(), which only inserts a QueuedEmail row, so a slow
+SMTP server never adds to request latency. Due rows are sent by
+send_queued_batch():
+
+  - rows are claimed with a single UPDATE, so several workers never send the
+    same email; a claim lapses after EMAIL_QUEUE_CLAIM_SECONDS if a worker
+    dies mid-batch;
+  - a batch goes out over one connection from the configured EMAIL_BACKEND
+    (SMTP, or locmem/file in tests), reopened only after an error;
+  - failures back off exponentially and are marked FAILED after
+    EMAIL_QUEUE_MAX_ATTEMPTS;
+  - once a row is SENT or FAILED its bodies are blanked: they may hold
+    one-time links (password reset, email verification) that must not
+    outlive delivery in the database or the admin.
+
+Sent rows are deleted after EMAIL_QUEUE_KEEP_SENT_DAYS by whichever sender
+runs, the background thread or `send_queued_emails`.
+
+After the enqueuing transaction commits, a background thread in the same
+process drains the queue (EMAIL_QUEUE_BACKGROUND). Disable it when running the
+`send_queued_emails` worker instead; EMAIL_QUEUE_EAGER sends right after the
+commit in the calling thread (handy for scripts).
+"""
+
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 3600
+PURGE_INTERVAL_SECONDS = 3600
+
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def enqueue_email(subject, plain_message, html_message, recipients, from_email=None):
+    """Queues an email and returns the QueuedEmail row."""
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    queued = QueuedEmail.objects.create(
+        subject=subject,
+        body=plain_message,
+        html_body=html_message or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipients),
+    )
+    transaction.on_commit(_queued_email_committed)
+    return queued
+
+
+def _queued_email_committed():
+    if settings.EMAIL_QUEUE_EAGER:
+        drain_queue()
+    elif settings.EMAIL_QUEUE_BACKGROUND:
+        _start_worker()
+        _wakeup.set()
+
+
+def claim_due_emails(batch_size=None, now=None):
+    """Claims up to `batch_size` due emails for this worker and returns them."""
+    batch_size = batch_size or settings.EMAIL_QUEUE_BATCH_SIZE
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    due = QueuedEmail.objects.filter(
+        status__in=[QueuedEmail.Status.PENDING, QueuedEmail.Status.SENDING],
+        next_attempt_at__lte=now,
+    )
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    # The due conditions are repeated so a row claimed by another worker in
+    # the meantime is left alone.
+    due.filter(pk__in=ids).update(
+        status=QueuedEmail.Status.SENDING,
+        claimed_by=token,
+        next_attempt_at=now + timedelta(seconds=settings.EMAIL_QUEUE_CLAIM_SECONDS),
+    )
+    return list(QueuedEmail.objects.filter(claimed_by=token, status=QueuedEmail.Status.SENDING).order_by('id'))
+
+
+def _build_message(queued, mail_connection):
+    message = EmailMultiAlternatives(
+        subject=queued.subject,
+        body=queued.body,
+        from_email=queued.from_email,
+        to=queued.to,
+        connection=mail_connection,
+    )
+    if queued.html_body:
+        message.attach_alternative(queued.html_body, "text/html")
+    return message
+
+
+def _close_quietly(mail_connection):
+    try:
+        mail_connection.close()
+    except Exception:
+        pass
+
+
+def send_queued_batch(batch_size=None, max_attempts=None):
+    """
+    Sends one batch of due emails over a single connection. Returns a dict
+    with the number of emails sent, scheduled for a retry and given up.
+    """
+    max_attempts = max_attempts or settings.EMAIL_QUEUE_MAX_ATTEMPTS
+    summary = {'sent': 0, 'retrying': 0, 'failed': 0}
+    claimed = claim_due_emails(batch_size)
+    if not claimed:
+        return summary
+
+    sent, failed = [], []
+    mail_connection = get_connection(fail_silently=False)
+    try:
+        for index, queued in enumerate(claimed):
+            try:
+                # open() is a no-op while the connection is up.
+                mail_connection.open()
+            except Exception as e:
+                # Server unreachable: the rest of the batch would fail the same way.
+                for unsent in claimed[index:]:
+                    unsent.attempts += 1
+                    unsent.last_error = str(e)[:1000]
+                    failed.append(unsent)
+                break
+            queued.attempts += 1
+            try:
+                _build_message(queued, mail_connection).send(fail_silently=False)
+            except Exception as e:
+                queued.last_error = str(e)[:1000]
+                failed.append(queued)
+                # The server may have dropped us; the next email opens a fresh connection.
+                _close_quietly(mail_connection)
+            else:
+                sent.append(queued)
+    finally:
+        _close_quietly(mail_connection)
+
+    now = timezone.now()
+    for queued in sent:
+        queued.status = QueuedEmail.Status.SENT
+        queued.sent_at = now
+        queued.last_error = ''
+    for queued in failed:
+        if queued.attempts >= max_attempts:
+            queued.status = QueuedEmail.Status.FAILED
+            summary['failed'] += 1
+            logger.error(f"Giving up on email {queued.pk} to {', '.join(queued.to)}: {queued.last_error}")
+        else:
+            queued.status = QueuedEmail.Status.PENDING
+            queued.next_attempt_at = now + timedelta(seconds=min(60 * 2 ** (queued.attempts - 1), MAX_BACKOFF_SECONDS))
+            summary['retrying'] += 1
+            logger.warning(f"Email {queued.pk} to {', '.join(queued.to)} failed (attempt {queued.attempts}), retrying: {queued.last_error}")
+    for queued in sent + failed:
+        queued.claimed_by = ''
+        if queued.status != QueuedEmail.Status.PENDING:
+            queued.body = queued.html_body = ''
+    QueuedEmail.objects.bulk_update(
+        sent + failed, ['status', 'attempts', 'next_attempt_at', 'claimed_by', 'last_error', 'sent_at', 'body', 'html_body'],
+    )
+    summary['sent'] = len(sent)
+    if sent:
+        logger.info(f"Sent {len(sent)} queued emails")
+    return summary
+
+
+def drain_queue(batch_size=None, max_attempts=None):
+    """Sends batches until nothing is due; returns the summed counts."""
+    totals = {'sent': 0, 'retrying': 0, 'failed': 0}
+    while True:
+        summary = send_queued_batch(batch_size, max_attempts)
+        for key, count in summary.items():
+            totals[key] += count
+        if not any(summary.values()):
+            return totals
+
+
+def purge_sent_emails(days=None):
+    """Deletes sent emails older than `days` (EMAIL_QUEUE_KEEP_SENT_DAYS); returns how many."""
+    days = settings.EMAIL_QUEUE_KEEP_SENT_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = QueuedEmail.objects.filter(status=QueuedEmail.Status.SENT, sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def _start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='email-queue', daemon=True)
+            _worker.start()
+
+
+def _run_worker():
+    purged_at = None
+    while True:
+        # Woken by new emails; the timeout picks up retries that came due.
+        _wakeup.wait(timeout=settings.EMAIL_QUEUE_POLL_INTERVAL)
+        _wakeup.clear()
+        try:
+            drain_queue()
+            if purged_at is None or time.monotonic() - purged_at > PURGE_INTERVAL_SECONDS:
+                purge_sent_emails()
+                purged_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Email queue worker failed: {e}", exc_info=True)
+        finally:
+            db_connection.close()
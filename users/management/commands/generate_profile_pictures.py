@@ -0,0 +1,44 @@
+# users/management/commands/generate_profile_pictures.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from users.models import User
+from users.profile_pictures import generate_renditions, renditions_current
+
+
+class Command(BaseCommand):
+    help = 'Generates the sized renditions (PROFILE_PICTURE_SIZES) of existing profile pictures under media/profile_pics/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that are already up to date.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        users = User.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+        generated = skipped = failed = 0
+        original_bytes = rendition_bytes = 0
+        for user in users.only('id', 'profile_picture', 'profile_picture_renditions').iterator():
+            if renditions_current(user) and not options['force']:
+                skipped += 1
+                continue
+            storage = user.profile_picture.storage
+            if not storage.exists(user.profile_picture.name):
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'User {user.pk}: picture missing at {user.profile_picture.name}'))
+                continue
+            renditions = generate_renditions(user.pk, force=options['force'])
+            sizes = (renditions or {}).get('sizes')
+            if not sizes:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'User {user.pk}: could not decode {user.profile_picture.name}'))
+                continue
+            generated += 1
+            original_bytes += storage.size(user.profile_picture.name)
+            rendition_bytes += storage.size(sizes[max(sizes, key=int)])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated renditions for {generated} users in {time.monotonic() - started:.1f}s '
+            f'({skipped} up to date, {failed} failed); largest renditions total {rendition_bytes / 1024 / 1024:.1f} MiB '
+            f'against {original_bytes / 1024 / 1024:.1f} MiB of originals.'
+        ))
@@ -0,0 +1,24 @@
+# users/management/commands/rebuild_user_stats.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from users.stats import rebuild_user_stats, users_with_stats_drift
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the UserStats table from notes, likes, bookmarks, ratings and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report users whose stored stats have drifted.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['dry_run']:
+            drifted = users_with_stats_drift().count()
+            self.stdout.write(self.style.WARNING(f'{drifted} users have missing or drifted stats (dry run, nothing written).'))
+            return
+
+        written = rebuild_user_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {written} users in {time.monotonic() - started:.2f}s.'))
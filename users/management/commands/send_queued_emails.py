@@ -0,0 +1,44 @@
+# users/management/commands/send_queued_emails.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from users.email_queue import PURGE_INTERVAL_SECONDS, drain_queue, purge_sent_emails
+
+
+class Command(BaseCommand):
+    help = 'Sends queued emails in batches over one mail connection, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send what is currently due and exit.')
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails per connection (default: EMAIL_QUEUE_BATCH_SIZE).')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait when nothing is due.')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Attempts before an email is marked failed (default: EMAIL_QUEUE_MAX_ATTEMPTS).')
+
+    def handle(self, *args, **options):
+        totals = {'sent': 0, 'retrying': 0, 'failed': 0}
+        purged_at = 0.0
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() - purged_at > PURGE_INTERVAL_SECONDS:
+                    purged = purge_sent_emails()
+                    purged_at = time.monotonic()
+                    if purged:
+                        self.stdout.write(self.style.NOTICE(f'Purged {purged} sent emails older than {settings.EMAIL_QUEUE_KEEP_SENT_DAYS} days.'))
+                summary = drain_queue(options['batch_size'], options['max_attempts'])
+                for key, count in summary.items():
+                    totals[key] += count
+                if summary['failed']:
+                    self.stdout.write(self.style.WARNING(f"Gave up on {summary['failed']} emails (see Queued Emails in the admin)."))
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} emails ({totals['retrying']} retries scheduled, {totals['failed']} given up)."
+        ))
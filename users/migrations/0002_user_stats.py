@@ -0,0 +1,72 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_user_stats(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    UserStats = apps.get_model('users', 'UserStats')
+    Note = apps.get_model('notes', 'Note')
+    Bookmark = apps.get_model('notes', 'Bookmark')
+    Comment = apps.get_model('notes', 'Comment')
+    StarRating = apps.get_model('notes', 'StarRating')
+
+    def per_user(queryset, user_field, aggregate):
+        subquery = queryset.filter(**{user_field: OuterRef('pk')}).order_by().values(user_field).annotate(value=aggregate).values('value')
+        return Coalesce(Subquery(subquery), Value(0), output_field=IntegerField())
+
+    users = User.objects.annotate(
+        s_notes_uploaded=per_user(Note.objects.all(), 'uploader', Count('pk')),
+        s_notes_liked=per_user(Note.objects.filter(likes_count__gt=0), 'uploader', Count('pk')),
+        s_notes_bookmarked=per_user(Note.objects.filter(bookmarks_count__gt=0), 'uploader', Count('pk')),
+        s_downloads_received=per_user(Note.objects.all(), 'uploader', Sum('download_count')),
+        s_bookmarks_made=per_user(Bookmark.objects.all(), 'user', Count('pk')),
+        s_reviews_received=per_user(Comment.objects.all(), 'note__uploader', Count('pk')),
+        s_approved_rating_sum=per_user(StarRating.objects.filter(note__is_approved=True), 'note__uploader', Sum('stars')),
+        s_approved_rating_count=per_user(StarRating.objects.filter(note__is_approved=True), 'note__uploader', Count('pk')),
+    )
+    fields = ['notes_uploaded', 'notes_liked', 'notes_bookmarked', 'downloads_received', 'bookmarks_made',
+              'reviews_received', 'approved_rating_sum', 'approved_rating_count']
+    batch = []
+    for user in users.iterator(chunk_size=500):
+        batch.append(UserStats(user_id=user.pk, **{field: getattr(user, f's_{field}') for field in fields}))
+        if len(batch) >= 500:
+            UserStats.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        UserStats.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('notes', '0005_note_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('notes_uploaded', models.PositiveIntegerField(default=0)),
+                ('notes_liked', models.PositiveIntegerField(default=0, help_text='Uploaded notes with at least one like.')),
+                ('notes_bookmarked', models.PositiveIntegerField(default=0, help_text='Uploaded notes with at least one bookmark.')),
+                ('downloads_received', models.PositiveIntegerField(default=0)),
+                ('bookmarks_made', models.PositiveIntegerField(default=0)),
+                ('reviews_received', models.PositiveIntegerField(default=0, help_text="Comments on the user's notes.")),
+                ('approved_rating_sum', models.PositiveIntegerField(default=0)),
+                ('approved_rating_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'User Stats',
+                'verbose_name_plural': 'User Stats',
+            },
+        ),
+        migrations.RunPython(backfill_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_queued_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_picture_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of profile_picture, written by users.profile_pictures.'),
+        ),
+    ]
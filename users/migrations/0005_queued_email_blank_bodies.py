@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+def blank_delivered_bodies(apps, schema_editor):
+    QueuedEmail = apps.get_model('users', 'QueuedEmail')
+    QueuedEmail.objects.filter(status__in=['SENT', 'FAILED']).update(body='', html_body='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_profile_picture_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queuedemail',
+            name='body',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(blank_delivered_bodies, migrations.RunPython.noop),
+    ]
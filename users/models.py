@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 import uuid 
 from django.core.validators import RegexValidator
 from taggit.managers import TaggableManager
@@ -26,6 +27,12 @@ class User(AbstractUser):
         null=True,                           
         blank=True                          
     )
+    profile_picture_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Resized copies of profile_picture, written by users.profile_pictures."
+    )
     student_id_validator = RegexValidator(
         regex=r'^\d{3}-\d{3}-\d{3}$', 
         message="Student ID must be in the format: 'XXX-XXX-XXX' (e.g., 222-115-141)."
@@ -68,4 +75,70 @@ class User(AbstractUser):
     skills = TaggableManager(blank=True, help_text="A comma-separated list of skills (e.g., Python, Django, React).")
     
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.username
+
+
+class UserStats(models.Model):
+    """
+    Per-user totals shown on profiles and the dashboard, kept current by the
+    note/like/bookmark/rating/comment signal handlers (see users.stats).
+    `rebuild_user_stats` recomputes every row from scratch.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    notes_uploaded = models.PositiveIntegerField(default=0)
+    notes_liked = models.PositiveIntegerField(default=0, help_text="Uploaded notes with at least one like.")
+    notes_bookmarked = models.PositiveIntegerField(default=0, help_text="Uploaded notes with at least one bookmark.")
+    downloads_received = models.PositiveIntegerField(default=0)
+    bookmarks_made = models.PositiveIntegerField(default=0)
+    reviews_received = models.PositiveIntegerField(default=0, help_text="Comments on the user's notes.")
+    approved_rating_sum = models.PositiveIntegerField(default=0)
+    approved_rating_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "User Stats"
+        verbose_name_plural = "User Stats"
+
+    def __str__(self):
+        return f"Stats for user {self.user_id}"
+
+    @property
+    def average_rating(self):
+        if not self.approved_rating_count:
+            return 0.0
+        return round(self.approved_rating_sum / self.approved_rating_count, 2)
+
+
+class QueuedEmail(models.Model):
+    """
+    An outgoing email. Requests only insert a row; users.email_queue sends
+    due rows in batches over one SMTP connection and records the outcome.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        SENDING = 'SENDING', 'Sending'
+        SENT = 'SENT', 'Sent'
+        FAILED = 'FAILED', 'Failed'
+
+    subject = models.CharField(max_length=255)
+    # Blanked once the email is sent or given up; they may hold one-time links.
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text="When the row is due; for SENDING rows, when the claim lapses.")
+    claimed_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='users_email_due')]
+        verbose_name = "Queued Email"
+        verbose_name_plural = "Queued Emails"
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
@@ -0,0 +1,186 @@
+# users/profile_pictures.py
+"""
+Sized renditions of profile pictures.
+
+Phone photos are uploaded at several megabytes; lists only need an avatar.
+After a new picture is committed, a background thread decodes it once and
+writes square WebP (or JPEG) copies at PROFILE_PICTURE_SIZES next to it under
+renditions/. User.profile_picture_renditions records them together with the
+source they were made from, so a replaced picture is noticed and renditions
+are never served for the wrong image.
+
+profile_picture_url() picks the smallest rendition at least as large as the
+`?size=` hint (the largest without one) and falls back to the original until
+the renditions exist. `generate_profile_pictures` backfills existing uploads.
+"""
+
+import logging
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection as db_connection, transaction
+from PIL import Image, ImageOps
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rendition_name(source_name, size, image_format):
+    directory, filename = posixpath.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return posixpath.join(directory, 'renditions', f'{stem}-{size}.{EXTENSIONS[image_format]}')
+
+
+def renditions_current(user):
+    renditions = user.profile_picture_renditions or {}
+    return (
+        renditions.get('source') == user.profile_picture.name
+        and renditions.get('format') == settings.PROFILE_PICTURE_FORMAT.upper()
+        and set(renditions.get('sizes', {})) == {str(size) for size in settings.PROFILE_PICTURE_SIZES}
+    )
+
+
+def pick_rendition(user, size=None):
+    """Storage name of the picture to serve for a `size` px hint, or None without a picture."""
+    if not user.profile_picture:
+        return None
+    renditions = user.profile_picture_renditions or {}
+    sizes = renditions.get('sizes')
+    if not sizes or renditions.get('source') != user.profile_picture.name:
+        return user.profile_picture.name
+    available = sorted(int(s) for s in sizes)
+    chosen = next((s for s in available if size is not None and s >= size), available[-1])
+    return sizes[str(chosen)]
+
+
+def profile_picture_url(user, size=None):
+    name = pick_rendition(user, size)
+    return user.profile_picture.storage.url(name) if name else None
+
+
+def requested_size(request):
+    """The ?size= hint in pixels, or None if absent or unusable."""
+    try:
+        size = int(request.query_params.get('size', ''))
+    except (AttributeError, ValueError):
+        return None
+    return size if size > 0 else None
+
+
+def render(image, size, image_format):
+    """Encodes a centred square crop of `image` at `size` px (never upscaled)."""
+    side = min(size, *image.size)
+    square = ImageOps.fit(image, (side, side), method=Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    square.save(buffer, image_format, quality=settings.PROFILE_PICTURE_QUALITY, optimize=image_format == 'JPEG')
+    return buffer.getvalue()
+
+
+def build_renditions(user):
+    """Writes every rendition of the user's picture and returns the renditions record."""
+    source = user.profile_picture.name
+    storage = user.profile_picture.storage
+    image_format = settings.PROFILE_PICTURE_FORMAT.upper()
+    largest = max(settings.PROFILE_PICTURE_SIZES)
+    with storage.open(source, 'rb') as f, Image.open(f) as image:
+        # Lets the JPEG decoder scale down while decoding instead of producing the full 12 MP.
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        keep_alpha = image_format == 'WEBP' and image.mode in ('RGBA', 'LA', 'PA')
+        image = image.convert('RGBA' if keep_alpha else 'RGB')
+        sizes = {}
+        for size in settings.PROFILE_PICTURE_SIZES:
+            name = rendition_name(source, size, image_format)
+            if storage.exists(name):
+                storage.delete(name)
+            sizes[str(size)] = storage.save(name, ContentFile(render(image, size, image_format)))
+    return {'source': source, 'format': image_format, 'sizes': sizes}
+
+
+def _delete_files(storage, names):
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError as e:
+            logger.warning(f"Could not delete profile picture rendition {name}: {e}")
+
+
+def generate_renditions(user_id, force=False):
+    """
+    Brings the user's renditions up to date with their current picture and
+    returns the renditions record (None if the user was deleted or the
+    picture replaced meanwhile).
+    """
+    from .dashboard import invalidate_dashboard
+
+    user = User.objects.filter(pk=user_id).only('id', 'profile_picture', 'profile_picture_renditions').first()
+    if user is None:
+        return None
+    storage = user.profile_picture.storage
+    previous = set((user.profile_picture_renditions or {}).get('sizes', {}).values())
+    if not user.profile_picture:
+        if not user.profile_picture_renditions:
+            return {}
+        renditions = {}
+    elif renditions_current(user) and not force:
+        return user.profile_picture_renditions
+    else:
+        try:
+            renditions = build_renditions(user)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            logger.warning(f"Could not make renditions of {user.profile_picture.name} for user {user_id}: {e}")
+            # Recorded without sizes so the original is served and later saves don't retry it.
+            renditions = {'source': user.profile_picture.name, 'sizes': {}}
+
+    # update() keeps the save signal out of it, and the filter leaves a picture replaced meanwhile alone.
+    rows = User.objects.filter(pk=user_id)
+    if user.profile_picture:
+        rows = rows.filter(profile_picture=user.profile_picture.name)
+    updated = rows.update(profile_picture_renditions=renditions)
+    written = set(renditions.get('sizes', {}).values())
+    if not updated:
+        _delete_files(storage, written - previous)
+        return None
+    _delete_files(storage, previous - written)
+    invalidate_dashboard(user_id)
+    return renditions
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.PROFILE_PICTURE_WORKERS, thread_name_prefix='profile-pictures')
+        return _executor
+
+
+def schedule_renditions(user_id):
+    """Generates the user's renditions after the current transaction commits."""
+    transaction.on_commit(partial(_submit, user_id))
+
+
+def _submit(user_id):
+    if settings.PROFILE_PICTURE_EAGER:
+        generate_renditions(user_id)
+        return
+    get_executor().submit(_run, user_id)
+
+
+def _run(user_id):
+    try:
+        generate_renditions(user_id)
+    except Exception as e:
+        logger.error(f"Profile picture renditions failed for user {user_id}: {e}", exc_info=True)
+    finally:
+        db_connection.close()
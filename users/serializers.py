@@ -5,8 +5,9 @@ from taggit.managers import TaggableManager
 import logging
 from django.db import models
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from notes.models import Department, Note, Comment 
-from django.db.models import Avg, Sum, Count
+from notes.models import Department
+from .stats import get_user_stats
+from .profile_pictures import profile_picture_url, requested_size
 logger = logging.getLogger(__name__)
 
 User = get_user_model() 
@@ -147,26 +148,25 @@ class UserSerializer(serializers.ModelSerializer):
     def get_profile_picture_url(self, obj):
         request = self.context.get('request')
         if obj.profile_picture and hasattr(obj.profile_picture, 'url'):
-            return request.build_absolute_uri(obj.profile_picture.url)
+            # ?size= picks the smallest rendition that covers it (users.profile_pictures).
+            return request.build_absolute_uri(profile_picture_url(obj, requested_size(request)))
         return None
     def get_total_notes_uploaded(self, obj): 
-        return Note.objects.filter(uploader=obj).count()
+        return get_user_stats(obj).notes_uploaded
     def get_total_notes_liked_by_others(self, obj): 
-        return Note.objects.filter(uploader=obj, likes__isnull=False).distinct().count()
+        return get_user_stats(obj).notes_liked
     def get_total_notes_downloaded(self, obj): 
-        return Note.objects.filter(uploader=obj).aggregate(total_downloads=models.Sum('download_count'))['total_downloads'] or 0
+        return get_user_stats(obj).downloads_received
     def get_total_notes_bookmarked_by_others(self, obj): 
-        return Note.objects.filter(uploader=obj, bookmarks__isnull=False).distinct().count()
+        return get_user_stats(obj).notes_bookmarked
     def get_total_bookmarked_notes_by_user(self, obj): 
-        return obj.bookmarked_notes.count()
+        return get_user_stats(obj).bookmarks_made
     
     def get_average_rating_of_all_notes(self, obj):
-        avg_rating = Note.objects.filter(uploader=obj, is_approved=True) \
-                                 .aggregate(avg_rating=Avg('star_ratings__stars'))['avg_rating']
-        return round(avg_rating, 2) if avg_rating else 0.0
+        return get_user_stats(obj).average_rating
     
     def get_total_reviews_received(self, obj):
-        return Comment.objects.filter(note__uploader=obj).count()
+        return get_user_stats(obj).reviews_received
     
     
     def update(self, instance, validated_data):
@@ -0,0 +1,22 @@
+# users/signals.py
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import User, UserStats
+from .dashboard import invalidate_dashboard
+from .profile_pictures import schedule_renditions
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user_id=instance.pk)
+    else:
+        invalidate_dashboard(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def refresh_profile_picture_renditions(sender, instance, **kwargs):
+    renditions = instance.profile_picture_renditions or {}
+    if (instance.profile_picture.name or '') != renditions.get('source', ''):
+        schedule_renditions(instance.pk)
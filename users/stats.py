@@ -0,0 +1,121 @@
+# users/stats.py
+
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from notes.models import Bookmark, Comment, Note, StarRating
+from .models import User, UserStats
+
+STAT_FIELDS = (
+    'notes_uploaded', 'notes_liked', 'notes_bookmarked', 'downloads_received',
+    'bookmarks_made', 'reviews_received', 'approved_rating_sum', 'approved_rating_count',
+)
+
+
+def _shifted(field, delta):
+    if delta < 0:
+        return Greatest(F(field) + delta, Value(0))
+    return F(field) + delta
+
+
+def _apply(queryset, deltas):
+    updates = {}
+    for field, delta in deltas.items():
+        if field not in STAT_FIELDS:
+            raise ValueError(f"Unknown user stat: {field}")
+        if delta:
+            updates[field] = _shifted(field, delta)
+    if updates:
+        queryset.update(**updates)
+
+
+def adjust_user_stats(user_id, **deltas):
+    """Applies stat deltas to one user in a single UPDATE, e.g. bookmarks_made=1."""
+    _apply(UserStats.objects.filter(user_id=user_id), deltas)
+
+
+def adjust_uploader_stats(note_id, approved_only=False, note_filter=None, **deltas):
+    """
+    Applies stat deltas to the uploader of `note_id` without loading the note.
+    `approved_only` restricts the update to approved notes, and `note_filter`
+    adds conditions on the note row, e.g. {'likes_count': 1} to count a note
+    only when its first like arrives.
+    """
+    conditions = {'user__uploaded_notes__pk': note_id}
+    if approved_only:
+        conditions['user__uploaded_notes__is_approved'] = True
+    for field, value in (note_filter or {}).items():
+        conditions[f'user__uploaded_notes__{field}'] = value
+    _apply(UserStats.objects.filter(**conditions), deltas)
+
+
+def add_downloads_received(counts):
+    """Adds buffered download counts ({note_id: n}) to the uploaders' totals."""
+    per_user = {}
+    for note_id, uploader_id in Note.objects.filter(pk__in=list(counts)).values_list('pk', 'uploader_id'):
+        per_user[uploader_id] = per_user.get(uploader_id, 0) + counts[note_id]
+    for user_id, count in per_user.items():
+        adjust_user_stats(user_id, downloads_received=count)
+
+
+def _per_user(queryset, user_field, aggregate):
+    subquery = queryset.filter(**{user_field: OuterRef('pk')}).order_by().values(user_field).annotate(value=aggregate).values('value')
+    return Coalesce(Subquery(subquery), Value(0), output_field=IntegerField())
+
+
+def annotate_user_stats(queryset):
+    """Annotates users with every stat recomputed from the source tables."""
+    return queryset.annotate(
+        actual_notes_uploaded=_per_user(Note.objects.all(), 'uploader', Count('pk')),
+        actual_notes_liked=_per_user(Note.objects.filter(likes_count__gt=0), 'uploader', Count('pk')),
+        actual_notes_bookmarked=_per_user(Note.objects.filter(bookmarks_count__gt=0), 'uploader', Count('pk')),
+        actual_downloads_received=_per_user(Note.objects.all(), 'uploader', Sum('download_count')),
+        actual_bookmarks_made=_per_user(Bookmark.objects.all(), 'user', Count('pk')),
+        actual_reviews_received=_per_user(Comment.objects.all(), 'note__uploader', Count('pk')),
+        actual_approved_rating_sum=_per_user(StarRating.objects.filter(note__is_approved=True), 'note__uploader', Sum('stars')),
+        actual_approved_rating_count=_per_user(StarRating.objects.filter(note__is_approved=True), 'note__uploader', Count('pk')),
+    )
+
+
+def rebuild_user_stats(user_ids=None, batch_size=500):
+    """
+    Recomputes stats for all users (or `user_ids`) with one annotated SELECT
+    and batched upserts. Returns the number of rows written.
+    """
+    users = User.objects.all() if user_ids is None else User.objects.filter(pk__in=user_ids)
+    rows = annotate_user_stats(users.order_by('pk')).values('pk', *[f'actual_{field}' for field in STAT_FIELDS])
+
+    written = 0
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(UserStats(user_id=row['pk'], **{field: row[f'actual_{field}'] for field in STAT_FIELDS}))
+        if len(batch) >= batch_size:
+            written += _upsert(batch)
+            batch = []
+    written += _upsert(batch)
+    return written
+
+
+def _upsert(batch):
+    if not batch:
+        return 0
+    UserStats.objects.bulk_create(
+        batch, update_conflicts=True, unique_fields=['user'], update_fields=list(STAT_FIELDS) + ['updated_at'],
+    )
+    return len(batch)
+
+
+def get_user_stats(user):
+    """Returns the user's stats row, building it on first access."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        rebuild_user_stats([user.pk])
+        user.stats = UserStats.objects.get(user=user)
+        return user.stats
+
+
+def users_with_stats_drift():
+    drift = Q(stats__isnull=True)
+    for field in STAT_FIELDS:
+        drift |= ~Q(**{f'stats__{field}': F(f'actual_{field}')})
+    return annotate_user_stats(User.objects.all()).filter(drift)
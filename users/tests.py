@@ -1,3 +1,224 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from smtplib import SMTPServerDisconnected
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from notes.models import Bookmark, Comment, Department, Like, Note, NoteCategory, StarRating
+from .email_queue import _run_worker, drain_queue, enqueue_email
+from .models import QueuedEmail, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DashboardQueryBudgetTests(TestCase):
+    """The dashboard must cost the same number of queries however much data the user has."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='CSE')
+        self.user = User.objects.create_user(
+            username='owner', password='x', email='owner@example.com',
+            student_id='111-111-111', department=self.department,
+        )
+        self.reader = User.objects.create_user(
+            username='reader', password='x', email='reader@example.com', student_id='111-111-112',
+        )
+        self.categories = [NoteCategory.objects.create(name=f'Category {i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_activity(self, count):
+        start = Note.objects.filter(uploader=self.user).count()
+        for i in range(start, start + count):
+            note = Note.objects.create(
+                uploader=self.user, title=f'Note {i}', category=self.categories[i % 3],
+                department=self.department, is_approved=True,
+                file=SimpleUploadedFile(f'note{i}.txt', b'content'),
+            )
+            note.tags.add(f'tag{i}', 'shared')
+            for user in (self.user, self.reader):
+                Comment.objects.create(note=note, user=user, text='comment')
+                StarRating.objects.create(note=note, user=user, stars=4)
+            Like.objects.create(note=note, user=self.reader)
+            Bookmark.objects.create(note=note, user=self.user)
+
+    def dashboard_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        return len(queries), response.json()
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.add_activity(1)
+        small, data = self.dashboard_queries()
+        self.assertEqual(len(data['myNotes']), 1)
+
+        self.add_activity(12)
+        large, data = self.dashboard_queries()
+        self.assertEqual(len(data['myNotes']), 5)
+        self.assertEqual(len(data['bookmarks']), 5)
+        self.assertEqual(data['stats']['uploads'], 13)
+
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 9)
+
+    def test_cached_response_skips_the_database(self):
+        self.add_activity(3)
+        self.client.get('/api/users/dashboard/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/dashboard/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_own_writes_invalidate_the_cache(self):
+        self.add_activity(2)
+        self.client.get('/api/users/dashboard/')
+        Bookmark.objects.filter(user=self.user).delete()
+
+        response = self.client.get('/api/users/dashboard/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['bookmarks'], [])
+
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPServerDisconnected('Connection unexpectedly closed')
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_QUEUE_BACKGROUND=False, EMAIL_QUEUE_EAGER=False, EMAIL_QUEUE_MAX_ATTEMPTS=2,
+)
+class EmailQueueTests(TestCase):
+    def test_registration_only_queues_the_email(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/users/register/', {
+                'username': 'newbie', 'email': 'newbie@example.com', 'student_id': '222-115-141',
+                'password': 'Str0ng-pass!', 'password2': 'Str0ng-pass!',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = QueuedEmail.objects.get()
+        self.assertEqual(queued.to, ['newbie@example.com'])
+
+        self.assertEqual(drain_queue()['sent'], 1)
+        self.assertEqual(mail.outbox[0].subject, 'Verify your email address for NoteShare')
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, QueuedEmail.Status.SENT)
+
+    def test_batch_shares_one_connection(self):
+        for i in range(3):
+            enqueue_email(f'Subject {i}', 'body', '', f'user{i}@example.com')
+        with mock.patch('users.email_queue.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(drain_queue(batch_size=10)['sent'], 3)
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual([message.to for message in mail.outbox], [['user0@example.com'], ['user1@example.com'], ['user2@example.com']])
+
+    @override_settings(EMAIL_BACKEND='users.tests.FailingEmailBackend')
+    def test_failures_back_off_then_give_up(self):
+        queued = enqueue_email('Subject', 'body', '', 'user@example.com')
+        self.assertEqual(drain_queue(), {'sent': 0, 'retrying': 1, 'failed': 0})
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, QueuedEmail.Status.PENDING)
+        self.assertIn('unexpectedly closed', queued.last_error)
+        # Not due again until the backoff has passed.
+        self.assertEqual(drain_queue(), {'sent': 0, 'retrying': 0, 'failed': 0})
+
+        QueuedEmail.objects.update(next_attempt_at=queued.created_at)
+        self.assertEqual(drain_queue(), {'sent': 0, 'retrying': 0, 'failed': 1})
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (QueuedEmail.Status.FAILED, 2))
+        self.assertEqual(queued.body, '')
+
+    def test_bodies_are_blanked_once_sent(self):
+        link = 'https://example.com/reset/MQ/abc-123/'
+        queued = enqueue_email('Reset your password', f'Reset: {link}', f'<a href="{link}">Reset</a>', 'user@example.com')
+        drain_queue()
+        self.assertIn(link, mail.outbox[0].body)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.body, queued.html_body), (QueuedEmail.Status.SENT, '', ''))
+
+    def test_admin_never_shows_the_bodies(self):
+        link = 'https://example.com/reset/MQ/abc-123/'
+        queued = enqueue_email('Reset your password', f'Reset: {link}', '', 'user@example.com')
+        admin = User.objects.create_superuser(username='admin', password='x', email='admin@example.com', student_id='111-111-199')
+        self.client.force_login(admin)
+        response = self.client.get(f'/admin/users/queuedemail/{queued.pk}/change/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, link)
+
+    def test_background_worker_purges_old_sent_emails(self):
+        old, recent = (enqueue_email('Subject', 'body', '', 'user@example.com') for _ in range(2))
+        drain_queue()
+        QueuedEmail.objects.filter(pk=old.pk).update(sent_at=timezone.now() - timedelta(days=settings.EMAIL_QUEUE_KEEP_SENT_DAYS + 1))
+        with mock.patch('users.email_queue._wakeup') as wakeup, mock.patch('users.email_queue.db_connection'):
+            # One pass of the loop, then stop the thread's body.
+            wakeup.wait.side_effect = [True, KeyboardInterrupt]
+            with self.assertRaises(KeyboardInterrupt):
+                _run_worker()
+        self.assertEqual(list(QueuedEmail.objects.values_list('pk', flat=True)), [recent.pk])
+
+
+def jpeg_upload(name, size=(1200, 900), color=(200, 40, 40)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROFILE_PICTURE_EAGER=True, PROFILE_PICTURE_SIZES=[48, 128, 512], PROFILE_PICTURE_FORMAT='WEBP')
+class ProfilePictureRenditionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pic', password='x', email='pic@example.com', student_id='111-111-113')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile_picture = jpeg_upload(name)
+            self.user.save()
+        self.user.refresh_from_db()
+        return self.user.profile_picture_renditions
+
+    def test_upload_generates_square_renditions(self):
+        renditions = self.upload('phone.jpg')
+        self.assertEqual(renditions['source'], self.user.profile_picture.name)
+        for size, name in renditions['sizes'].items():
+            with Image.open(os.path.join(MEDIA_ROOT, name)) as image:
+                self.assertEqual((image.format, image.size), ('WEBP', (int(size), int(size))))
+
+    def test_size_hint_picks_the_smallest_covering_rendition(self):
+        self.upload('phone.jpg')
+        urls = {size: self.client.get('/api/users/profile/', {'size': size} if size else {}).json()['profile_picture_url'] for size in (40, 100, 2000, None)}
+        self.assertTrue(urls[40].endswith('/renditions/phone-48.webp'))
+        self.assertTrue(urls[100].endswith('/renditions/phone-128.webp'))
+        self.assertTrue(urls[2000].endswith('/renditions/phone-512.webp'))
+        self.assertTrue(urls[None].endswith('/renditions/phone-512.webp'))
+
+    def test_replacing_the_picture_removes_old_renditions(self):
+        old = self.upload('first.jpg')['sizes'].values()
+        new = self.upload('second.jpg')['sizes'].values()
+        self.assertFalse(any(os.path.exists(os.path.join(MEDIA_ROOT, name)) for name in old))
+        self.assertTrue(all(os.path.exists(os.path.join(MEDIA_ROOT, name)) for name in new))
@@ -1,25 +1,16 @@
 # users/utils.py
 
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from django.conf import settings
+from .email_queue import enqueue_email
 import logging
 
 logger = logging.getLogger(__name__)
 
-def send_email_sync(subject, plain_message, html_message, recipient_email):
+def send_email(subject, plain_message, html_message, recipient_email):
+    """Queues an email for the background sender (users.email_queue); returns False if it couldn't be queued."""
     try:
-        email_obj = EmailMultiAlternatives(
-            subject=subject,
-            body=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[recipient_email]
-        )
-        email_obj.attach_alternative(html_message, "text/html")
-        email_obj.send(fail_silently=False)
-        logger.info(f"Successfully sent email synchronously to {recipient_email} with subject: {subject}")
+        enqueue_email(subject, plain_message, html_message, [recipient_email])
+        logger.info(f"Queued email to {recipient_email} with subject: {subject}")
         return True
     except Exception as e:
-        logger.error(f"Failed to send email synchronously to {recipient_email} with subject: {subject}: {e}", exc_info=True)
+        logger.error(f"Failed to queue email to {recipient_email} with subject: {subject}: {e}", exc_info=True)
         return False
-
@@ -14,21 +14,22 @@ from django.utils.encoding import force_bytes, force_str
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.contrib.auth.forms import SetPasswordForm
-from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.db import IntegrityError
-from notes.serializers import NoteSerializer
-from notes.models import Note, Course, Department
+from notes.serializers import NoteSerializer, NoteSummarySerializer, parse_expand_param
+from notes.models import Note, Course, Department, Like, Bookmark
+from notes.pagination import UserActivityPagination
 from rest_framework import viewsets, permissions
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
-from django.db.models import Case, When, Value, BooleanField
+from django.db.models import Case, When, Value, BooleanField, Exists, OuterRef, F
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import NoteFilter 
 from .serializers import UserSerializer
-from django.db.models import Count, Sum
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer
+from .dashboard import get_dashboard
+from .email_queue import enqueue_email
 from urllib.parse import unquote
 User = get_user_model()
 
@@ -80,14 +81,8 @@ class UserRegistrationView(generics.CreateAPIView):
                     'verification_url': full_verification_url
                 })
                 
-                email_obj = EmailMultiAlternatives( 
-                    subject=email_subject,
-                    body=plain_message, 
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    to=[user.email]
-                )
-                email_obj.attach_alternative(html_message, "text/html") 
-                email_obj.send(fail_silently=False) 
+                # Sent by the email queue worker, not in this request.
+                enqueue_email(email_subject, plain_message, html_message, [user.email])
 
                 email_sent_message = "User registered successfully. A verification email has been sent."
             
@@ -230,15 +225,8 @@ class PasswordResetRequestView(generics.GenericAPIView):
         })
         
         try:
-            email_message_obj = EmailMultiAlternatives(
-                subject=email_subject,
-                body=plain_message, 
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[user.email]
-            )
-            email_message_obj.attach_alternative(html_message, "text/html") 
-            email_message_obj.send(fail_silently=False)
-            
+            enqueue_email(email_subject, plain_message, html_message, [user.email])
+
             return Response({"detail": "Password reset email has been sent. Please check your inbox."}, status=status.HTTP_200_OK)
         
         except Exception as e:
@@ -313,28 +301,34 @@ class PasswordResetConfirmView(generics.GenericAPIView):
 
 
 class UserLinkedNotesViewSet(viewsets.ReadOnlyModelViewSet): 
-    serializer_class = NoteSerializer 
+    serializer_class = NoteSummarySerializer 
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UserActivityPagination
 
     def get_queryset(self):
         return Note.objects.filter(is_approved=True).select_related(
-            'uploader', 'department', 'course', 'category'
+            'uploader', 'uploader__department', 'department', 'course', 'category', 'faculty'
         ).prefetch_related('tags')
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = parse_expand_param(self.request)
+        return context
+
+    def get_keyset_ordering(self):
+        if self.action == 'bookmarked_notes':
+            return ('-bookmarked_at', '-id')
+        if self.action == 'liked_notes':
+            return ('-liked_at', '-id')
+        return ('-created_at', '-id')
+
     def get_annotated_queryset(self, base_queryset):
         user = self.request.user
-        return base_queryset.annotate(
-            is_liked_by_current_user_annotated=Case(
-                When(likes__user=user, then=Value(True)),
-                default=Value(False),
-                output_field=BooleanField()
-            ),
-            is_bookmarked_by_current_user_annotated=Case(
-                When(bookmarks__user=user, then=Value(True)),
-                default=Value(False),
-                output_field=BooleanField()
-            )
+        queryset = base_queryset.annotate(
+            is_liked_by_current_user_annotated=Exists(Like.objects.filter(note=OuterRef('pk'), user=user)),
+            is_bookmarked_by_current_user_annotated=Exists(Bookmark.objects.filter(note=OuterRef('pk'), user=user)),
         )
+        return NoteSummarySerializer.setup_eager_loading(queryset, parse_expand_param(self.request))
 
     @action(detail=False, methods=['get'], url_path='bookmarked-notes')
     def bookmarked_notes(self, request):
@@ -342,7 +336,7 @@ class UserLinkedNotesViewSet(viewsets.ReadOnlyModelViewSet):
         base_queryset = self.get_queryset().filter(bookmarks__user=user)
         filtered_queryset = NoteFilter(request.query_params, queryset=base_queryset, request=request).qs
         annotated_queryset = self.get_annotated_queryset(filtered_queryset)
-        final_queryset = annotated_queryset.order_by('-bookmarks__created_at')
+        final_queryset = annotated_queryset.annotate(bookmarked_at=F('bookmarks__created_at')).order_by('-bookmarked_at', '-id')
 
         page = self.paginate_queryset(final_queryset)
         if page is not None:
@@ -358,7 +352,7 @@ class UserLinkedNotesViewSet(viewsets.ReadOnlyModelViewSet):
         user = request.user
         base_queryset = self.get_queryset().filter(likes__user=user)
         annotated_queryset = self.get_annotated_queryset(base_queryset)
-        final_queryset = annotated_queryset.order_by('-likes__created_at')
+        final_queryset = annotated_queryset.annotate(liked_at=F('likes__created_at')).order_by('-liked_at', '-id')
         
         page = self.paginate_queryset(final_queryset)
         if page is not None:
@@ -425,53 +419,13 @@ class BookmarkedNotesView(generics.ListAPIView):
 
 class DashboardDataView(APIView):
     """
-    Provides consolidated data for the user dashboard in a single API call.
-    This view is optimized to reduce the number of database queries.
+    Provides consolidated data for the user dashboard in a single API call,
+    built with a fixed number of queries and cached per user (users.dashboard).
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-
-        user_serializer = UserSerializer(user, context={'request': request})
-        user_data_with_stats = user_serializer.data
-
-        stats_data = {
-            'uploads': user_data_with_stats.get('total_notes_uploaded', 0),
-            'downloads': user_data_with_stats.get('total_notes_downloaded', 0),
-            'totalReviews': user_data_with_stats.get('total_reviews_received', 0),
-            'avgRating': user_data_with_stats.get('average_rating_of_all_notes', 0.0),
-        }
-
-        recent_notes_qs = Note.objects.filter(
-            uploader=user
-        ).order_by('-created_at')[:5]
-        recent_notes_data = NoteSerializer(recent_notes_qs, many=True, context={'request': request}).data
-
-        bookmarked_notes_qs = Note.objects.filter(
-            bookmarks__user=user,
-            is_approved=True
-        ).order_by('-bookmarks__created_at')[:5]
-        recent_bookmarks_data = NoteSerializer(bookmarked_notes_qs, many=True, context={'request': request}).data
-        category_distribution = Note.objects.filter(uploader=user) \
-                                        .values('category__name') \
-                                        .annotate(value=Count('id')) \
-                                        .order_by('-value')
-        
-        pie_chart_colors = ["#6366F1", "#EC4899", "#F59E0B", "#10B981", "#8B5CF6", "#F43F5E"]
-        
-        pie_chart_data = [
-            {**item, 'name': item['category__name'], 'color': pie_chart_colors[i % len(pie_chart_colors)]}
-            for i, item in enumerate(category_distribution) if item.get('category__name')
-        ]
-
-        # চূড়ান্ত রেসপন্স ডেটা
-        dashboard_data = {
-            'user': user_data_with_stats,
-            'stats': stats_data,
-            'myNotes': recent_notes_data,
-            'bookmarks': recent_bookmarks_data,
-            'performanceData': pie_chart_data,
-        }
-
-        return Response(dashboard_data, status=status.HTTP_200_OK)
\ No newline at end of file
+        dashboard_data, cache_hit = get_dashboard(request)
+        response = Response(dashboard_data, status=status.HTTP_200_OK)
+        response['X-Cache'] = 'HIT' if cache_hit else 'MISS'
+        return response